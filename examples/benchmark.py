@@ -0,0 +1,317 @@
+"""Benchmark of ficus
+
+Measures time and peak memory of every phase of run_ficus (read, prepare,
+build, write, solve) for the example input files, for synthetically scaled
+versions of them (see ficus.scale_inputdata) and for generated models (see
+ficus.generate_inputdata). The results are compared to a stored baseline,
+phases slower than the baseline by more than a threshold are reported as
+regressions. Times depend on the machine, so no baseline is shipped: the
+first run (without a baseline file) only records it. With --scaling, the
+growth of build time and memory with the model size is measured for
+generated models.
+
+Usage:
+	python benchmark.py                     # run all cases, compare to baseline
+	                                        # (first run: record baseline)
+	python benchmark.py --save              # run all cases, save as new baseline
+	python benchmark.py --cases example --opt glpk --matrix
+	python benchmark.py --scaling timesteps
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# benchmark ficus.py of this repository, not an installed one
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+import ficus
+
+try:
+	import resource
+except ImportError:
+	resource = None # not available on windows, no memory measurement
+
+# Benchmark cases: (name, input file, timestep factor, process copies)
+# instead of an input file, arguments of ficus.generate_inputdata can be given
+CASES = [
+	('example', 'example.xlsx', 1, 1),
+	('example-t4', 'example.xlsx', 4, 1),
+	('example-c4', 'example.xlsx', 1, 4),
+	('example-t4-c4', 'example.xlsx', 4, 4),
+	('newfactory', os.path.join('..', 'doc', 'NewFactory', 'NewFactory.xlsx'), 1, 1),
+	('steel_mill', 'steel_mill_example.xlsx', 1, 1),
+	('automotive', 'cover_heat+elec_automotive.xlsx', 1, 1),
+	('carbon', 'cover_heat+elec_carbon.xlsx', 1, 1),
+	('iron', 'cover_heat+elec_iron.xlsx', 1, 1),
+	('steel', 'cover_heat+elec_steel.xlsx', 1, 1),
+	('synthetic', dict(commodities=3, processes=8, storages=3, classes=2), 1, 1),
+	('synthetic-large', dict(commodities=6, processes=30, num=2, storages=6,
+							 classes=4, timesteps=2688), 1, 1)]
+
+# Arguments of ficus.generate_inputdata for scaling benchmark (see run_scaling)
+SCALING_BASE = dict(commodities=3, processes=8, storages=3, classes=2, timesteps=672)
+SCALING_STEPS = {
+	'timesteps': [672, 1344, 2688, 5376],
+	'processes': [8, 16, 32, 64],
+	'num': [1, 2, 4, 8],
+	'commodities': [3, 6, 12, 24]}
+
+PHASES = ['read', 'prepare', 'build', 'write', 'solve']
+
+def benchmark_case(input_file, timesteps=1, copies=1, opt='cbc', matrix=False, timelimit=None):
+	"""Run all phases of run_ficus for one input file and measure them
+
+	The model is written to a temporary model file (LP, or MPS for matrix
+	models), which is solved by the solver without loading the results.
+	Run every case in a new process (see run_benchmark), as the peak memory
+	is measured for the whole process.
+
+	Args:
+		input_file: input file (see read_inputdata) or dictionary with
+			arguments of generate_inputdata (generated in phase "read")
+		timesteps: factor for the number of timesteps (see scale_inputdata)
+		copies: factor for the number of processes and storages
+		opt: solver reading LP and MPS files (e.g. glpk or cbc), None to skip solving
+		matrix: set to TRUE, to create the model with create_matrix_model
+		timelimit: maximal solver time [s]
+
+	Returns:
+		list of (phase, time [s], peak memory [MB], objective)
+		peak memory of phase "solve" is the peak memory of the solver
+	"""
+	phases = []
+
+	t = time.time()
+	if isinstance(input_file, dict):
+		xls_data = ficus.generate_inputdata(**input_file)
+	else:
+		xls_data = ficus.read_inputdata(input_file)
+	phases.append(('read', time.time() - t, _peak_memory(), None))
+
+	t = time.time()
+	if timesteps > 1 or copies > 1:
+		xls_data = ficus.scale_inputdata(xls_data, timesteps, copies)
+	data = ficus.prepare_modeldata(xls_data)
+	phases.append(('prepare', time.time() - t, _peak_memory(), None))
+
+	t = time.time()
+	if matrix:
+		prob = ficus.create_matrix_model(data)
+	else:
+		prob = ficus.create_model(data)
+	phases.append(('build', time.time() - t, _peak_memory(), None))
+
+	handle, model_file = tempfile.mkstemp(suffix='.mps' if matrix else '.lp')
+	os.close(handle)
+	try:
+		t = time.time()
+		if matrix:
+			prob.write_mps(model_file)
+		else:
+			prob.write(model_file, io_options={'symbolic_solver_labels': False})
+		phases.append(('write', time.time() - t, _peak_memory(), None))
+
+		if opt is not None:
+			optimizer = ficus.get_optimizer(opt)
+			ficus.set_limits(optimizer, time_limit=timelimit) # see ficus.SOLVER_LIMITS
+			t = time.time()
+			result = optimizer.solve(model_file)
+			objective = result.problem.upper_bound
+			phases.append(('solve', time.time() - t,
+						   _peak_memory(resource and resource.RUSAGE_CHILDREN), objective))
+	finally:
+		os.remove(model_file)
+	return phases
+
+def run_benchmark(cases=CASES, opt='cbc', matrix=False, timelimit=None, repeat=1):
+	"""Run benchmark cases, every case in a new process
+
+	Args:
+		cases: list of (name, input file, timestep factor, process copies),
+			relative input files are relative to the examples directory
+		opt: solver (see benchmark_case), None to skip solving
+		matrix: set to TRUE, to create the models with create_matrix_model
+		timelimit: maximal solver time [s]
+		repeat: number of runs of every case, the fastest run is used
+
+	Returns:
+		DataFrame with index (case, phase) and columns time [s], memory [MB]
+		(peak memory) and objective, phase "total" is the sum of all phases
+	"""
+	rows = []
+	for name, input_file, timesteps, copies in cases:
+		print('Benchmark {} ...\n'.format(name))
+		if not isinstance(input_file, dict):
+			input_file = os.path.join(BENCHMARK_DIR, input_file)
+		runs = []
+		for r in range(repeat):
+			# new process for every run, so peak memory is measured per case
+			pool = multiprocessing.Pool(1)
+			try:
+				runs.append(pool.apply(benchmark_case,
+					(input_file, timesteps, copies, opt, matrix, timelimit)))
+			finally:
+				pool.close()
+				pool.join()
+		fastest = min(runs, key=lambda phases: sum(p[1] for p in phases))
+		for phase, seconds, memory, objective in fastest:
+			rows.append((name, phase, seconds, memory, objective))
+		rows.append((name, 'total', sum(p[1] for p in fastest),
+					 max(p[2] for p in fastest), None))
+		print('{} done. time: '.format(name)+"{:.1f}".format(rows[-1][2])+' s\n')
+
+	results = pd.DataFrame(rows, columns=['case', 'phase', 'time', 'memory', 'objective'])
+	return results.set_index(['case', 'phase'])
+
+def run_scaling(parameter, values=None, base=SCALING_BASE, matrix=False):
+	"""Measure growth of build time and memory with the model size
+
+	Generates models (see ficus.generate_inputdata) with increasing values of
+	one parameter and measures all phases without solving. The growth is
+	given as exponent of a power law fitted to time and memory over the
+	parameter: 1 means linear growth, 2 quadratic growth.
+
+	Args:
+		parameter: argument of generate_inputdata, e.g. "timesteps"
+		values: values of parameter, defaults to SCALING_STEPS[parameter]
+		base: arguments of generate_inputdata for all other parameters
+		matrix: set to TRUE, to create the models with create_matrix_model
+
+	Returns:
+		(results, exponents): DataFrame with index (value, phase) and
+		columns time and memory (see run_benchmark), DataFrame with exponents
+		of time and memory for every phase. The memory of a phase is the
+		increase of the peak memory during the phase.
+	"""
+	if values is None:
+		values = SCALING_STEPS[parameter]
+	cases = []
+	for value in values:
+		args = dict(base)
+		args[parameter] = value
+		cases.append((value, args, 1, 1))
+	start_memory = _peak_memory() # memory of worker processes before the first phase
+	results = run_benchmark(cases, opt=None, matrix=matrix)
+	results.index.names = [parameter, 'phase']
+
+	phases = PHASES[:-1] + ['total']
+	times = results['time'].unstack('phase')[phases]
+	memories = results['memory'].unstack('phase')[phases]
+	x = np.log(times.index.values.astype(float))
+	increase = memories.diff(axis=1)
+	increase['read'] = memories['read'] - start_memory
+	increase['total'] = memories['total'] - start_memory
+
+	exponents = pd.DataFrame(index=phases, columns=['time', 'memory'], dtype=float)
+	for phase in phases:
+		# slope of power law in log-log scale, increases below 1 MB are noise
+		exponents.loc[phase, 'time'] = np.polyfit(x, np.log(times[phase].values), 1)[0]
+		exponents.loc[phase, 'memory'] = np.polyfit(
+			x, np.log(np.clip(increase[phase].values, 1, None)), 1)[0]
+	return results, exponents
+
+def compare_baseline(results, baseline, threshold=0.2, min_time=0.5):
+	"""Compare benchmark results with a baseline
+
+	A phase is a regression, if its time or memory exceeds the baseline by
+	more than "threshold" (relative). Time differences below "min_time" are
+	ignored, as short phases are dominated by noise.
+
+	Args:
+		results: benchmark results (see run_benchmark)
+		baseline: benchmark results of baseline or path of saved baseline (csv)
+		threshold: allowed relative increase, e.g. 0.2 for 20 %
+		min_time: smallest time difference [s] regarded as regression
+
+	Returns:
+		DataFrame with results, baseline results (columns "... baseline"),
+		ratios of time and memory to the baseline and "regression" flag
+	"""
+	if not isinstance(baseline, pd.DataFrame):
+		baseline = pd.read_csv(baseline, index_col=['case', 'phase'])
+
+	comparison = results.join(baseline, rsuffix=' baseline')
+	comparison['time ratio'] = comparison['time'] / comparison['time baseline']
+	comparison['memory ratio'] = comparison['memory'] / comparison['memory baseline']
+	slower = ((comparison['time ratio'] > 1 + threshold) &
+			  (comparison['time'] - comparison['time baseline'] > min_time))
+	larger = comparison['memory ratio'] > 1 + threshold
+	comparison['regression'] = slower | larger
+	return comparison
+
+def _peak_memory(who=None):
+# Peak resident memory [MB] of this process or (who=RUSAGE_CHILDREN) of its
+# finished child processes, NaN if not available
+	if resource is None:
+		return float('nan')
+	if who is None:
+		who = resource.RUSAGE_SELF
+	maxrss = resource.getrusage(who).ru_maxrss
+	if sys.platform == 'darwin':
+		return maxrss / 1024.0 ** 2 # bytes
+	return maxrss / 1024.0 # kilobytes
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of ficus')
+	parser.add_argument('--cases', nargs='*',
+						help='names of cases to run (default: all), e.g. example steel_mill')
+	parser.add_argument('--opt', default='cbc', help='solver (default: cbc)')
+	parser.add_argument('--no-solve', action='store_true', help='skip solving')
+	parser.add_argument('--matrix', action='store_true',
+						help='create matrix models (see ficus.create_matrix_model)')
+	parser.add_argument('--timelimit', type=float, default=600,
+						help='maximal solver time [s] (default: 600)')
+	parser.add_argument('--repeat', type=int, default=1,
+						help='runs of every case, the fastest is used (default: 1)')
+	parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'benchmark_baseline.csv'),
+						help='baseline file, recorded by the first run (default: benchmark_baseline.csv)')
+	parser.add_argument('--save', action='store_true', help='save results as new baseline')
+	parser.add_argument('--threshold', type=float, default=0.2,
+						help='allowed relative increase of time and memory (default: 0.2)')
+	parser.add_argument('--scaling', choices=sorted(SCALING_STEPS),
+						help='measure growth of time and memory with this parameter of generated models')
+	args = parser.parse_args()
+
+	pd.set_option('display.width', 200)
+	if args.scaling:
+		results, exponents = run_scaling(args.scaling, matrix=args.matrix)
+		table = results[['time', 'memory']].unstack('phase')
+		print(table.reindex(columns=PHASES[:-1] + ['total'], level='phase'))
+		print('\nExponents (1: linear, 2: quadratic growth with {}):'.format(args.scaling))
+		print(exponents)
+		return
+
+	cases = CASES
+	if args.cases:
+		unknown = set(args.cases) - set(case[0] for case in CASES)
+		if unknown:
+			raise ValueError('Unknown benchmark cases: {}'.format(', '.join(sorted(unknown))))
+		cases = [case for case in CASES if case[0] in args.cases]
+
+	results = run_benchmark(cases, opt=None if args.no_solve else args.opt,
+							matrix=args.matrix, timelimit=args.timelimit, repeat=args.repeat)
+
+	if args.save or not os.path.exists(args.baseline):
+		results.to_csv(args.baseline)
+		print(results)
+		print('\nBaseline saved to {}, later runs are compared to it'.format(args.baseline))
+	else:
+		comparison = compare_baseline(results, args.baseline, args.threshold)
+		print(comparison[['time', 'time baseline', 'time ratio',
+						  'memory', 'memory baseline', 'memory ratio', 'regression']])
+		regressions = comparison[comparison['regression']]
+		if not regressions.empty:
+			print('\n{} regression(s) above {:.0f} %:'.format(len(regressions), args.threshold*100))
+			print(regressions[['time ratio', 'memory ratio']])
+			sys.exit(1)
+		print('\nNo regressions.')
+
+if __name__ == '__main__':
+	main()
@@ -14,6 +14,8 @@ import pyomo.core as pyen
 import pyomo.environ
 from pyomo.opt import SolverFactory
 from pyomo.opt import SolverManagerFactory
+from pyomo.opt import TerminationCondition
+from collections import namedtuple
 import pandas as pd
 import numpy as np
 import time
@@ -25,36 +27,48 @@ import os
 #RUN FUNCTIONS
 ############################################################################################
 
-def run_ficus (input_file, opt = 'glpk', Threads = 2,neos=False):
+def run_ficus (input_file, opt = 'glpk', Threads = 2,neos=False, cache=False, cache_dir=None,
+			   periods=None, period_length=None, warmstart=None, mutable=False, matrix=False,
+			   profile=False):
 	"""Read input data, create a model and solve it
 
 	Args:
+		input_file: excel input file, csv directory or HDF5 file (see read_inputdata)
 		opt: Solver to be used
 		Threads: number of simultaneous CPU threads (only for gurobi and cplex)
 		neos: set to TRUE, if solver from neos server should be used
+		cache: set to TRUE, to cache the parsed excel input file (see read_xlsdata)
+		cache_dir: directory of cache file, defaults to directory of input_file
+		periods: number of representative periods, if timeseries should be 
+			aggregated (see aggregate_timeseries), defaults to no aggregation
+		period_length: number of timesteps per period, defaults to one day
+		warmstart: previous solution (solved model instance or result file) 
+			as initial solution for the solver (see set_initial_values)
+		mutable: set to TRUE, to create the model with mutable parameters for
+			fast changes with update_model (see create_model)
+		matrix: set to TRUE, to create the model as sparse matrix without 
+			Pyomo (see create_matrix_model), solved from a MPS file (not
+			with neos, warmstart, mutable or profile)
+		profile: set to TRUE, to record build time and size of every model
+			component in prob.build_profile (see get_build_profile), Pyomo 
+			models only
 
 	Returns:
 		prob: model instance containing results
 	"""
+	if matrix and (neos or warmstart is not None or mutable or profile):
+		raise ValueError("matrix models can't be solved on neos, warm started, changed or profiled")
+	
 	# Optimizer
 	# ============
-	optimizer = SolverFactory(opt) #set optimizer	
-	if optimizer.name == 'gurobi' and not neos:
-		# reference with list of option names
-        # http://www.gurobi.com/documentation/5.6/reference-manual/parameters
-		optimizer.set_options("Threads="+str(Threads))  # number of simultaneous CPU threads
-
-	elif optimizer.name == 'cplex' and not neos:
-		optimizer.options["threads"] = Threads # number of simultaneous CPU threads
-	else:
-		print('\n Setting number of simultaneous CPU threads only available for locally installed "gurobi" and "cplex"\n')
+	optimizer = get_optimizer(opt, Threads, neos) #set optimizer	
 	
 	# RUN MODEL
 	# ============
 	#read model data	
 	print('Read Data ...\n')
 	t0 = time.time()
-	xls_data = read_xlsdata(input_file) 
+	xls_data = read_inputdata(input_file, cache=cache, cache_dir=cache_dir) 
 	print('Data Read. time: '+"{:.1f}".format(time.time()-t0)+' s\n')
 	
 	#prepare data for model from xls_data
@@ -63,29 +77,757 @@ def run_ficus (input_file, opt = 'glpk', Threads = 2,neos=False):
 	data = prepare_modeldata(xls_data)
 	print('Data Prepared. time: '+"{:.1f}".format(time.time()-t)+' s\n')
 	
+	#reduce timeseries to representative periods
+	if periods is not None:
+		print('Aggregate Timeseries ...\n')
+		t = time.time()
+		data = aggregate_timeseries(data, periods, period_length)
+		print('Timeseries Aggregated. time: '+"{:.1f}".format(time.time()-t)+' s\n')
+	
 	#define optimisation problem
 	print('Define Model ...\n')
 	t = time.time()
-	prob = create_model(data) 
+	if matrix:
+		prob = create_matrix_model(data)
+	else:
+		prob = create_model(data, mutable=mutable, profile=profile) 
 	print('Model Defined. time: '+"{:.1f}".format(time.time()-t)+' s\n')
+	if profile:
+		print('Slowest Components:\n')
+		print(prob.build_profile.sort_values('time', ascending=False).head(10))
+		print('')
+	
+	#initial solution from previous solution
+	solve_options = {}
+	if warmstart is not None:
+		print('Set Initial Values ...\n')
+		t = time.time()
+		set_initial_values(prob, warmstart)
+		if optimizer.warm_start_capable() and not neos:
+			solve_options['warmstart'] = True
+		else:
+			print('\n Warm start not available for solver "{}"\n'.format(optimizer.name))
+		print('Initial Values Set. time: '+"{:.1f}".format(time.time()-t)+' s\n')
 	
 	# solve the problem
 	print('Solve Model ...\n')
 	t = time.time()
-	if neos:
+	if matrix:
+		result = solve_matrix_model(prob, optimizer)
+	elif neos:
 		solver_manager = SolverManagerFactory('neos')
 		result = solver_manager.solve(prob,opt=optimizer,tee=True) 
 	else:
-		result = optimizer.solve(prob,tee=True) 
+		if is_persistent(optimizer):
+			optimizer.set_instance(prob) # model stays in solver for resolve
+		result = optimizer.solve(prob,tee=True,**solve_options) 
+	prob.optimizer = optimizer
 	print('Model Solved. time: '+"{:.1f}".format(time.time()-t)+' s\n')
 	
 	print('Load Results ...\n')
 	t = time.time()
-	prob.solutions.load_from(result) # load result back to model instance
+	if matrix:
+		prob.load_solution(result)
+	else:
+		prob.solutions.load_from(result) # load result back to model instance
 	print('Results Loaded. time: '+"{:.1f}".format(time.time()-t)+' s\n')
 	print('Total Time: '+"{:.1f}".format(time.time()-t0)+' s\n')
 		
 	return prob
+
+def run_rolling_horizon(input_file, window, lookahead=0, prob=None, opt='glpk', 
+						Threads=2, neos=False, cache=False, cache_dir=None):
+	"""Read input data and solve the operation in consecutive windows of timesteps
+
+	Capacities are fixed (to the results of prob or to the installed 
+	capacities), so only the operation of processes, storages and external 
+	commodities is optimised. Every window of "window" timesteps is solved 
+	together with the following "lookahead" timesteps, whose results are 
+	discarded. Process power, run mode and storage content at the end of a 
+	window are the initial values of the next window, the maximum demand rate 
+	power until the end of the window is carried over as "p-max-initial". 
+	The storage content at the end of the lookahead equals the content at 
+	the start of the window, in the last window the initial content of the
+	input data.
+	
+	Args:
+		input_file: excel input file, csv directory or HDF5 file (see read_inputdata)
+		window: number of timesteps per window 
+		lookahead: number of additional timesteps solved with every window
+		prob: solved model instance (e.g. from run_ficus) with capacities to be
+			used, defaults to installed capacities without new capacities
+		opt: Solver to be used
+		Threads: number of simultaneous CPU threads (only for gurobi and cplex)
+		neos: set to TRUE, if solver from neos server should be used
+		cache: set to TRUE, to cache the parsed excel input file (see read_xlsdata)
+		cache_dir: directory of cache file, defaults to directory of input_file
+
+	Returns:
+		result: RollingHorizonResult with the results of all windows, which can
+			be used instead of a model instance in report and plot functions
+	"""
+	window = int(window)
+	lookahead = int(lookahead)
+	if window < 1 or lookahead < 0:
+		raise ValueError('window must be positive and lookahead must not be negative')
+	
+	optimizer = get_optimizer(opt, Threads, neos)
+	
+	print('Read Data ...\n')
+	t0 = time.time()
+	xls_data = read_inputdata(input_file, cache=cache, cache_dir=cache_dir) 
+	data = prepare_modeldata(xls_data)
+	print('Data Read. time: '+"{:.1f}".format(time.time()-t0)+' s\n')
+	
+	#new capacities of processes and storages
+	if prob is None:
+		caps = None
+	else:
+		caps = dict((name, get_entity(prob, name)) for name in 
+					['pro_cap_new', 'sto_cap_p_new', 'sto_cap_e_new'])
+	
+	#data changed from window to window
+	for key in ['ext-co', 'process', 'storage']:
+		data[key] = data[key].copy()
+	final_soc = data['storage']['initial-soc'].copy()
+	
+	start = int(data['time-settings'].loc['Time']['start'])
+	end = int(data['time-settings'].loc['Time']['end'])
+	windows = []
+	for w_start in range(start, end + 1, window):
+		w_end = min(w_start + window - 1, end)
+		print('Solve Window {}-{} ...\n'.format(w_start, w_end))
+		t = time.time()
+		
+		#model for window and lookahead, with copies of all data changed by create_model
+		w_data = dict(data)
+		for key in ['time-settings', 'mip-equations', 'process', 'process_commodity', 'storage']:
+			w_data[key] = data[key].copy()
+		w_data['time-settings'].loc['Time', 'start'] = w_start
+		w_data['time-settings'].loc['Time', 'end'] = min(w_end + lookahead, end)
+		#storage content at the end of the lookahead: content at the window
+		#start, at the end of the optimisation period: initial content
+		if w_end + lookahead >= end:
+			w_data['storage']['final-soc'] = final_soc
+		else:
+			w_data['storage']['final-soc'] = w_data['storage']['initial-soc']
+		w_prob = create_model(w_data)
+		fix_capacities(w_prob, caps)
+		
+		if neos:
+			solver_manager = SolverManagerFactory('neos')
+			result = solver_manager.solve(w_prob,opt=optimizer) 
+		else:
+			result = optimizer.solve(w_prob) 
+		if result.solver.termination_condition not in [TerminationCondition.optimal, 
+														TerminationCondition.feasible]:
+			raise ValueError('No solution for window {}-{} ({})'.format(
+				w_start, w_end, result.solver.termination_condition))
+		w_prob.solutions.load_from(result)
+		
+		#initial values of next window: values at the end of this window
+		flow = get_entity(w_prob, 'pro_p_flow')
+		if not flow.empty:
+			data['process']['initial-power'] = flow.xs(w_end, level='t0').reindex(
+				data['process'].index).fillna(0).values
+		if isinstance(w_prob.pro_mode_run, pyen.Var):
+			run = get_entity(w_prob, 'pro_mode_run')
+			data['process']['initial-run'] = run.xs(w_end, level='t0').reindex(
+				data['process'].index).fillna(0).round().values
+		cont = get_entity(w_prob, 'sto_e_cont')
+		if not cont.empty:
+			cap = get_entity(w_prob, 'sto_cap_e').reindex(data['storage'].index).values
+			cont = cont.xs(w_end, level='t0').reindex(data['storage'].index).values
+			data['storage']['initial-soc'] = np.where(cap > 0, cont / np.where(cap > 0, cap, 1), 0)
+		#maximum demand rate power of the window without lookahead
+		p_in = get_entity(w_prob, 'ext_demandrate_in')
+		if not p_in.empty:
+			p_in = p_in[p_in.index.get_level_values('t0') <= w_end]
+			p_max = p_in.groupby(level='commodity').max().reindex(data['ext-co'].index)
+			data['ext-co']['p-max-initial'] = np.fmax(data['ext-co']['p-max-initial'].values, 
+													  p_max.values)
+		
+		windows.append(window_results(w_prob, w_start, w_end))
+		del w_prob
+		print('Window Solved. time: '+"{:.1f}".format(time.time()-t)+' s\n')
+	
+	result = RollingHorizonResult(windows, data)
+	print('Total Time: '+"{:.1f}".format(time.time()-t0)+' s\n')
+	return result
+
+def get_optimizer(opt, Threads=2, neos=False):
+	"""Return solver with number of threads set
+
+	Args:
+		opt: Solver to be used
+		Threads: number of simultaneous CPU threads (only for gurobi and cplex)
+		neos: set to TRUE, if solver from neos server should be used
+
+	Returns:
+		optimizer: pyomo solver
+	"""
+	optimizer = SolverFactory(opt) #set optimizer	
+	if optimizer.name == 'gurobi' and not neos:
+		# reference with list of option names
+        # http://www.gurobi.com/documentation/5.6/reference-manual/parameters
+		optimizer.set_options("Threads="+str(Threads))  # number of simultaneous CPU threads
+
+	elif optimizer.name == 'cplex' and not neos:
+		optimizer.options["threads"] = Threads # number of simultaneous CPU threads
+	elif optimizer.name == 'gurobi_persistent':
+		optimizer.options["Threads"] = Threads
+	elif optimizer.name == 'cplex_persistent':
+		optimizer.options["threads"] = Threads
+	else:
+		print('\n Setting number of simultaneous CPU threads only available for locally installed "gurobi" and "cplex"\n')
+	return optimizer
+
+# solver options of time limit (seconds) and relative MIP gap
+SOLVER_LIMITS = {
+	'glpk': ('tmlim', 'mipgap'),
+	'cbc': ('sec', 'ratio'),
+	'cplex': ('timelimit', 'mipgap'),
+	'gurobi': ('TimeLimit', 'MIPGap')}
+
+def set_limits(optimizer, time_limit=None, gap=None):
+	"""Set time limit and MIP gap of a solver
+
+	The limits are translated to the options of the locally installed solvers
+	glpk, cbc, cplex and gurobi (see SOLVER_LIMITS). A solver stopped by a 
+	limit returns the best solution found so far.
+
+	Args:
+		optimizer: pyomo solver (see get_optimizer)
+		time_limit: maximal solver time in seconds, defaults to no limit
+		gap: relative gap between best solution and best bound (e.g. 0.01),
+			at which the MIP search stops, defaults to the solver default
+	"""
+	if time_limit is None and gap is None:
+		return
+	if optimizer.name not in SOLVER_LIMITS:
+		raise ValueError('Limits only available for locally installed {}'.format(
+			', '.join(sorted(SOLVER_LIMITS))))
+	time_option, gap_option = SOLVER_LIMITS[optimizer.name]
+	if time_limit is not None:
+		if optimizer.name == 'glpk':
+			time_limit = int(np.ceil(time_limit)) # glpk only accepts whole seconds
+		optimizer.options[time_option] = time_limit
+	if gap is not None:
+		optimizer.options[gap_option] = gap
+
+def is_persistent(optimizer):
+	"""Return True, if optimizer is a persistent solver
+
+	Persistent solvers (e.g. "gurobi_persistent", "cplex_persistent") keep 
+	the model in memory, so only changed constraints have to be sent to the
+	solver again (see update_model).
+	"""
+	return hasattr(optimizer, 'set_instance')
+
+def resolve(prob, tee=True):
+	"""Solve model instance again, e.g. after update_model
+
+	The solver of the first solve (see run_ficus) is used. Persistent solvers
+	solve the model kept in memory, all other solvers write the model again.
+	
+	Args:
+		prob: a solved ficus model instance
+		tee: set to TRUE, to show solver output
+
+	Returns:
+		result: solver results
+	"""
+	print('Solve Model ...\n')
+	t = time.time()
+	result = prob.optimizer.solve(prob, tee=tee)
+	prob.solutions.load_from(result) # load result back to model instance
+	prob._plot_data_cache = None # plot data of the previous solution
+	print('Model Solved. time: '+"{:.1f}".format(time.time()-t)+' s\n')
+	return result
+
+# progress of a running solve (see solve_async), bound, incumbent and gap
+# are None until known
+SolveProgress = namedtuple('SolveProgress', ['elapsed', 'bound', 'incumbent', 'gap'])
+
+# patterns of solver output lines with best bound and/or incumbent
+SOLVER_PROGRESS = {
+	'glpk': [(r'^[+*]\s*\d+: mip =\s+(.+?)\s+[<>]=\s+(\S+)', ('incumbent', 'bound'))],
+	'cbc': [(r'Cbc0010I After \d+ nodes, \d+ on tree, (\S+) best solution, best possible (\S+)',
+			 ('incumbent', 'bound')),
+			(r'Cbc00\d\dI Integer solution of (\S+)', ('incumbent',)),
+			(r'Cbc0005I Partial search - best objective (\S+) \(best possible ([^\s)]+)\)',
+			 ('incumbent', 'bound')),
+			(r'Cbc0001I Search completed - best objective ([^\s,]+)', ('incumbent',)),
+			(r'Continuous objective value is (\S+)', ('bound',))],
+	'cplex': [(r'^[\s*]*\d+\+?\s+\d+\+?\s.*?(\S+\.\S*)\s+(\S+\.\S*)\s+(?:\d+\s+)?\S+%$',
+			   ('incumbent', 'bound'))],
+	'gurobi': [(r'(\S+)\s+(\S+)\s+(?:\S+%|-)\s+\S+\s+\d+s$', ('incumbent', 'bound'))]}
+
+def solve_async(prob, opt='glpk', Threads=2, time_limit=None, gap=None, 
+				callback=None, tee=False):
+	"""Solve a model instance in a background process
+
+	The model is solved in a child process, so several models can be solved
+	at the same time. The output of the solver is parsed into SolveProgress 
+	events (elapsed time in s, best bound, incumbent and relative gap 
+	between them) for the MIP search of glpk, cbc, cplex and gurobi. After 
+	the solve, the values of all variables are loaded into prob. 
+	
+	The returned future stays pending until the values are loaded, so 
+	cancelling it stops the solver. To wait for it in an asyncio event loop,
+	wrap it with asyncio.wrap_future (cancelling the wrapped future cancels
+	the solve, too).
+	
+	Usage:
+		def progress(event):
+			print(event)
+			if event.elapsed > 600 and event.gap is not None and event.gap > 0.05:
+				future.cancel()
+		future = solve_async(prob, opt='cbc', gap=0.01, callback=progress)
+		prob = future.result()
+
+	Args:
+		prob: model instance (see create_model or create_matrix_model)
+		opt: locally installed solver to be used
+		Threads: number of simultaneous CPU threads (only for gurobi and cplex)
+		time_limit: maximal solver time in seconds (see set_limits)
+		gap: relative MIP gap, at which the solver stops (see set_limits)
+		callback: function called with every new SolveProgress, called 
+			from a background thread
+		tee: set to TRUE, to show solver output
+
+	Returns:
+		future: concurrent.futures.Future with prob as result, once it is solved
+	"""
+	import multiprocessing
+	import threading
+	from concurrent.futures import Future
+	
+	optimizer = get_optimizer(opt, Threads)
+	_check_async_solver(optimizer)
+	set_limits(optimizer, time_limit, gap)
+	
+	receiver, sender = multiprocessing.Pipe(duplex=False)
+	process = multiprocessing.Process(target=_solve_worker, 
+		args=(sender, prob, opt, dict(optimizer.options), tee))
+	process.daemon = True
+	process.start()
+	sender.close() # receiver gets EOFError, when process ends
+	
+	future = Future()
+	solver = {'pid': None}
+	def stop():
+		# kill process and solver
+		process.terminate()
+		_kill_process(solver['pid'])
+	
+	def cancelled(future):
+		if future.cancelled():
+			stop()
+	
+	def watch():
+		# receive solver pid, progress and values from process
+		message = ('error', ValueError('Solve process ended unexpectedly'))
+		failed = None
+		while True:
+			try:
+				kind, value = receiver.recv()
+			except EOFError:
+				break
+			if kind == 'pid':
+				solver['pid'] = value
+				if future.cancelled():
+					_kill_process(value)
+			elif kind == 'progress':
+				if callback is not None and failed is None and not future.cancelled():
+					try:
+						callback(value)
+					except Exception as e:
+						failed = ('error', e) # future raises exception of callback
+						stop()
+			else:
+				message = (kind, value)
+		receiver.close()
+		process.join()
+		if not future.set_running_or_notify_cancel():
+			return
+		kind, value = failed or message
+		if kind == 'error':
+			future.set_exception(value)
+			return
+		try:
+			if isinstance(prob, MatrixModel):
+				prob.load_solution(value)
+			else:
+				for var, var_value in zip(prob.component_data_objects(pyen.Var), value):
+					var.value = var_value
+		except Exception as e:
+			future.set_exception(e)
+		else:
+			prob.optimizer = optimizer
+			prob._plot_data_cache = None # plot data of a previous solution
+			future.set_result(prob)
+	
+	future.add_done_callback(cancelled)
+	thread = threading.Thread(target=watch)
+	thread.daemon = True
+	thread.start()
+	return future
+
+def _solve_worker(sender, prob, opt, options, tee):
+# solve model in child process of solve_async, sends solver pid, progress
+# and finally the solver results (matrix models) or the values of all
+# variables (pyomo models) or the raised exception
+	import signal
+	signal.signal(signal.SIGTERM, signal.SIG_DFL) # pyomo's handler waits for solver
+	try:
+		optimizer = SolverFactory(opt)
+		_check_async_solver(optimizer)
+		optimizer.options.update(options)
+		optimizer._execute_command = lambda command: _execute_solver(
+			optimizer, command, sender, tee)
+		if isinstance(prob, MatrixModel):
+			result = solve_matrix_model(prob, optimizer, tee=tee)
+		else:
+			result = optimizer.solve(prob, tee=tee, load_solutions=False)
+		if not len(result.solution):
+			raise ValueError('No solution found: {}'.format(result.solver.termination_condition))
+		if isinstance(prob, MatrixModel):
+			sender.send(('values', result)) # results of MPS file contain no model objects
+		else:
+			prob.solutions.load_from(result)
+			sender.send(('values', [var.value for var in prob.component_data_objects(pyen.Var)]))
+	except Exception as e:
+		sender.send(('error', e))
+	finally:
+		sender.close()
+
+def _check_async_solver(optimizer):
+# raise ValueError, if the solver output can't be read by solve_async while
+# the solver runs. Pyomo has no public hook for this, so _solve_worker
+# replaces the method _execute_command(command) of solvers running an 
+# executable (SystemCallSolver), which runs the solver command line.
+	import inspect
+	from pyomo.opt.solver import SystemCallSolver
+	if not isinstance(optimizer, SystemCallSolver):
+		raise ValueError('Only solvers running as executable (e.g. {}) can be solved '
+			'asynchronously, not {}'.format(', '.join(sorted(SOLVER_PROGRESS)), optimizer.name))
+	execute = getattr(type(optimizer), '_execute_command', None)
+	try:
+		args = inspect.getfullargspec(execute).args
+	except AttributeError: # python 2
+		args = inspect.getargspec(execute).args
+	except TypeError: # not a function
+		args = None
+	if args != ['self', 'command']:
+		raise ValueError('solve_async is not supported by pyomo {}: '
+			'SystemCallSolver._execute_command(command) not found'.format(pyomo.version.version))
+
+def _execute_solver(optimizer, command, sender, tee):
+# run solver command (replaces _execute_command of pyomo solver) and send 
+# its pid and progress to solve_async
+	import subprocess
+	import shlex
+	import sys
+	cmd = command.cmd
+	if not isinstance(cmd, (list, tuple)):
+		cmd = shlex.split(cmd)
+	env = dict(os.environ)
+	env.update(command.get('env') or {})
+	env['PYTHONUNBUFFERED'] = '1' # gurobi runs a python script
+	script = command.get('script')
+	
+	try:
+		# solvers buffer their output to pipes, but not to terminals
+		import pty
+		output, terminal = pty.openpty()
+	except (ImportError, OSError):
+		output, terminal = None, subprocess.PIPE
+	
+	t = time.time()
+	solver = subprocess.Popen(cmd, env=env, stdin=subprocess.PIPE if script else None,
+							  stdout=terminal, stderr=subprocess.STDOUT)
+	sender.send(('pid', solver.pid))
+	if output is None:
+		output = solver.stdout.fileno()
+	else:
+		os.close(terminal)
+	if script:
+		solver.stdin.write(script.encode())
+		solver.stdin.close()
+	
+	log = []
+	progress = {'bound': None, 'incumbent': None}
+	for line in _output_lines(output):
+		if tee:
+			sys.stdout.write(line)
+		log.append(line)
+		values = _parse_progress(optimizer.name, line)
+		if values and any(progress[key] != values[key] for key in values):
+			progress.update(values)
+			sender.send(('progress', SolveProgress(time.time()-t, progress['bound'], 
+				progress['incumbent'], _relative_gap(progress['bound'], progress['incumbent']))))
+	if solver.stdout is not None:
+		solver.stdout.close()
+	else:
+		os.close(output)
+	rc = solver.wait()
+	optimizer._last_solve_time = time.time() - t
+	return [rc, ''.join(log)]
+
+def _output_lines(fd):
+# lines of solver output read from a file descriptor, a terminal raises 
+# OSError instead of returning no data at the end
+	rest = b''
+	while True:
+		try:
+			data = os.read(fd, 65536)
+		except OSError:
+			data = b''
+		if not data:
+			break
+		lines = (rest + data).split(b'\n')
+		rest = lines.pop()
+		for line in lines:
+			yield line.rstrip(b'\r').decode('utf-8', 'replace') + '\n'
+	if rest:
+		yield rest.decode('utf-8', 'replace')
+
+def _parse_progress(solver, line):
+# dict of best bound and/or incumbent in a line of solver output
+	import re
+	for pattern, keys in SOLVER_PROGRESS.get(solver, []):
+		match = re.search(pattern, line.rstrip())
+		if match:
+			return dict((key, _progress_value(value)) 
+						for key, value in zip(keys, match.groups()))
+	return {}
+
+def _progress_value(text):
+# number of solver output, None for missing values (e.g. "-" or 1e+50)
+	try:
+		value = float(text)
+	except ValueError:
+		return None
+	if not np.isfinite(value) or abs(value) >= 1e50:
+		return None
+	return value
+
+def _relative_gap(bound, incumbent):
+# gap between incumbent and best bound, relative to the incumbent
+	if bound is None or incumbent is None:
+		return None
+	return abs(incumbent - bound) / max(abs(incumbent), 1e-10)
+
+def _kill_process(pid):
+# stop process with given pid, if it is still running
+	import signal
+	if pid is None:
+		return
+	try:
+		os.kill(pid, signal.SIGTERM)
+	except OSError:
+		pass
+
+def run_scenarios(input_file, scenarios, opt='glpk', Threads=2, processes=None,
+				  result_dir=None, cache=False, cache_dir=None):
+	"""Solve scenarios of one input file in parallel processes
+
+	The input file is read and prepared only once. For every scenario, a copy
+	of the prepared data is changed by the overrides of the scenario (see 
+	scenario_data), then the model is created and solved in a pool of worker
+	processes. A scenario without solution (or with an error) doesn't stop
+	the other scenarios, its status is saved in the summary.
+	
+	Usage:
+		scenarios = {
+			'base': [],
+			'high prices': [('scale', 'Ext-Import', None, 'elec', 1.2)],
+			'cheap chp': [('set', 'Process', 'chp', 'cost-inv', 500)],
+			'efficient chp': [('scale', 'Process-Commodity', ('chp', 'gas', 'In'), 'ratio', 0.9)]}
+		summary = run_scenarios('example.xlsx', scenarios, opt='gurobi')
+		
+	Args:
+		input_file: excel input file, csv directory or HDF5 file (see read_inputdata)
+		scenarios: dict of scenario names and lists of overrides
+		opt: Solver to be used
+		Threads: number of simultaneous CPU threads per solve (only for gurobi and cplex)
+		processes: number of worker processes, defaults to number of CPUs / Threads
+		result_dir: directory for reports, one subdirectory per scenario,
+			defaults to no reports
+		cache: set to TRUE, to cache the parsed excel input file (see read_xlsdata)
+		cache_dir: directory of cache file, defaults to directory of input_file
+
+	Returns:
+		summary: DataFrame with costs and capacities (see get_constants) and
+			the solver termination condition or error ("status") of all 
+			scenarios (rows)
+	"""
+	import multiprocessing
+	
+	for name, overrides in scenarios.items():
+		if any(override[3] == 'Num' for override in overrides):
+			raise ValueError("Scenario '{}': 'Num' can't be changed by overrides".format(name))
+	
+	print('Read Data ...\n')
+	t0 = time.time()
+	xls_data = read_inputdata(input_file, cache=cache, cache_dir=cache_dir) 
+	data = prepare_modeldata(xls_data)
+	print('Data Read. time: '+"{:.1f}".format(time.time()-t0)+' s\n')
+	
+	# check overrides before solving any scenario
+	for name, overrides in scenarios.items():
+		for override in overrides:
+			try:
+				_override_rows(data, override)
+			except ValueError as e:
+				raise ValueError("Scenario '{}': {}".format(name, e))
+	
+	if processes is None:
+		processes = max(1, multiprocessing.cpu_count() // max(1, int(Threads)))
+	
+	print('Solve {} Scenarios in {} Processes ...\n'.format(len(scenarios), processes))
+	t = time.time()
+	tasks = [(name, overrides, opt, Threads, result_dir) 
+			 for name, overrides in sorted(scenarios.items())]
+	pool = multiprocessing.Pool(processes, initializer=_init_scenario_worker, 
+								initargs=(data,))
+	try:
+		results = pool.map(_run_scenario, tasks, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+	print('Scenarios Solved. time: '+"{:.1f}".format(time.time()-t)+' s\n')
+	
+	status = pd.Series(dict((name, status) for name, summary, status in results))
+	for name in status.index[~status.isin(['optimal', 'feasible'])]:
+		print("Scenario '{}' not solved: {}\n".format(name, status[name]))
+	summary = pd.DataFrame(dict((name, summary) for name, summary, status in results)).T
+	summary = summary.reindex(status.index)
+	summary['status'] = status
+	summary.index.name = 'scenario'
+	print('Total Time: '+"{:.1f}".format(time.time()-t0)+' s\n')
+	return summary
+
+def scenario_data(xls_data, overrides):
+	"""Return copy of input data changed by a list of overrides
+
+	Every override is a tuple (operation, table, index, column, value):
+	operation 'set' replaces the values by value, 'scale' multiplies and 
+	'add' adds value. table is the key in xls_data or the sheet name (e.g. 
+	'ext_import' or 'Ext-Import'), column selects the changed column (None 
+	for all columns). index selects the changed rows (None for all rows) by
+	the index columns of the input sheet (see INPUT_SHEETS), also in prepared
+	data, where 'Num' is added to the index of processes and storages: a 
+	value or tuple of values of the first index columns, e.g. 'chp' or 
+	('chp', 'gas', 'In') in 'Process-Commodity' (all 'Num' copies of chp), 
+	a list of them or a slice of the first index column (e.g. of timesteps,
+	including the end).
+	
+	Args:
+		xls_data: input data (see read_inputdata) or prepared input data
+			(see prepare_modeldata and derive_parameters)
+		overrides: list of override tuples
+
+	Returns:
+		copy of xls_data with changed values
+	"""
+	data = dict((key, value.copy() if isinstance(value, pd.DataFrame) else value) 
+				for key, value in xls_data.items())
+	for override in overrides:
+		operation, table, index, column, value = override
+		key, rows = _override_rows(data, override)
+		df = data[key]
+		cols = slice(None) if column is None else column
+		if operation == 'set':
+			df.loc[rows, cols] = value
+		elif operation == 'scale':
+			df.loc[rows, cols] = df.loc[rows, cols] * value
+		else:
+			df.loc[rows, cols] = df.loc[rows, cols] + value
+	return data
+
+def _override_rows(data, override):
+# key of the table in data and boolean array of the rows changed by override
+# (see scenario_data), raises ValueError for unknown operations, tables, 
+# columns and index values
+	operation, table, index, column, value = override
+	if operation not in ('set', 'scale', 'add'):
+		raise ValueError("Unknown override operation '{}'".format(operation))
+	keys = dict((sheet, key) for key, sheet, index_cols in INPUT_SHEETS)
+	index_cols = dict((key, index_cols) for key, sheet, index_cols in INPUT_SHEETS)
+	key = keys.get(table, table)
+	if key not in index_cols or key not in data:
+		raise ValueError("Unknown override table '{}'".format(table))
+	df = data[key]
+	if column is not None and column not in df.columns:
+		raise ValueError("Unknown column '{}' in override of '{}'".format(column, table))
+	if index is None:
+		return key, np.ones(len(df), dtype=bool)
+	
+	names = index_cols[key]
+	rows = np.zeros(len(df), dtype=bool)
+	for element in (index if isinstance(index, list) else [index]):
+		if isinstance(element, slice):
+			level = np.asarray(df.index.get_level_values(names[0]))
+			match = np.ones(len(df), dtype=bool)
+			if element.start is not None:
+				match &= level >= element.start
+			if element.stop is not None:
+				match &= level <= element.stop
+		else:
+			if not isinstance(element, tuple):
+				element = (element,)
+			if len(element) > len(names):
+				raise ValueError("Index {!r} in override of '{}' has more values than "
+					"the index columns {}".format(element, table, ', '.join(names)))
+			match = np.ones(len(df), dtype=bool)
+			for name, label in zip(names, element):
+				match &= np.asarray(df.index.get_level_values(name) == label)
+		rows |= match
+	if not rows.any():
+		raise ValueError("Index {!r} in override of '{}' not found (index columns {})".format(
+			index, table, ', '.join(names)))
+	return key, rows
+
+def _init_scenario_worker(data):
+	# keep prepared input data in worker process for all scenarios
+	global _scenario_base_data
+	_scenario_base_data = data
+
+def _run_scenario(task):
+	# create and solve model of one scenario in worker process
+	# returns scenario name, Series of costs and capacities and status 
+	# (termination condition or error message)
+	name, overrides, opt, Threads, result_dir = task
+	try:
+		data = scenario_data(_scenario_base_data, overrides)
+		derive_parameters(data)
+		prob = create_model(data)
+		result = get_optimizer(opt, Threads).solve(prob, load_solutions=False)
+	except Exception as e:
+		return name, pd.Series(), 'error: {}'.format(e)
+	status = str(result.solver.termination_condition)
+	if status not in ('optimal', 'feasible') or not len(result.solution):
+		return name, pd.Series(), status
+	prob.solutions.load_from(result)
+	
+	if result_dir is not None:
+		scenario_dir = os.path.join(result_dir, name)
+		if not os.path.exists(scenario_dir):
+			os.makedirs(scenario_dir)
+		report(prob, scenario_dir)
+	
+	costs, cpro, csto = get_constants(prob)
+	summary = pd.Series(costs.values, index=[('costs', idx) for idx in costs.index])
+	for caps in [cpro, csto]:
+		if not caps.empty:
+			# (variable, element) e.g. ('pro_cap', 'chp 1')
+			caps = caps.stack()
+			summary = summary.append(pd.Series(caps.values, index=[
+				(idx[-1], ' '.join(str(i) for i in idx[:-1])) for idx in caps.index]))
+	summary.index = pd.MultiIndex.from_tuples(summary.index)
+	return name, summary, status
 		
 def run_from_excel(input_file,opt):
 	"""Run Model directly from excel with makro 
@@ -127,7 +869,12 @@ def run_from_excel(input_file,opt):
 #Model
 ############################################################################################
 
-def create_model(data):
+def create_model(data, mutable=False, profile=False):
+	# data: prepared model data (see prepare_modeldata)
+	# mutable: set to TRUE, to represent timeseries and the process/storage 
+	#	parameters changeable by update_model as mutable Params 
+	# profile: set to TRUE, to record build time and size of every component
+	#	in m.build_profile (see get_build_profile)
 
 	# Preparations
 	# ============
@@ -145,45 +892,53 @@ def create_model(data):
 	storage = data['storage']
 	demand = data['demand']
 	supim = data['supim']
+	aggregation = data.get('aggregation') # only for aggregated timeseries (see aggregate_timeseries)
 
 	
 	#TIME PARAMETERS
-	timesteps = np.arange (int(time_settings.loc['Time']['start']) - 1 , \
-						int(time_settings.loc['Time']['end']) + 1)
-	tb=int(time_settings.loc['Time']['timebase']) #timebase of time dependent data
-	year_factor = float(timesteps.size-1) * tb / (365 * 24 * 60 * 60) # multiple of a year: opt_time[s] / year [s]
-	p2e = float(tb) / 3600 # factor for converting power [kW] to energy [kWh] for one timestep
+	timesteps, tb, weight, sto_fixed_timesteps, year_factor, p2e = time_parameters(data)
 	
 	
 	# Flags
 	# ============
+	set_mip_flags(data)
 	
-	#Partload
-	if process['partload-min'].any() == 0:
-		mip_equations.loc['Partload']['Active']='no' #partload equations are irrelevant if "partload-min" = 0 for all processes
-	if mip_equations.loc['Partload']['Active']=='no':
-		#if "Partload" is deactivated, adjust process parameters
-		process['partload-min']=0
-		process['start-up-energy']=0
-		process_commodity['ratio-partload']=process_commodity['ratio']
-	elif mip_equations.loc['Partload']['Active']=='yes':
-		if process_commodity['ratio-partload'].isnull().any():
-			raise NotImplementedError("'ratio-partload' in sheet 'Process-Commodity' contains invalid values")
+	# Lookup Tables
+	# ============
+	# Convert input DataFrames once to (nested) dictionaries, so equation rules
+	# don't need slow pandas indexing for every index tuple and timestep
 	
-	#Min-Cap
-	if (process['cap-new-min'].any() or storage['cap-new-min-p'].any() or storage['cap-new-min-e'].any()) == 0:
-		mip_equations.loc['Min-Cap']['Active']='no' #partload equations are irrelevant if "partload-min" = 0 for all processes
-	if mip_equations.loc['Min-Cap']['Active']=='no':
-		#if "Min-Cap" is deactivated, adjust minimum capacity parameters
-		process['cap-new-min']=0
-		storage['cap-new-min-p']=0
-		storage['cap-new-min-e']=0
+	#parameters: {index tuple: {column: value}}
+	pro_dict = process.to_dict('index')
+	sto_dict = storage.to_dict('index')
+	ext_co_dict = ext_co.to_dict('index')
+	proclass_dict = process_class.to_dict('index')
+	
+	#timeseries: {commodity: {timestep: value}}
+	demand_dict = demand.to_dict()
+	supim_dict = supim.to_dict()
+	ext_import_dict = ext_import.to_dict()
+	ext_export_dict = ext_export.to_dict()
+	demandrate_factor_dict = demandrate_factor.to_dict()
+	
+	#representative periods of aggregated timeseries are not linked in time
+	period_length = aggregation['period_length'] if aggregation is not None else None
+	
+	#demand rate intervals: {commodity: {last timestep of interval: timesteps of interval}}
+	demandrate_intervals = get_demandrate_intervals(ext_co, ext_import.columns, timesteps, tb,
+													period_length)
+	
+	#previous timestep: {timestep: previous timestep}
+	previous = dict(zip(timesteps[1:], previous_timesteps(timesteps, period_length)))
 	
 	#=========
 	#MODEL
 	#=========
 
-	m = pyen.ConcreteModel()
+	if profile:
+		m = ProfiledModel() # records build time of every component
+	else:
+		m = pyen.ConcreteModel()
 	m.name = 'ficus'
 	m.inputfile = data['input_file']
 	
@@ -313,6 +1068,12 @@ def create_model(data):
 		initialize=timesteps[1:], 
 		doc='Timesteps for model')	
 
+	m.demandrate_tuples = pyen.Set(
+		within=m.co_ext_in*m.t,
+		ordered=True,
+		initialize=[(co,t) for co in ext_import.columns for t in sorted(demandrate_intervals[co])],
+		doc='Imported commodities with last timestep of every demand rate interval')
+
 	# costs
 	m.cost_type = pyen.Set(
 		initialize=['Import', 'Export','Demand charges','Invest','Fix costs', 'Var costs','Process fee','Pro subsidy'],
@@ -331,21 +1092,86 @@ def create_model(data):
 		#Calculate slope and offset for process input and output equations
 		#For calculating power input/output p for each commodity dependent on power throughput "flow"
 		# p = slope * flow + offset	
-		m.pro_p_in_slope = pd.Series(index=m.r_in.index)
-		m.pro_p_in_offset_spec = pd.Series(index=m.r_in.index)
-		for idx in m.pro_p_in_slope.index:
-			m.pro_p_in_slope.loc[idx] = (m.r_in.loc[idx] - m.r_in_partl.loc[idx]*process.loc[idx[0:2]]['partload-min'])/(1-process.loc[idx[0:2]]['partload-min'])
-			m.pro_p_in_offset_spec[idx] = m.r_in.loc[idx]-m.pro_p_in_slope.loc[idx]	
-		m.pro_p_out_slope = pd.Series(index=m.r_out.index)
-		m.pro_p_out_offset_spec = pd.Series(index=m.r_out.index)
-		for idx in m.pro_p_out_slope.index:
-			m.pro_p_out_slope.loc[idx] = (m.r_out.loc[idx] - m.r_out_partl.loc[idx]*process.loc[idx[0:2]]['partload-min'])/(1-process.loc[idx[0:2]]['partload-min'])
-			m.pro_p_out_offset_spec[idx] = m.r_out.loc[idx]-m.pro_p_out_slope.loc[idx]
+		partload_in = np.array([pro_dict[idx[0:2]]['partload-min'] for idx in m.r_in.index])
+		m.pro_p_in_slope = (m.r_in - m.r_in_partl*partload_in)/(1-partload_in)
+		m.pro_p_in_offset_spec = m.r_in-m.pro_p_in_slope
+		partload_out = np.array([pro_dict[idx[0:2]]['partload-min'] for idx in m.r_out.index])
+		m.pro_p_out_slope = (m.r_out - m.r_out_partl*partload_out)/(1-partload_out)
+		m.pro_p_out_offset_spec = m.r_out-m.pro_p_out_slope
+		
+		#dictionaries of ratios, slopes and offsets for fast lookup in equations
+		r_in = m.r_in.to_dict()
+		r_out = m.r_out.to_dict()
+		pro_p_in_slope = m.pro_p_in_slope.to_dict()
+		pro_p_in_offset_spec = m.pro_p_in_offset_spec.to_dict()
+		pro_p_out_slope = m.pro_p_out_slope.to_dict()
+		pro_p_out_offset_spec = m.pro_p_out_offset_spec.to_dict()
+	
+	
+	#process/storage tuples and flags for every commodity
+	m.co_incidence = commodity_incidence(m)
+	
+	#process input/output tuples for every process class and commodity
+	proclass_in = dict((cl_co, []) for cl_co in m.proclass_tuples)
+	proclass_out = dict((cl_co, []) for cl_co in m.proclass_tuples)
+	for p in m.pro_input_tuples:
+		cl_co = (pro_dict[p[0:2]]['class'], p[2])
+		if cl_co in proclass_in:
+			proclass_in[cl_co].append(p)
+	for p in m.pro_output_tuples:
+		cl_co = (pro_dict[p[0:2]]['class'], p[2])
+		if cl_co in proclass_out:
+			proclass_out[cl_co].append(p)
 	
+	#mutable parameters: lookup tables refer to Params instead of values, so 
+	#changed values (see update_model) are used without constructing the
+	#constraints again
+	m.mutable = mutable
+	if mutable:
+		for name, co_set, lookup in [('demand', m.co_demand, demand_dict), 
+									 ('supim', m.co_supim, supim_dict),
+									 ('ext_import', m.co_ext_in, ext_import_dict), 
+									 ('ext_export', m.co_ext_out, ext_export_dict)]:
+			param = pyen.Param(
+				co_set, m.t, mutable=True,
+				initialize=dict(((co, t), lookup[co][t]) for co in co_set for t in m.t),
+				doc='timeseries {} (mutable)'.format(name))
+			setattr(m, name + '_param', param)
+			for co in co_set:
+				lookup[co] = dict((t, param[co,t]) for t in m.t)
+		
+		for name, tuples, lookup in [('pro', m.pro_tuples, pro_dict), 
+									 ('sto', m.sto_tuples, sto_dict)]:
+			key = {'pro': 'process', 'sto': 'storage'}[name]
+			columns = sorted(col for table, col in UPDATE_CONSTRAINTS if table == key)
+			setattr(m, name + '_param_names', pyen.Set(
+				initialize=columns,
+				doc='mutable parameters of {}'.format(key)))
+			param = pyen.Param(
+				tuples, getattr(m, name + '_param_names'), mutable=True,
+				initialize=dict((idx + (col,), lookup[idx][col]) for idx in tuples for col in columns),
+				doc='parameters of {} (mutable)'.format(key))
+			setattr(m, name + '_param', param)
+			for idx in tuples:
+				lookup[idx].update((col, param[idx + (col,)]) for col in columns)
+		for p in m.pro_tuples:
+			pro_dict[p]['cap-abs-max'] = pro_dict[p]['cap-installed'] + pro_dict[p]['cap-new-max']
 	
 	m.demand = demand
+	m.demand_dict = demand_dict
 	m.supim = supim
+	m.supim_dict = supim_dict
+	# lookup tables changeable by update_model
+	m.pro_dict = pro_dict
+	m.sto_dict = sto_dict
+	m.ext_import_dict = ext_import_dict
+	m.ext_export_dict = ext_export_dict
 	m.tb = tb
+	m.weight = weight
+	if aggregation is None:
+		m.timestep_map = None
+	else:
+		m.timestep_map = aggregation['timestep_map']
 	
 	
 	##Variables##
@@ -380,7 +1206,7 @@ def create_model(data):
 			doc='power flow (kW) of commodity to extern (export)')
 
 	m.ext_demandrate_in= pyen.Var(
-			m.co_ext_in,m.t, within=pyen.NonNegativeReals,
+			m.demandrate_tuples, within=pyen.NonNegativeReals,
 			doc=' power flow (kW) of imported commodity in one timestep based in demand rate time interval')		
 	m.ext_demandrate_out= pyen.Var(
 			m.co_ext_out,m.t, within=pyen.NonNegativeReals,
@@ -533,6 +1359,9 @@ def create_model(data):
 	
 	def co_power_balance_rule(m, co, t):
 		co_balance =  commodity_balance(m, co, t)
+		if isinstance(co_balance, (int, float)) and co_balance == 0:
+			# no power flows for commodity (e.g. only input from supim)
+			return pyen.Constraint.Skip
 		return co_balance  == 0
 	m.co_power_balance = pyen.Constraint(
 		m.commodity, m.t,
@@ -544,7 +1373,7 @@ def create_model(data):
 	#initial
 	def pro_p_flow_init_rule(m,pro,num,t):
 		if t == m.t0[1]:
-			return m.pro_p_flow[pro,num,t] == process.loc[pro,num]['initial-power']
+			return m.pro_p_flow[pro,num,t] == pro_dict[pro,num]['initial-power']
 		else:
 			return pyen.Constraint.Skip
 	m.pro_p_flow_init = pyen.Constraint(
@@ -555,7 +1384,7 @@ def create_model(data):
 	if mip_equations.loc['Partload']['Active']=='yes':
 		def pro_mode_run_init_rule(m,pro,num,t):
 			if t == m.t0[1]:
-				return m.pro_mode_run[pro,num,t] == process.loc[pro,num]['initial-run']
+				return m.pro_mode_run[pro,num,t] == pro_dict[pro,num]['initial-run']
 			else:
 				return pyen.Constraint.Skip
 		m.pro_mode_run_init = pyen.Constraint(
@@ -566,7 +1395,7 @@ def create_model(data):
 		
 	# capacity		
 	def pro_cap_abs_rule(m,pro,num):
-		return m.pro_cap[pro,num] == m.pro_cap_new[pro,num] + process.loc[pro,num]['cap-installed']
+		return m.pro_cap[pro,num] == m.pro_cap_new[pro,num] + pro_dict[pro,num]['cap-installed']
 	m.pro_cap_abs = pyen.Constraint(
 		m.pro_tuples,
 		rule = pro_cap_abs_rule,
@@ -574,14 +1403,14 @@ def create_model(data):
 		
 
 	def pro_cap_new_max_rule(m,pro,num):
-		return m.pro_cap_new[pro,num] <= m.pro_cap_build[pro,num] * process.loc[pro,num]['cap-new-max']
+		return m.pro_cap_new[pro,num] <= m.pro_cap_build[pro,num] * pro_dict[pro,num]['cap-new-max']
 	m.pro_cap_new_max = pyen.Constraint(
 		m.pro_tuples,
 		rule = pro_cap_new_max_rule,
 		doc='limit max new capacity of process')
 		
 	def pro_cap_new_min_rule(m,pro,num):
-		return m.pro_cap_new[pro,num] >= m.pro_cap_build[pro,num] * process.loc[pro,num]['cap-new-min']
+		return m.pro_cap_new[pro,num] >= m.pro_cap_build[pro,num] * pro_dict[pro,num]['cap-new-min']
 	m.pro_cap_new_min = pyen.Constraint(
 		m.pro_tuples,
 		rule=pro_cap_new_min_rule,
@@ -600,7 +1429,7 @@ def create_model(data):
 	def pro_p_supim_input_rule(m,pro,num,co,t):
 		if co in m.co_supim:
 			return m.pro_p_in[pro,num,co,t] <= \
-				m.pro_cap[pro,num] * supim.loc[t][co]*m.r_in[pro,num,co]
+				m.pro_cap[pro,num] * supim_dict[co][t]*r_in[pro,num,co]
 		else:
 			return pyen.Constraint.Skip
 	m.pro_p_supim_input = pyen.Constraint(
@@ -610,7 +1439,7 @@ def create_model(data):
 	# in	
 	def pro_p_input_rule(m,pro,num,co,t):
 		return m.pro_p_in[pro,num,co,t] == \
-				m.pro_p_flow[pro,num,t] * m.pro_p_in_slope[pro,num,co]\
+				m.pro_p_flow[pro,num,t] * pro_p_in_slope[pro,num,co]\
 				+ m.pro_p_in_offset[pro,num,co,t]\
 				+ m.pro_p_startup[pro,num,co,t]
 	m.pro_p_input = pyen.Constraint(
@@ -621,7 +1450,7 @@ def create_model(data):
 	
 	#out	
 	def pro_p_output_rule(m,pro,num,co,t):
-		return m.pro_p_out[pro,num,co,t] == m.pro_p_flow[pro,num,t] * m.pro_p_out_slope[pro,num,co]\
+		return m.pro_p_out[pro,num,co,t] == m.pro_p_flow[pro,num,t] * pro_p_out_slope[pro,num,co]\
 											+ m.pro_p_out_offset[pro,num,co,t] 
 	m.pro_p_output = pyen.Constraint(
 		m.pro_output_tuples, m.t,
@@ -633,8 +1462,8 @@ def create_model(data):
 		#offset in	
 		def pro_p_in_offset_lt_rule(m,pro,num,co,t):
 			return m.pro_p_in_offset[pro,num,co,t] \
-					- (m.pro_p_in_offset_spec[pro,num,co] * m.pro_cap[pro,num]) \
-					<= (1 - m.pro_mode_run[pro,num,t]) * process.loc[pro,num]['cap-abs-max']*m.r_in[pro,num,co]
+					- (pro_p_in_offset_spec[pro,num,co] * m.pro_cap[pro,num]) \
+					<= (1 - m.pro_mode_run[pro,num,t]) * pro_dict[pro,num]['cap-abs-max']*r_in[pro,num,co]
 		m.pro_p_in_offset_lt = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_in_offset_lt_rule,
@@ -642,8 +1471,8 @@ def create_model(data):
 			p_offset - (offset_spec*cap) <= (1-run) * cap-max -> p_offset <= (offset_spec*cap) if run=1. ')
 			
 		def pro_p_in_offset_gt_rule(m,pro,num,co,t):
-			return m.pro_p_in_offset[pro,num,co,t] - (m.pro_p_in_offset_spec[pro,num,co] * m.pro_cap[pro,num])\
-			>= -(1 - m.pro_mode_run[pro,num,t]) * process.loc[pro,num]['cap-abs-max']*m.r_in[pro,num,co]
+			return m.pro_p_in_offset[pro,num,co,t] - (pro_p_in_offset_spec[pro,num,co] * m.pro_cap[pro,num])\
+			>= -(1 - m.pro_mode_run[pro,num,t]) * pro_dict[pro,num]['cap-abs-max']*r_in[pro,num,co]
 		m.pro_p_in_offset_gt = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_in_offset_gt_rule,
@@ -653,7 +1482,7 @@ def create_model(data):
 		def pro_p_offset_in_ltzero_when_off_rule(m,pro,num,co,t):
 			return m.pro_p_in_offset[pro,num,co,t] <= \
 				(m.pro_mode_run[pro,num,t]) * \
-				process.loc[pro,num]['cap-abs-max']*m.r_in[pro,num,co]
+				pro_dict[pro,num]['cap-abs-max']*r_in[pro,num,co]
 		m.pro_p_offset_in_ltzero_when_off = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_offset_in_ltzero_when_off_rule,
@@ -663,7 +1492,7 @@ def create_model(data):
 		def pro_p_offset_in_gtzero_when_off_rule(m,pro,num,co,t):
 			return m.pro_p_in_offset[pro,num,co,t] >= \
 				-(m.pro_mode_run[pro,num,t]) * \
-				process.loc[pro,num]['cap-abs-max']*m.r_in[pro,num,co]
+				pro_dict[pro,num]['cap-abs-max']*r_in[pro,num,co]
 		m.pro_p_offset_in_gtzero_when_off = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_offset_in_gtzero_when_off_rule,
@@ -672,8 +1501,8 @@ def create_model(data):
 					
 		#offset out		
 		def pro_p_out_offset_lt_rule(m,pro,num,co,t):
-			return m.pro_p_out_offset[pro,num,co,t] - (m.pro_p_out_offset_spec[pro,num,co] * m.pro_cap[pro,num])\
-			<= (1 - m.pro_mode_run[pro,num,t]) * process.loc[pro,num]['cap-abs-max']*m.r_out[pro,num,co]
+			return m.pro_p_out_offset[pro,num,co,t] - (pro_p_out_offset_spec[pro,num,co] * m.pro_cap[pro,num])\
+			<= (1 - m.pro_mode_run[pro,num,t]) * pro_dict[pro,num]['cap-abs-max']*r_out[pro,num,co]
 		m.pro_p_out_offset_lt = pyen.Constraint(
 			m.pro_output_tuples,m.t,
 			rule = pro_p_out_offset_lt_rule,
@@ -681,8 +1510,8 @@ def create_model(data):
 			p_offset - (offset_spec*cap) <= (1-run) * cap-max -> p_offset <= (offset_spec*cap) if run=1. ')
 			
 		def pro_p_out_offset_gt_rule(m,pro,num,co,t):
-			return m.pro_p_out_offset[pro,num,co,t] - (m.pro_p_out_offset_spec[pro,num,co] * m.pro_cap[pro,num])\
-			>= -(1 - m.pro_mode_run[pro,num,t]) * process.loc[pro,num]['cap-abs-max']*m.r_out[pro,num,co]
+			return m.pro_p_out_offset[pro,num,co,t] - (pro_p_out_offset_spec[pro,num,co] * m.pro_cap[pro,num])\
+			>= -(1 - m.pro_mode_run[pro,num,t]) * pro_dict[pro,num]['cap-abs-max']*r_out[pro,num,co]
 		m.pro_p_out_offset_gt = pyen.Constraint(
 			m.pro_output_tuples,m.t,
 			rule = pro_p_out_offset_gt_rule,
@@ -692,7 +1521,7 @@ def create_model(data):
 		def pro_p_offset_out_ltzero_when_off_rule(m,pro,num,co,t):
 			return m.pro_p_out_offset[pro,num,co,t] <= \
 				(m.pro_mode_run[pro,num,t]) * \
-				process.loc[pro,num]['cap-abs-max']*m.r_out[pro,num,co]
+				pro_dict[pro,num]['cap-abs-max']*r_out[pro,num,co]
 		m.pro_p_offset_out_ltzero_when_off = pyen.Constraint(
 			m.pro_output_tuples,m.t,
 			rule = pro_p_offset_out_ltzero_when_off_rule,
@@ -701,7 +1530,7 @@ def create_model(data):
 		def pro_p_offset_out_gtzero_when_off_rule(m,pro,num,co,t):
 			return m.pro_p_out_offset[pro,num,co,t] >= \
 				-(m.pro_mode_run[pro,num,t]) * \
-				process.loc[pro,num]['cap-abs-max']*m.r_out[pro,num,co]
+				pro_dict[pro,num]['cap-abs-max']*r_out[pro,num,co]
 		m.pro_p_offset_out_gtzero_when_off = pyen.Constraint(
 			m.pro_output_tuples,m.t,
 			rule = pro_p_offset_out_gtzero_when_off_rule,
@@ -711,7 +1540,7 @@ def create_model(data):
 		def pro_p_flow_zero_when_off_rule(m,pro,num,t):
 			return m.pro_p_flow[pro,num,t] <= \
 				(m.pro_mode_run[pro,num,t]) * \
-				process.loc[pro,num]['cap-abs-max']
+				pro_dict[pro,num]['cap-abs-max']
 		m.pro_p_flow_zero_when_off = pyen.Constraint(
 			m.pro_tuples,m.t,
 			rule=pro_p_flow_zero_when_off_rule,
@@ -719,7 +1548,7 @@ def create_model(data):
 
 			
 		def pro_p_gt_partload_rule(m,pro,num,t):
-			return (m.pro_p_flow[pro,num,t] - m.pro_cap[pro,num] * process.loc[pro,num]['partload-min']) >= -(1 - m.pro_mode_run[pro,num,t]) * process.loc[pro,num]['cap-abs-max']		
+			return (m.pro_p_flow[pro,num,t] - m.pro_cap[pro,num] * pro_dict[pro,num]['partload-min']) >= -(1 - m.pro_mode_run[pro,num,t]) * pro_dict[pro,num]['cap-abs-max']		
 		m.pro_p_gt_partload = pyen.Constraint(
 			m.pro_tuples,m.t,
 			rule = pro_p_gt_partload_rule,
@@ -729,7 +1558,7 @@ def create_model(data):
 		def pro_mode_start_up1_rule(m,pro,num,t):
 			return m.pro_mode_startup[pro,num,t] >= \
 				m.pro_mode_run[pro,num,t] - \
-				(m.pro_mode_run[pro,num,t-1])
+				(m.pro_mode_run[pro,num,previous[t]])
 		m.pro_mode_start_up1 = pyen.Constraint(
 			m.pro_tuples,m.t,
 			rule=pro_mode_start_up1_rule,
@@ -745,7 +1574,7 @@ def create_model(data):
 			
 		def pro_mode_start_up3_rule(m,pro,num,t):
 			return m.pro_mode_startup[pro,num,t] <= \
-				1 - m.pro_mode_run[pro,num,t-1]
+				1 - m.pro_mode_run[pro,num,previous[t]]
 		m.pro_mode_start_up3 = pyen.Constraint(
 			m.pro_tuples,m.t,
 			rule=pro_mode_start_up3_rule,
@@ -753,11 +1582,11 @@ def create_model(data):
 			
 		def pro_p_startup_lt_rule(m,pro,num,co,t):
 			return (m.pro_p_startup[pro,num,co,t]\
-					- (process.loc[pro,num]['start-up-energy'] / p2e \
-						* m.r_in[pro,num,co]*m.pro_cap[pro,num]))\
+					- (pro_dict[pro,num]['start-up-energy'] / p2e \
+						* r_in[pro,num,co]*m.pro_cap[pro,num]))\
 					<= ((1 - m.pro_mode_startup[pro,num,t]) \
-						* (process.loc[pro,num]['start-up-energy'] / p2e\
-						* m.r_in[pro,num,co]*process.loc[pro,num]['cap-abs-max']))
+						* (pro_dict[pro,num]['start-up-energy'] / p2e\
+						* r_in[pro,num,co]*pro_dict[pro,num]['cap-abs-max']))
 		m.pro_p_startup_lt = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_startup_lt_rule,
@@ -766,11 +1595,11 @@ def create_model(data):
 			
 		def pro_p_startup_gt_rule(m,pro,num,co,t):
 			return (m.pro_p_startup[pro,num,co,t]\
-					- (process.loc[pro,num]['start-up-energy'] / p2e\
-						* m.r_in[pro,num,co]*m.pro_cap[pro,num]))\
+					- (pro_dict[pro,num]['start-up-energy'] / p2e\
+						* r_in[pro,num,co]*m.pro_cap[pro,num]))\
 					>= -((1 - m.pro_mode_startup[pro,num,t]) \
-						* (process.loc[pro,num]['start-up-energy'] / p2e\
-						* m.r_in[pro,num,co]*process.loc[pro,num]['cap-abs-max']))
+						* (pro_dict[pro,num]['start-up-energy'] / p2e\
+						* r_in[pro,num,co]*pro_dict[pro,num]['cap-abs-max']))
 		m.pro_p_startup_gt = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_startup_gt_rule,
@@ -780,8 +1609,8 @@ def create_model(data):
 		def pro_p_startup_zerowhenoff_rule(m,pro,num,co,t):
 			return m.pro_p_startup[pro,num,co,t]\
 					<= m.pro_mode_startup[pro,num,t] \
-						* (process.loc[pro,num]['start-up-energy'] / p2e\
-						* m.r_in[pro,num,co]*process.loc[pro,num]['cap-abs-max'])
+						* (pro_dict[pro,num]['start-up-energy'] / p2e\
+						* r_in[pro,num,co]*pro_dict[pro,num]['cap-abs-max'])
 		m.pro_p_startup_zerowhenoff = pyen.Constraint(
 			m.pro_input_tuples,m.t,
 			rule = pro_p_startup_zerowhenoff_rule,
@@ -792,14 +1621,10 @@ def create_model(data):
 	# CALCULATIONS		
 	def proclass_cap_sum_rule(m,cl,co):			
 		return m.proclass_cap[cl,co] == \
-				sum(m.pro_cap[p[0:2]] * m.r_out[p]\
-					for p in m.pro_output_tuples
-					if co in p
-					if cl == process.loc[p[0:2]]['class'])\
-				+ sum(m.pro_cap[p[0:2]] * m.r_in[p]\
-					for p in m.pro_input_tuples
-					if co in p
-					if cl == process.loc[p[0:2]]['class'])
+				sum(m.pro_cap[p[0:2]] * r_out[p]\
+					for p in proclass_out[cl,co])\
+				+ sum(m.pro_cap[p[0:2]] * r_in[p]\
+					for p in proclass_in[cl,co])
 	m.proclass_cap_sum = pyen.Constraint(
 		m.proclass_tuples,
 		rule=proclass_cap_sum_rule,
@@ -807,11 +1632,9 @@ def create_model(data):
 				
 	def proclass_e_out_sum_rule(m,cl,co):			
 		return m.proclass_e_out[cl,co] == \
-				sum(m.pro_p_out[p,t] * p2e\
+				sum(m.pro_p_out[p,t] * p2e * weight[t]\
 					for t in m.t
-					for p in m.pro_output_tuples\
-					if co in p
-					if cl == process.loc[p[0:2]]['class'])
+					for p in proclass_out[cl,co])
 	m.proclass_e_out_sum = pyen.Constraint(
 		m.proclass_tuples,
 		rule=proclass_e_out_sum_rule,
@@ -819,11 +1642,9 @@ def create_model(data):
 		
 	def proclass_e_in_sum_rule(m,cl,co):			
 		return m.proclass_e_in[cl,co] == \
-				sum(m.pro_p_in[p,t] * p2e\
+				sum(m.pro_p_in[p,t] * p2e * weight[t]\
 					for t in m.t
-					for p in m.pro_input_tuples\
-					if co in p
-					if cl == process.loc[p[0:2]]['class'])
+					for p in proclass_in[cl,co])
 	m.proclass_e_in_sum = pyen.Constraint(
 		m.proclass_tuples,
 		rule=proclass_e_in_sum_rule,		
@@ -833,19 +1654,20 @@ def create_model(data):
 		
 	def proclass_cap_max_rule(m, cl, co):
 		return m.proclass_cap[cl,co] <= \
-				process_class.loc[cl,co]['cap-max']
+				proclass_dict[cl,co]['cap-max']
 	m.proclass_cap_max = pyen.Constraint(
 		m.proclass_tuples,
 		rule=proclass_cap_max_rule,
 		doc='limitmax capacity of class and commodity')
 		
 	def proclass_e_max_rule(m, cl, co):
-		if process_class.loc[cl,co]['Direction'] == 'In':
+		if proclass_dict[cl,co]['Direction'] == 'In':
 			return m.proclass_e_in[cl,co] <= \
-					process_class.loc[cl,co]['energy-max'] * year_factor
-		if process_class.loc[cl,co]['Direction'] == 'Out':
+					proclass_dict[cl,co]['energy-max'] * year_factor
+		if proclass_dict[cl,co]['Direction'] == 'Out':
 			return m.proclass_e_out[cl,co] <= \
-					process_class.loc[cl,co]['energy-max'] * year_factor
+					proclass_dict[cl,co]['energy-max'] * year_factor
+		raise ValueError("For 'Direction' in sheet 'Process-Class' only 'In' or 'Out' are valid inputs")
 	m.proclass_e_max = pyen.Constraint(
 		m.proclass_tuples,
 		rule=proclass_e_max_rule,
@@ -854,24 +1676,26 @@ def create_model(data):
 	"""STORAGE"""
 	#initial
 	def sto_e_cont_init_rule(m,sto,co,num,t):
-		if t == m.t0[1]:
+		if t == timesteps[-1] and 'final-soc' in sto_dict[sto,co,num]:
+			#final content differs from initial content (see run_rolling_horizon)
 			return m.sto_e_cont[sto,co,num,t] == \
-				storage.loc[sto,co,num]['initial-soc'] *  m.sto_cap_e[sto,co,num]
-		elif t == m.t0[-1]:
+				sto_dict[sto,co,num]['final-soc'] *  m.sto_cap_e[sto,co,num]
+		elif t in sto_fixed_timesteps:
 			return m.sto_e_cont[sto,co,num,t] == \
-				storage.loc[sto,co,num]['initial-soc'] *  m.sto_cap_e[sto,co,num]
+				sto_dict[sto,co,num]['initial-soc'] *  m.sto_cap_e[sto,co,num]
 		else:
 			return pyen.Constraint.Skip
 	m.sto_e_cont_init = pyen.Constraint(
 		m.sto_tuples,m.t0,
 		rule=sto_e_cont_init_rule,
-		doc='initial and minimum final content of energy storage')
+		doc='initial and minimum final content of energy storage (for aggregated \
+			timeseries at the boundaries of every representative period)')
 		
 		
 	# capacity		
 	def sto_cap_e_abs_rule(m,sto,co,num):
 		return m.sto_cap_e[sto,co,num] == \
-				m.sto_cap_e_new[sto,co,num] + storage.loc[sto,co,num]['cap-installed-e']
+				m.sto_cap_e_new[sto,co,num] + sto_dict[sto,co,num]['cap-installed-e']
 	m.sto_cap_e_abs = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_e_abs_rule,
@@ -879,7 +1703,7 @@ def create_model(data):
 
 	def sto_cap_e_new_max_rule(m,sto,co,num):
 		return m.sto_cap_e_new[sto,co,num] <= \
-				m.sto_cap_build[sto,co,num] * storage.loc[sto,co,num]['cap-new-max-e']
+				m.sto_cap_build[sto,co,num] * sto_dict[sto,co,num]['cap-new-max-e']
 	m.sto_cap_e_new_max = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_e_new_max_rule,
@@ -887,7 +1711,7 @@ def create_model(data):
 		
 	def sto_cap_e_new_min_rule(m,sto,co,num):
 		return m.sto_cap_e_new[sto,co,num] >= \
-				m.sto_cap_build[sto,co,num] * storage.loc[sto,co,num]['cap-new-min-e']
+				m.sto_cap_build[sto,co,num] * sto_dict[sto,co,num]['cap-new-min-e']
 	m.sto_cap_e_new_min = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_e_new_min_rule,
@@ -895,7 +1719,7 @@ def create_model(data):
 			
 	def sto_cap_p_abs_rule(m,sto,co,num):
 		return m.sto_cap_p[sto,co,num] == \
-				m.sto_cap_p_new[sto,co,num] + storage.loc[sto,co,num]['cap-installed-p']
+				m.sto_cap_p_new[sto,co,num] + sto_dict[sto,co,num]['cap-installed-p']
 	m.sto_cap_p_abs = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_p_abs_rule,
@@ -903,7 +1727,7 @@ def create_model(data):
 
 	def sto_cap_p_new_max_rule(m,sto,co,num):
 		return m.sto_cap_p_new[sto,co,num] <= \
-				m.sto_cap_build[sto,co,num] * storage.loc[sto,co,num]['cap-new-max-p']
+				m.sto_cap_build[sto,co,num] * sto_dict[sto,co,num]['cap-new-max-p']
 	m.sto_cap_p_new_max = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_p_new_max_rule,
@@ -911,7 +1735,7 @@ def create_model(data):
 		
 	def sto_cap_p_new_min_rule(m,sto,co,num):
 		return m.sto_cap_p_new[sto,co,num] >= \
-				m.sto_cap_build[sto,co,num] * storage.loc[sto,co,num]['cap-new-min-p']
+				m.sto_cap_build[sto,co,num] * sto_dict[sto,co,num]['cap-new-min-p']
 	m.sto_cap_p_new_min = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_p_new_min_rule,
@@ -919,7 +1743,7 @@ def create_model(data):
 			
 	def sto_cap_p_c_relation_rule(m,sto,co,num):
 		return m.sto_cap_p[sto,co,num] <= \
-				m.sto_cap_e[sto,co,num] * storage.loc[sto,co,num]['max-p-e-ratio']
+				m.sto_cap_e[sto,co,num] * sto_dict[sto,co,num]['max-p-e-ratio']
 	m.sto_cap_p_c_relation = pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_cap_p_c_relation_rule,
@@ -947,7 +1771,7 @@ def create_model(data):
 		def sto_p_in_not_out_rule(m,sto,co,num,t):
 			return m.sto_p_in[sto,co,num,t] <= \
 					m.sto_charge[co,t]*\
-					(storage.loc[sto,co,num]['cap-new-max-p']+storage.loc[sto,co,num]['cap-installed-p'])
+					(sto_dict[sto,co,num]['cap-new-max-p']+sto_dict[sto,co,num]['cap-installed-p'])
 		m.sto_p_in_not_out = pyen.Constraint(
 			m.sto_tuples, m.t,
 			rule = sto_p_in_not_out_rule,
@@ -956,7 +1780,7 @@ def create_model(data):
 		def sto_p_out_not_in_rule(m,sto,co,num,t):
 			return m.sto_p_out[sto,co,num,t] <= \
 					(1-m.sto_charge[co,t])*\
-					(storage.loc[sto,co,num]['cap-new-max-p']+storage.loc[sto,co,num]['cap-installed-p'])
+					(sto_dict[sto,co,num]['cap-new-max-p']+sto_dict[sto,co,num]['cap-installed-p'])
 		m.sto_p_out_not_in = pyen.Constraint(
 			m.sto_tuples, m.t,
 			rule = sto_p_out_not_in_rule,
@@ -967,16 +1791,16 @@ def create_model(data):
 	def sto_e_cont_def_rule(m,sto,co,num,t):
 		return m.sto_e_cont[sto,co,num,t] == \
 				m.sto_e_cont[sto,co,num,t-1] \
-					* (1 - storage.loc[sto,co,num]['self-discharge'] * p2e)\
-				+ m.sto_p_in[sto,co,num,t] * storage.loc[sto,co,num]['eff-in'] *p2e\
-				- m.sto_p_out[sto,co,num,t] / storage.loc[sto,co,num]['eff-out'] * p2e
+					* (1 - sto_dict[sto,co,num]['self-discharge'] * p2e)\
+				+ m.sto_p_in[sto,co,num,t] * sto_dict[sto,co,num]['eff-in'] *p2e\
+				- m.sto_p_out[sto,co,num,t] / sto_dict[sto,co,num]['eff-out'] * p2e
 	m.sto_e_cont_def = pyen.Constraint(
 		m.sto_tuples, m.t,
 		rule=sto_e_cont_def_rule,
 		doc='Energy Content of Storage: E(t) = E(t-1)*(1 - self_disch) + P_in*eff_in - P_out/eff_out')
 			
 	def sto_e_cont_max_rule(m,sto,co,num,t):
-		return m.sto_e_cont[sto,co,num,t] <= m.sto_cap_e[sto,co,num] * storage.loc[sto,co,num]['DOD']
+		return m.sto_e_cont[sto,co,num,t] <= m.sto_cap_e[sto,co,num] * sto_dict[sto,co,num]['DOD']
 	m.sto_e_cont_max = pyen.Constraint(
 		m.sto_tuples, m.t,
 		rule=sto_e_cont_max_rule,
@@ -985,10 +1809,10 @@ def create_model(data):
 	# CHARGE CYCLES
 	
 	def sto_max_cycle_rule(m,sto,co,num):
-		return sum( m.sto_p_in[sto,co,num,t] * p2e for t in m.t) <=\
+		return sum( m.sto_p_in[sto,co,num,t] * p2e * weight[t] for t in m.t) <=\
 				m.sto_cap_e[sto,co,num] \
-				* storage.loc[sto,co,num]['DOD'] * storage.loc[sto,co,num]['cycles-max']\
-				* year_factor/storage.loc[sto,co,num]['lifetime']
+				* sto_dict[sto,co,num]['DOD'] * sto_dict[sto,co,num]['cycles-max']\
+				* year_factor/sto_dict[sto,co,num]['lifetime']
 	m.sto_max_cycle= pyen.Constraint(
 		m.sto_tuples,
 		rule=sto_max_cycle_rule,
@@ -997,57 +1821,50 @@ def create_model(data):
 		
 	"""GRID"""
 	def ext_p_in_max_rule(m, co, t):
-		return m.ext_p_in[co,t] <= ext_co.loc[co]['import-max']
+		return m.ext_p_in[co,t] <= ext_co_dict[co]['import-max']
 	m.ext_p_in_max = pyen.Constraint(
 		m.co_ext_in, m.t,
 		rule=ext_p_in_max_rule,
 		doc='max power import(kW) for every timestep ')
 
 	def ext_p_out_max_rule(m, co, t):
-		return m.ext_p_out[co,t] <= ext_co.loc[co]['export-max']
+		return m.ext_p_out[co,t] <= ext_co_dict[co]['export-max']
 	m.ext_p_out_max = pyen.Constraint(
 		m.co_ext_out, m.t,
 		rule=ext_p_out_max_rule,
 		doc='max power export (kW) for every timestep ')			
 	
 	
-	def demandrate_initial_max_rule(m, co, t):
-		return m.ext_demandrate_max[co] >= ext_co.loc[co]['p-max-initial']
+	def demandrate_initial_max_rule(m, co):
+		return m.ext_demandrate_max[co] >= ext_co_dict[co]['p-max-initial']
 	m.demandrate_initial_max = pyen.Constraint(
-		m.co_ext_in, m.t,
+		m.co_ext_in,
 		rule=demandrate_initial_max_rule,
 		doc='p-max for demand charge calculation dependent on initial p-max')
 
 	def demandrate_in_def_max_rule(m, co, t):
-		return m.ext_demandrate_max[co] >= m.ext_demandrate_in[co,t]#
+		return m.ext_demandrate_max[co] >= m.ext_demandrate_in[co,t]
 	m.demandrate_in_def_max = pyen.Constraint(
-		m.co_ext_in, m.t,
+		m.demandrate_tuples,
 		rule=demandrate_in_def_max_rule,
 		doc='p-max for demand charge calculation dependent on p_ext_in')
 	
 	
 	def demandrate_in_tb_rule(m, co, t):
-		t_rel=ext_co.loc[co]['time-interval-demand-rate']/tb #relation of power price and opt timebase
-		if (t%t_rel) == 0:
-			if (t-t_rel+1) < time_settings.loc['Time']['start']:
-				t_0 = time_settings.loc['Time']['start']
-			else:
-				t_0 = t-t_rel+1
-			return m.ext_demandrate_in[co,t] == \
-				sum(\
-					m.ext_p_in[co,tg]\
-					for tg in np.arange(t_0,t+1))\
-				/t_rel *  demandrate_factor.loc[t][co]
-		else:
-			return m.ext_demandrate_in[co,t] == 0
+		t_rel=ext_co_dict[co]['time-interval-demand-rate']/tb #relation of power price and opt timebase
+		return m.ext_demandrate_in[co,t] == \
+			sum(\
+				m.ext_p_in[co,tg]\
+				for tg in demandrate_intervals[co][t])\
+			/t_rel *  demandrate_factor_dict[co][t]
 	m.demandrate_in_tb = pyen.Constraint(
-		m.co_ext_in, m.t,
+		m.demandrate_tuples,
 		rule=demandrate_in_tb_rule,
 		doc='adapt p_ext_in to timbase of demand rate and consider demand-rate-factor')
 		
 	def ext_min_operation_hours_rule(m, co):
-		return sum(m.ext_demandrate_in[co,t]*p2e for t in m.t) >= \
-				ext_co.loc[co]['operating-hours-min'] * m.ext_demandrate_max[co] * year_factor
+		return sum(m.ext_demandrate_in[co,t]*p2e*weight[t] for t in sorted(demandrate_intervals[co])) >= \
+				ext_co_dict[co]['operating-hours-min'] * m.ext_demandrate_max[co] * year_factor
 	m.ext_min_operation_hours = pyen.Constraint(
 		m.co_ext_in,
 		rule=ext_min_operation_hours_rule,
@@ -1060,76 +1877,76 @@ def create_model(data):
 		if cost_type == 'Invest':
 			return m.costs[cost_type] == \
 				sum(m.pro_cap_new[p] * \
-					process.loc[p]['cost-inv'] * \
-					process.loc[p]['annuity_factor']\
+					pro_dict[p]['cost-inv'] * \
+					pro_dict[p]['annuity_factor']\
 					for p in m.pro_tuples)\
 				+sum(m.sto_cap_p_new[s] * 
-						storage.loc[s]['cost-inv-p'] * 
-						storage.loc[s]['annuity_factor']\
+						sto_dict[s]['cost-inv-p'] * 
+						sto_dict[s]['annuity_factor']\
 					+m.sto_cap_e_new[s] * 
-						storage.loc[s]['cost-inv-e'] * 
-						storage.loc[s]['annuity_factor']\
+						sto_dict[s]['cost-inv-e'] * 
+						sto_dict[s]['annuity_factor']\
 					for s in m.sto_tuples)
 		
 		#operation independent costs = capacity * cost_fix
 		elif cost_type == 'Fix costs':
 			return m.costs[cost_type] == \
-				sum(m.pro_cap[p] * process.loc[p]['cost-fix']\
+				sum(m.pro_cap[p] * pro_dict[p]['cost-fix']\
 					for p in m.pro_tuples)\
-				+sum(m.sto_cap_p[s] * storage.loc[s]['cost-fix-p']
-					+m.sto_cap_e[s] * storage.loc[s]['cost-fix-e'] 
+				+sum(m.sto_cap_p[s] * sto_dict[s]['cost-fix-p']
+					+m.sto_cap_e[s] * sto_dict[s]['cost-fix-e'] 
 					for s in m.sto_tuples)
 		
 		# Variable costs dependent on energy through process/storage = sum(t)[cost_var * energy(t)] 
 		elif cost_type == 'Var costs':
 			return m.costs[cost_type] == \
-				sum(m.pro_p_flow[p,t] * p2e \
-					*process.loc[p]['cost-var']\
+				sum(m.pro_p_flow[p,t] * p2e * weight[t] \
+					*pro_dict[p]['cost-var']\
 					for t in m.t for p in m.pro_tuples)/year_factor\
-				+sum((m.sto_p_in[s,t] + m.sto_p_out[s,t]) * p2e * storage.loc[s]['cost-var']
+				+sum((m.sto_p_in[s,t] + m.sto_p_out[s,t]) * p2e * weight[t] * sto_dict[s]['cost-var']
 					for t in m.t for s in m.sto_tuples)/year_factor
 		
 		#costs for external import = sum(t) [ p_ext) * price(t)]
 		elif cost_type == 'Import':	
 			return m.costs[cost_type] == \
-				sum(m.ext_p_in[c,t]*p2e \
-					* (ext_import.loc[t][c])\
+				sum(m.ext_p_in[c,t]*p2e * weight[t] \
+					* (ext_import_dict[c][t])\
 					for t in m.t for c in m.co_ext_in)/year_factor
 		
 		#costs for export = sum(t) [- p_ext_export(t) * price(t)]
 		elif cost_type == 'Export':	
 			return m.costs[cost_type] == \
-				-sum( m.ext_p_out[c,t] * p2e * ext_export.loc[t][c]\
+				-sum( m.ext_p_out[c,t] * p2e * weight[t] * ext_export_dict[c][t]\
 					for t in m.t for c in m.co_ext_out)/year_factor
 		
 		# Costs for grid use = p_max * power_price
 		elif cost_type == 'Demand charges':
 			return m.costs[cost_type] == \
-				sum(m.ext_demandrate_max[c] * ext_co.loc[c]['demand-rate']\
+				sum(m.ext_demandrate_max[c] * ext_co_dict[c]['demand-rate']\
 					for c in m.co_ext_in )
 					
 		# Costs for process fee
 		elif cost_type == 'Process fee':
 				return m.costs[cost_type] == \
-					sum(m.proclass_e_in[procl] * process_class.loc[procl]['fee']\
+					sum(m.proclass_e_in[procl] * proclass_dict[procl]['fee']\
 						for procl in m.proclass_tuples\
-						if process_class.loc[procl]['Direction']=='In'\
-						if process_class.loc[procl]['fee']>0)/year_factor\
-					+sum(m.proclass_e_out[procl] * process_class.loc[procl]['fee']
+						if proclass_dict[procl]['Direction']=='In'\
+						if proclass_dict[procl]['fee']>0)/year_factor\
+					+sum(m.proclass_e_out[procl] * proclass_dict[procl]['fee']
 						for procl in m.proclass_tuples\
-						if process_class.loc[procl]['Direction']=='Out'\
-						if process_class.loc[procl]['fee']>0)/year_factor
+						if proclass_dict[procl]['Direction']=='Out'\
+						if proclass_dict[procl]['fee']>0)/year_factor
 		# Costs for process subsidies
 		elif cost_type == 'Pro subsidy':
 				return m.costs[cost_type] == \
-					sum(m.proclass_e_in[procl] * process_class.loc[procl]['fee']\
+					sum(m.proclass_e_in[procl] * proclass_dict[procl]['fee']\
 						for procl in m.proclass_tuples\
-						if process_class.loc[procl]['Direction']=='In'\
-						if process_class.loc[procl]['fee']<0)/year_factor\
-					+sum(m.proclass_e_out[procl] * process_class.loc[procl]['fee']
+						if proclass_dict[procl]['Direction']=='In'\
+						if proclass_dict[procl]['fee']<0)/year_factor\
+					+sum(m.proclass_e_out[procl] * proclass_dict[procl]['fee']
 						for procl in m.proclass_tuples\
-						if process_class.loc[procl]['Direction']=='Out'\
-						if process_class.loc[procl]['fee']<0)/year_factor			
+						if proclass_dict[procl]['Direction']=='Out'\
+						if proclass_dict[procl]['fee']<0)/year_factor			
 		else:
 			raise NotImplementedError("Unknown cost type!")					
 	m.cost_sum = pyen.Constraint(
@@ -1146,43 +1963,70 @@ def create_model(data):
 		sense=pyen.minimize,
 		rule=obj_rule,
 		doc='Sum costs by cost type')	
+	
+	if profile:
+		m.build_profile = get_build_profile(m)
 			
 	return m
 			   
 """Help Functions"""
 
+def commodity_incidence(m):
+# Assign process input/output tuples and storage tuples to their commodity,
+# so balances only need to iterate the power flows of this commodity.
+# Tuples are matched by their commodity position, not by "co in tuple",
+# so a process or storage named like a commodity is not assigned to it.
+# Returns {commodity: {'pro_in': [..], 'pro_out': [..], 'sto': [..],
+#                      'demand': bool, 'supim': bool, 'ext_in': bool, 'ext_out': bool}}
+
+	incidence = {}
+	for co in m.commodity:
+		incidence[co] = {
+			'pro_in': [],
+			'pro_out': [],
+			'sto': [],
+			'demand': co in m.co_demand,
+			'supim': co in m.co_supim,
+			'ext_in': co in m.co_ext_in,
+			'ext_out': co in m.co_ext_out}
+	for p in m.pro_input_tuples:
+		incidence[p[2]]['pro_in'].append(p) # (pro, num, co)
+	for p in m.pro_output_tuples:
+		incidence[p[2]]['pro_out'].append(p) # (pro, num, co)
+	for s in m.sto_tuples:
+		incidence[s[1]]['sto'].append(s) # (sto, co, num)
+	return incidence
+
 def commodity_balance(m, co, t):
 # Calculate commodity balance at given timestep.
 # TO factory Grid = USED Energy = NEGATIVE - (process-out; storage-out, ext_in..)
 # FROM factory Grid = provided Energy = POSITIVE + (process-in; storage-in, ext_out, demand..)
 	
 	balance = 0
+	incidence = m.co_incidence[co]
 
-	if co in m.co_demand:
+	if incidence['demand']:
 		# demand increases balance
-		balance += m.demand.loc[t][co]			
-	for p in m.pro_input_tuples:
-		if co in p:
+		balance += m.demand_dict[co][t]
+	if not incidence['supim']:
+		# commodities in supim do not count for balance
+		for p in incidence['pro_in']:
 			#usage as input for process increases balance
-			balance += m.pro_p_in[p,t]	
-			if co in m.co_supim:
-				balance -= m.pro_p_in[p,t] # commodities in supim do not count for balance
-	for p in m.pro_output_tuples:
-		if co in p:
+			balance += m.pro_p_in[p,t]
+	for p in incidence['pro_out']:
 		# output from processes decreases balance
-			balance -= m.pro_p_out[p,t]			
-	if co in m.co_ext_in:
+		balance -= m.pro_p_out[p,t]
+	if incidence['ext_in']:
 		# additional external import decreases balance
 		balance -= m.ext_p_in[co,t]	
-	if co in m.co_ext_out:
+	if incidence['ext_out']:
 		# external export in increases balance
 		balance += m.ext_p_out[co,t]	     			
-	for s in m.sto_tuples:
-        # usage as input for storage increases consumption
-        # output from storage decreases consumption
-		if co in s:
-			balance += m.sto_p_in[s,t]
-			balance -= m.sto_p_out[s,t]
+	for s in incidence['sto']:
+		# usage as input for storage increases consumption
+		# output from storage decreases consumption
+		balance += m.sto_p_in[s,t]
+		balance -= m.sto_p_out[s,t]
 	return balance
 
 def energy_consumption(m, co):
@@ -1190,20 +2034,19 @@ def energy_consumption(m, co):
 # sum up demand + process in puts + storage losses over tim 
 	
 	consumption = 0
+	incidence = m.co_incidence[co]
 
-	if co in m.co_demand:
+	if incidence['demand']:
 		# demand increases consumption
-		consumption += sum(m.demand.loc[t][co] for t in m.t)					
-	for p in m.pro_input_tuples:
-		if co in p:
+		consumption += sum(m.demand_dict[co][t] * m.weight[t] for t in m.t)
+	for p in incidence['pro_in']:
 		# input processes 
-			consumption += sum(m.pro_p_in[p,t] for t in m.t)		     			
-	for s in m.sto_tuples:
-        # usage as input for storage increases consumption
-        # output from storage decreases consumption
-		if co in s:
-			consumption += sum(m.sto_p_in[s,t] for t in m.t)
-			consumption -= sum(m.sto_p_out[s,t] for t in m.t)
+		consumption += sum(m.pro_p_in[p,t] * m.weight[t] for t in m.t)
+	for s in incidence['sto']:
+		# usage as input for storage increases consumption
+		# output from storage decreases consumption
+		consumption += sum(m.sto_p_in[s,t] * m.weight[t] for t in m.t)
+		consumption -= sum(m.sto_p_out[s,t] * m.weight[t] for t in m.t)
 	
 	return consumption	
 
@@ -1213,12 +2056,96 @@ def energy_production(m, co):
 	
 	production = 0
 				
-	for p in m.pro_output_tuples:
-		if co in p:
-			production += sum(m.pro_p_out[p,t] for t in m.t)		     			
+	for p in m.co_incidence[co]['pro_out']:
+		production += sum(m.pro_p_out[p,t] * m.weight[t] for t in m.t)
 			
 	return production
 
+def time_parameters(data):
+# Timesteps and time dependent factors of the optimisation period
+# Returns (timesteps, tb, weight, sto_fixed_timesteps, year_factor, p2e):
+# timesteps: all timesteps including the timestep before the first one
+# tb: timebase of time dependent data
+# weight: {timestep: number of original timesteps represented by timestep}
+# sto_fixed_timesteps: timesteps with fixed storage content
+# year_factor: multiple of a year of the optimisation period
+# p2e: factor for converting power [kW] to energy [kWh] for one timestep
+	time_settings = data['time-settings']
+	aggregation = data.get('aggregation') # only for aggregated timeseries (see aggregate_timeseries)
+	
+	timesteps = np.arange (int(time_settings.loc['Time']['start']) - 1 , \
+						int(time_settings.loc['Time']['end']) + 1)
+	tb=int(time_settings.loc['Time']['timebase']) #timebase of time dependent data
+	if aggregation is None:
+		weight = dict((t, 1) for t in timesteps[1:]) #every timestep represents itself
+		sto_fixed_timesteps = [timesteps[0], timesteps[-1]]
+	else:
+		#number of original timesteps represented by each timestep
+		weight = aggregation['weights'].to_dict()
+		#storage content is fixed at the boundaries of all representative periods
+		sto_fixed_timesteps = timesteps[::aggregation['period_length']]
+	year_factor = float(sum(weight.values())) * tb / (365 * 24 * 60 * 60) # multiple of a year: opt_time[s] / year [s]
+	p2e = float(tb) / 3600 # factor for converting power [kW] to energy [kWh] for one timestep
+	return timesteps, tb, weight, sto_fixed_timesteps, year_factor, p2e
+
+def set_mip_flags(data):
+# Deactivate irrelevant mip equations and adjust the process and storage 
+# parameters of deactivated mip equations (changes data in place)
+	mip_equations = data['mip-equations']
+	process = data['process']
+	process_commodity = data['process_commodity']
+	storage = data['storage']
+	
+	#Partload
+	if process['partload-min'].any() == 0:
+		mip_equations.loc['Partload']['Active']='no' #partload equations are irrelevant if "partload-min" = 0 for all processes
+	if mip_equations.loc['Partload']['Active']=='no':
+		#if "Partload" is deactivated, adjust process parameters
+		process['partload-min']=0
+		process['start-up-energy']=0
+		process_commodity['ratio-partload']=process_commodity['ratio']
+	elif mip_equations.loc['Partload']['Active']=='yes':
+		if process_commodity['ratio-partload'].isnull().any():
+			raise NotImplementedError("'ratio-partload' in sheet 'Process-Commodity' contains invalid values")
+	
+	#Min-Cap
+	if (process['cap-new-min'].any() or storage['cap-new-min-p'].any() or storage['cap-new-min-e'].any()) == 0:
+		mip_equations.loc['Min-Cap']['Active']='no' #partload equations are irrelevant if "partload-min" = 0 for all processes
+	if mip_equations.loc['Min-Cap']['Active']=='no':
+		#if "Min-Cap" is deactivated, adjust minimum capacity parameters
+		process['cap-new-min']=0
+		storage['cap-new-min-p']=0
+		storage['cap-new-min-e']=0
+
+def get_demandrate_intervals(ext_co, commodities, timesteps, tb, period_length=None):
+# Demand rate intervals of imported commodities
+# Returns {commodity: {last timestep of interval: timesteps of interval}}
+# only the last timestep of every interval gets a demand rate variable,
+# for aggregated timeseries intervals end at every representative period 
+# (period_length timesteps)
+	t_start = timesteps[0] + 1
+	demandrate_intervals = {}
+	for co in commodities:
+		t_rel = ext_co.loc[co]['time-interval-demand-rate']/tb #relation of power price and opt timebase
+		demandrate_intervals[co] = {}
+		t_0 = t_start
+		for t in timesteps[1:]:
+			period_end = period_length is not None and (t - t_start + 1) % period_length == 0
+			if (t%t_rel) == 0 or period_end:
+				demandrate_intervals[co][t] = np.arange(max(t_0, t-t_rel+1),t+1)
+				t_0 = t + 1
+	return demandrate_intervals
+
+def previous_timesteps(timesteps, period_length=None):
+# Previous timestep of every timestep except timestep zero; for aggregated 
+# timeseries the first timestep of every representative period (period_length
+# timesteps) follows the last timestep of the same period
+	previous = np.asarray(timesteps[1:]) - 1
+	if period_length is not None:
+		first = (previous - timesteps[0]) % period_length == 0
+		previous[first] += period_length
+	return previous
+
 def annuity_factor(n, i):
 # Calculate annuity factor from depreciation and interest.
 # n: depreciation period (years)
@@ -1253,32 +2180,1389 @@ def get_pro_outputs(process_commodity):
 		outputs = pd.Index([])
 	return outputs	
 	
-############################################################################################	
-#DATA PREPARE
-############################################################################################	
+def fix_capacities(prob, caps=None):
+	"""Fix new capacities of processes and storages in a model instance
+
+	Args:
+		prob: a ficus model instance
+		caps: dict with Series of new capacities (see get_entity) for 
+			'pro_cap_new', 'sto_cap_p_new' and 'sto_cap_e_new', defaults to 
+			no new capacities
+
+	Returns:
+		Nothing
+	"""
+	for name in ['pro_cap_new', 'sto_cap_p_new', 'sto_cap_e_new']:
+		cap_new = getattr(prob, name)
+		values = {} if caps is None else caps[name].to_dict()
+		for idx in cap_new:
+			value = values.get(idx)
+			cap_new[idx].fix(value if pd.notnull(value) else 0)
+	
+	# build decision follows from fixed capacity (only with "Min-Cap")
+	for name, cap_name in [('pro_cap_build', 'pro_cap_new'), ('sto_cap_build', 'sto_cap_e_new')]:
+		build = getattr(prob, name)
+		if isinstance(build, pyen.Var):
+			cap_new = getattr(prob, cap_name)
+			for idx in build:
+				build[idx].fix(1 if cap_new[idx].value > 0 else 0)
+
+# Constraints depending on the timeseries and parameters changeable by update_model
+_CAP_ABS_MAX_CONSTRAINTS = [
+	'pro_p_in_offset_lt', 'pro_p_in_offset_gt', 'pro_p_offset_in_ltzero_when_off', 
+	'pro_p_offset_in_gtzero_when_off', 'pro_p_out_offset_lt', 'pro_p_out_offset_gt', 
+	'pro_p_offset_out_ltzero_when_off', 'pro_p_offset_out_gtzero_when_off', 
+	'pro_p_flow_zero_when_off', 'pro_p_gt_partload', 'pro_p_startup_lt', 
+	'pro_p_startup_gt', 'pro_p_startup_zerowhenoff']
+UPDATE_CONSTRAINTS = {
+	('ext_import', None): ['cost_sum'],
+	('ext_export', None): ['cost_sum'],
+	('demand', None): ['co_power_balance', 'co_energy_consumption'],
+	('supim', None): ['pro_p_supim_input'],
+	('process', 'cap-installed'): ['pro_cap_abs'] + _CAP_ABS_MAX_CONSTRAINTS,
+	('process', 'cap-new-max'): ['pro_cap_new_max'] + _CAP_ABS_MAX_CONSTRAINTS,
+	('process', 'cap-new-min'): ['pro_cap_new_min'],
+	('process', 'cost-inv'): ['cost_sum'],
+	('process', 'cost-fix'): ['cost_sum'],
+	('process', 'cost-var'): ['cost_sum'],
+	('storage', 'cap-installed-p'): ['sto_cap_p_abs', 'sto_p_in_not_out', 'sto_p_out_not_in'],
+	('storage', 'cap-new-max-p'): ['sto_cap_p_new_max', 'sto_p_in_not_out', 'sto_p_out_not_in'],
+	('storage', 'cap-new-min-p'): ['sto_cap_p_new_min'],
+	('storage', 'cap-installed-e'): ['sto_cap_e_abs'],
+	('storage', 'cap-new-max-e'): ['sto_cap_e_new_max'],
+	('storage', 'cap-new-min-e'): ['sto_cap_e_new_min'],
+	('storage', 'cost-inv-p'): ['cost_sum'],
+	('storage', 'cost-inv-e'): ['cost_sum'],
+	('storage', 'cost-fix-p'): ['cost_sum'],
+	('storage', 'cost-fix-e'): ['cost_sum'],
+	('storage', 'cost-var'): ['cost_sum'],
+	('storage', 'eff-in'): ['sto_e_cont_def'],
+	('storage', 'eff-out'): ['sto_e_cont_def'],
+	('storage', 'self-discharge'): ['sto_e_cont_def']}
+
+def update_model(prob, ext_import=None, ext_export=None, demand=None, 
+				 supim=None, process=None, storage=None):
+	"""Change timeseries and parameters of a model instance without rebuilding it
+
+	Only the constraints depending on the changed data are constructed again
+	(see UPDATE_CONSTRAINTS). For models with mutable parameters (see 
+	create_model), only the values of the Params are changed. If the model is
+	attached to a persistent solver (see run_ficus), the changed constraints 
+	are replaced in the solver, too. Solve the changed model with resolve.
+	
+	Usage:
+		prob = run_ficus(input_file, opt='gurobi_persistent')
+		update_model(prob, ext_import=new_prices)
+		resolve(prob)
+	
+	Args:
+		prob: a ficus model instance
+		ext_import: DataFrame with new import prices (timesteps x commodities)
+		ext_export: DataFrame with new export prices (timesteps x commodities)
+		demand: DataFrame with new demand (timesteps x commodities)
+		supim: DataFrame with new supim profiles (timesteps x commodities)
+		process: DataFrame with new process parameters (index Process, Num)
+		storage: DataFrame with new storage parameters (index Storage, Commodity, Num)
+
+	Returns:
+		names of updated constraints
+	"""
+	changed = []
+	
+	#timeseries {commodity: {timestep: value}}
+	for key, df, lookup in [('ext_import', ext_import, prob.ext_import_dict),
+							('ext_export', ext_export, prob.ext_export_dict),
+							('demand', demand, prob.demand_dict),
+							('supim', supim, prob.supim_dict)]:
+		if df is None:
+			continue
+		for co in df.columns:
+			if co not in lookup:
+				raise ValueError("Unknown commodity '{}' in {}".format(co, key))
+			if prob.mutable:
+				values = df[co].loc[[t for t in df.index if t in lookup[co]]]
+				getattr(prob, key + '_param').store_values(
+					dict(((co, t), value) for t, value in values.iteritems()))
+			else:
+				lookup[co].update(df[co].to_dict())
+		if key in ('demand', 'supim'):
+			getattr(prob, key).update(df)
+		changed.append((key, None))
+	
+	#parameters {index tuple: {column: value}}
+	for key, df, lookup, param in [('process', process, prob.pro_dict, 'pro_param'),
+								   ('storage', storage, prob.sto_dict, 'sto_param')]:
+		if df is None:
+			continue
+		for col in df.columns:
+			if (key, col) not in UPDATE_CONSTRAINTS:
+				raise ValueError("Parameter '{}' of {} can not be updated".format(col, key))
+			changed.append((key, col))
+		if prob.mutable:
+			getattr(prob, param).store_values(dict(
+				(idx + (col,), value) for idx, values in df.to_dict('index').items() 
+				for col, value in values.items()))
+		else:
+			for idx, values in df.to_dict('index').items():
+				lookup[idx].update(values)
+			if key == 'process':
+				for values in lookup.values():
+					values['cap-abs-max'] = values['cap-installed'] + values['cap-new-max']
+	
+	names = []
+	for change in changed:
+		names.extend(name for name in UPDATE_CONSTRAINTS[change] 
+					 if hasattr(prob, name) and name not in names)
+	
+	optimizer = getattr(prob, 'optimizer', None)
+	persistent = optimizer is not None and is_persistent(optimizer)
+	for name in names:
+		con = getattr(prob, name)
+		if persistent:
+			for con_data in con.values():
+				optimizer.remove_constraint(con_data)
+		if not prob.mutable:
+			con.clear()
+			con.reconstruct()
+		if persistent:
+			for con_data in con.values():
+				optimizer.add_constraint(con_data)
+	prob._plot_data_cache = None # plot data of the unchanged model
+	return names
+
+def set_initial_values(prob, solution):
+	"""Set values of all variables to a previous solution (for warm start)
+
+	Binary variables missing in the previous solution are derived from it:
+	build decisions from new capacities, run mode from process outputs and
+	charge mode from storage inputs.
+	
+	Args:
+		prob: a ficus model instance
+		solution: a solved model instance (or RollingHorizonResult) or the 
+			path of a result file (see report) or a ResultFile
+
+	Returns:
+		number of variables with initial value
+	"""
+	var_names = list(list_entities(prob, 'var').index)
+	if isinstance(solution, (str, ResultFile)):
+		values = _read_resultfile_values(solution, var_names)
+	else:
+		values = {}
+		for name in var_names:
+			try:
+				values[name] = get_entity(solution, name)
+			except (AttributeError, KeyError):
+				pass
+	
+	#derive binaries
+	derived = [('pro_cap_build', 'pro_cap_new', None),
+			   ('sto_cap_build', 'sto_cap_e_new', None),
+			   ('pro_mode_run', 'pro_p_out', ['pro_name', 'pro_num', 't0']),
+			   ('sto_charge', 'sto_p_in', ['commodity', 't0'])]
+	for name, source, levels in derived:
+		if name in var_names and name not in values and source in values:
+			source = values[source].dropna()
+			if levels is not None and not source.empty:
+				source.index.names = source.index.names[:-1] + ['t0']
+				source = source.groupby(level=levels).sum()
+			values[name] = (source > 1e-6) * 1
+	
+	count = 0
+	for name in var_names:
+		if name not in values or values[name].empty:
+			continue
+		var = getattr(prob, name)
+		value_dict = values[name].to_dict()
+		for idx in var:
+			value = value_dict.get(idx)
+			if value is None or pd.isnull(value):
+				continue
+			if var[idx].is_integer() or var[idx].is_binary():
+				value = round(value)
+			var[idx].value = value
+			count += 1
+	return count
+
+def _read_resultfile_values(resultfile, var_names):
+	# values of all variables var_names in result file (see report) 
+	# returns {name: Series}
+	resultfile = _result_reader(resultfile)
+	values = {}
+	for sheet in ['Process caps', 'Storage caps', 'External timeseries', 
+				  'Process timeseries', 'Storage timeseries']:
+		df = resultfile.sheet(sheet).reset_index()
+		value_cols = [col for col in df.columns if col in var_names]
+		if df.empty or not value_cols:
+			continue
+		df = df.set_index([col for col in df.columns if col not in value_cols])
+		for col in value_cols:
+			values[col] = df[col]
+	return values
+
+"""Build Profile"""
+
+class ProfiledModel(pyen.ConcreteModel):
+	"""ConcreteModel recording the build time of its components
+
+	Components of a ConcreteModel are constructed, when they are added to the
+	model. So the time of add_component is the build time of a component. 
+	Implicit components (e.g. index sets of a Constraint) are counted to the
+	component creating them. See get_build_profile for the results.
+	"""
+	def __init__(self, *args, **kwds):
+		pyen.ConcreteModel.__init__(self, *args, **kwds)
+		self.build_times = [] # (component name, build time [s])
+		self._build_depth = 0
+		
+	def add_component(self, name, val):
+		self._build_depth += 1
+		t = time.time()
+		try:
+			pyen.ConcreteModel.add_component(self, name, val)
+		finally:
+			self._build_depth -= 1
+		if self._build_depth == 0:
+			self.build_times.append((name, time.time() - t))
+
+"""Matrix Model"""
+
+def create_matrix_model(data):
+	"""Create the model as sparse coefficient matrix without Pyomo
+
+	Assembles the same equations as create_model (one block of rows for every
+	Constraint) directly from the model data with NumPy arrays. This avoids
+	building a Pyomo expression for every constraint and is much faster for
+	long optimisation periods. Solve it with solve_matrix_model.
+
+	Args:
+		data: prepared model data (see prepare_modeldata)
+
+	Returns:
+		a MatrixModel instance
+	"""
+	# Preparations
+	# ============
+
+	#Model Data
+	timesteps, tb, weight, sto_fixed_timesteps, year_factor, p2e = time_parameters(data)
+	set_mip_flags(data)
+	mip_equations = data['mip-equations']
+	ext_co = data['ext-co']
+	ext_import = data['ext_import']
+	ext_export = data['ext_export']
+	demandrate_factor = data['demandrate_factor']
+	process = data['process']
+	process_commodity = data['process_commodity']
+	process_class = data['process_class']
+	storage = data['storage']
+	demand = data['demand']
+	supim = data['supim']
+	aggregation = data.get('aggregation')
+	if not process_class['Direction'].isin(['In', 'Out']).all():
+		raise ValueError("For 'Direction' in sheet 'Process-Class' only 'In' or 'Out' are valid inputs")
+
+	partload = mip_equations.loc['Partload']['Active'] == 'yes'
+	min_cap = mip_equations.loc['Min-Cap']['Active'] == 'yes'
+	sto_in_out = mip_equations.loc['Storage In-Out']['Active'] == 'yes'
+
+	ts = timesteps[1:] # timesteps without timestep zero
+	nt = len(ts)
+	w = np.array([weight[t] for t in ts], dtype=float)
+
+	#process inputs and outputs with position of their process
+	if len(process.index) > 0:
+		pro_in = process_commodity.xs('In', level='Direction')
+		pro_out = process_commodity.xs('Out', level='Direction')
+	else:
+		pro_in = pro_out = process_commodity.reset_index(level='Direction', drop=True)
+	in_pro = process.index.get_indexer(pro_in.index.droplevel(2))
+	out_pro = process.index.get_indexer(pro_out.index.droplevel(2))
+	in_co = pro_in.index.get_level_values(2)
+	out_co = pro_out.index.get_level_values(2)
+
+	#slope and offset for process input and output (see create_model)
+	r_in = pro_in['ratio'].values
+	r_out = pro_out['ratio'].values
+	partload_in = process['partload-min'].values[in_pro]
+	partload_out = process['partload-min'].values[out_pro]
+	in_slope = (r_in - pro_in['ratio-partload'].values * partload_in) / (1 - partload_in)
+	out_slope = (r_out - pro_out['ratio-partload'].values * partload_out) / (1 - partload_out)
+
+	#commodities
+	commodity = pd.Index(sorted(set(demand.columns) | set(process_commodity.index.get_level_values(2))
+								| set(ext_import.columns)))
+	co_consumed = pd.Index(sorted(set(demand.columns) | set(in_co)))
+	co_produced = pd.Index(sorted(set(out_co)))
+	co_storage = pd.Index(sorted(set(storage.index.get_level_values(1))))
+	sto_co = storage.index.get_level_values(1)
+
+	#demand rate intervals and previous timesteps (see create_model)
+	period_length = aggregation['period_length'] if aggregation is not None else None
+	demandrate_intervals = get_demandrate_intervals(ext_co, ext_import.columns, timesteps, tb,
+													period_length)
+	previous = previous_timesteps(timesteps, period_length) - timesteps[0]
+	demandrate_tuples = [(co, t) for co in ext_import.columns for t in sorted(demandrate_intervals[co])]
+
+	pro_names = ['pro_name', 'pro_num']
+	pro_co_names = ['pro_name', 'pro_num', 'commodity']
+	sto_names = ['storage_name', 'commodity', 'storage_num']
+	cost_types = ['Import', 'Export', 'Demand charges', 'Invest', 'Fix costs',
+				  'Var costs', 'Process fee', 'Pro subsidy']
+
+	#=========
+	#MODEL
+	#=========
+
+	m = MatrixModel()
+	m.inputfile = data['input_file']
+	m.demand = demand
+	m.supim = supim
+	m.tb = tb
+	m.timesteps = ts
+	if aggregation is None:
+		m.timestep_map = None
+	else:
+		m.timestep_map = aggregation['timestep_map']
+
+	##Variables##
+	##############
+	# column numbers of variables, time dependent variables as 2D array
+	# (element, timestep)
+
+	#commodity
+	co_e_consumed = m.add_variable('co_e_consumed', _matrix_index(co_consumed, ['commodity']))
+	co_e_produced = m.add_variable('co_e_produced', _matrix_index(co_produced, ['commodity']))
+
+	#power flow
+	pro_p_flow = m.add_variable(
+		'pro_p_flow', _matrix_index(process.index, pro_names + ['t0'], timesteps)).reshape(-1, nt + 1)
+	pro_p_in = m.add_variable(
+		'pro_p_in', _matrix_index(pro_in.index, pro_co_names + ['t0'], ts)).reshape(-1, nt)
+	pro_p_out = m.add_variable(
+		'pro_p_out', _matrix_index(pro_out.index, pro_co_names + ['t0'], ts)).reshape(-1, nt)
+	ext_p_in = m.add_variable(
+		'ext_p_in', _matrix_index(ext_import.columns, ['commodity', 't0'], ts)).reshape(-1, nt)
+	ext_p_out = m.add_variable(
+		'ext_p_out', _matrix_index(ext_export.columns, ['commodity', 't0'], ts)).reshape(-1, nt)
+	ext_demandrate_in = m.add_variable(
+		'ext_demandrate_in', _matrix_index(demandrate_tuples, ['commodity', 't0']))
+	ext_demandrate_max = m.add_variable(
+		'ext_demandrate_max', _matrix_index(ext_import.columns, ['commodity']))
+	sto_p_in = m.add_variable(
+		'sto_p_in', _matrix_index(storage.index, sto_names + ['t0'], ts)).reshape(-1, nt)
+	sto_p_out = m.add_variable(
+		'sto_p_out', _matrix_index(storage.index, sto_names + ['t0'], ts)).reshape(-1, nt)
+
+	#process
+	pro_cap = m.add_variable('pro_cap', _matrix_index(process.index, pro_names))
+	pro_cap_new = m.add_variable('pro_cap_new', _matrix_index(process.index, pro_names))
+	if min_cap:
+		pro_cap_build = m.add_variable('pro_cap_build', _matrix_index(process.index, pro_names), binary=True)
+	if partload:
+		pro_p_in_offset = m.add_variable(
+			'pro_p_in_offset', _matrix_index(pro_in.index, pro_co_names + ['t0'], ts),
+			lb=-np.inf).reshape(-1, nt)
+		pro_p_out_offset = m.add_variable(
+			'pro_p_out_offset', _matrix_index(pro_out.index, pro_co_names + ['t0'], ts),
+			lb=-np.inf).reshape(-1, nt)
+		pro_mode_run = m.add_variable(
+			'pro_mode_run', _matrix_index(process.index, pro_names + ['t0'], timesteps),
+			binary=True).reshape(-1, nt + 1)
+		pro_mode_startup = m.add_variable(
+			'pro_mode_startup', _matrix_index(process.index, pro_names + ['t0'], ts)).reshape(-1, nt)
+		pro_p_startup = m.add_variable(
+			'pro_p_startup', _matrix_index(pro_in.index, pro_co_names + ['t0'], ts)).reshape(-1, nt)
+
+	#process class
+	proclass_names = ['proclass_name', 'commodity']
+	proclass_cap = m.add_variable('proclass_cap', _matrix_index(process_class.index, proclass_names))
+	proclass_e_out = m.add_variable('proclass_e_out', _matrix_index(process_class.index, proclass_names))
+	proclass_e_in = m.add_variable('proclass_e_in', _matrix_index(process_class.index, proclass_names))
+
+	#storage
+	sto_cap_e = m.add_variable('sto_cap_e', _matrix_index(storage.index, sto_names))
+	sto_cap_e_new = m.add_variable('sto_cap_e_new', _matrix_index(storage.index, sto_names))
+	sto_cap_p = m.add_variable('sto_cap_p', _matrix_index(storage.index, sto_names))
+	sto_cap_p_new = m.add_variable('sto_cap_p_new', _matrix_index(storage.index, sto_names))
+	sto_e_cont = m.add_variable(
+		'sto_e_cont', _matrix_index(storage.index, sto_names + ['t0'], timesteps)).reshape(-1, nt + 1)
+	if min_cap:
+		sto_cap_build = m.add_variable('sto_cap_build', _matrix_index(storage.index, sto_names), binary=True)
+	if sto_in_out:
+		sto_charge = m.add_variable(
+			'sto_charge', _matrix_index(co_storage, ['commodity', 't0'], ts), binary=True).reshape(-1, nt)
+
+	#costs
+	costs = m.add_variable('costs', _matrix_index(cost_types, ['cost_type']), lb=-np.inf)
+
+	##Equations##
+	##############
+	# every constraint block: (row, column, coefficient) terms, rows as 2D
+	# array (element, timestep) for time dependent constraints
+
+	"""COMMODITY"""
+	rows = np.arange(len(co_consumed))
+	in_rows = co_consumed.get_indexer(in_co)
+	sto_mask = sto_co.isin(co_consumed)
+	sto_rows = co_consumed.get_indexer(sto_co[sto_mask])
+	demand_energy = (demand.loc[ts].multiply(w, axis=0).sum() * p2e).reindex(co_consumed).fillna(0)
+	m.add_constraint('co_energy_consumption', co_consumed, 'E', demand_energy.values, [
+		(rows, co_e_consumed, 1),
+		(in_rows[:, None], pro_p_in, -p2e * w),
+		(sto_rows[:, None], sto_p_in[sto_mask], -p2e * w),
+		(sto_rows[:, None], sto_p_out[sto_mask], p2e * w)])
+
+	m.add_constraint('co_energy_production', co_produced, 'E', 0, [
+		(np.arange(len(co_produced)), co_e_produced, 1),
+		(co_produced.get_indexer(out_co)[:, None], pro_p_out, -p2e * w)])
+
+	#power balance only for commodities with power flows
+	supim_mask = ~in_co.isin(supim.columns)
+	flows = pd.Index(sorted(set(in_co[supim_mask]) | set(out_co) | set(sto_co) |
+							set(ext_import.columns) | set(ext_export.columns)))
+	flows = commodity[commodity.isin(flows)]
+	rows = np.arange(len(flows) * nt).reshape(-1, nt)
+	balance_demand = demand.loc[ts].reindex(columns=flows).fillna(0)
+	m.add_constraint('co_power_balance', _matrix_index(flows, ['commodity', 't0'], ts), 'E',
+					 -balance_demand.values.T, [
+		(rows[flows.get_indexer(in_co[supim_mask])], pro_p_in[supim_mask], 1),
+		(rows[flows.get_indexer(out_co)], pro_p_out, -1),
+		(rows[flows.get_indexer(ext_import.columns)], ext_p_in, -1),
+		(rows[flows.get_indexer(ext_export.columns)], ext_p_out, 1),
+		(rows[flows.get_indexer(sto_co)], sto_p_in, 1),
+		(rows[flows.get_indexer(sto_co)], sto_p_out, -1)])
+
+	""" PROCESS """
+	n_pro = len(process.index)
+	rows = np.arange(n_pro)
+	t_rows = np.arange(n_pro * nt).reshape(-1, nt)
+	in_rows = np.arange(len(pro_in.index) * nt).reshape(-1, nt)
+	out_rows = np.arange(len(pro_out.index) * nt).reshape(-1, nt)
+	cap_abs_max = process['cap-abs-max'].values
+	pro_t_index = _matrix_index(process.index, pro_names + ['t0'], ts)
+	in_t_index = _matrix_index(pro_in.index, pro_co_names + ['t0'], ts)
+	out_t_index = _matrix_index(pro_out.index, pro_co_names + ['t0'], ts)
+
+	#initial
+	pro_t0_index = _matrix_index(process.index, pro_names + ['t0'], timesteps[:1])
+	m.add_constraint('pro_p_flow_init', pro_t0_index, 'E', process['initial-power'].values, [
+		(rows, pro_p_flow[:, 0], 1)])
+	if partload:
+		m.add_constraint('pro_mode_run_init', pro_t0_index, 'E', process['initial-run'].values, [
+			(rows, pro_mode_run[:, 0], 1)])
+
+	# capacity
+	m.add_constraint('pro_cap_abs', process.index, 'E', process['cap-installed'].values, [
+		(rows, pro_cap, 1), (rows, pro_cap_new, -1)])
+	if min_cap:
+		m.add_constraint('pro_cap_new_max', process.index, 'L', 0, [
+			(rows, pro_cap_new, 1), (rows, pro_cap_build, -process['cap-new-max'].values)])
+		m.add_constraint('pro_cap_new_min', process.index, 'G', 0, [
+			(rows, pro_cap_new, 1), (rows, pro_cap_build, -process['cap-new-min'].values)])
+	else:
+		m.add_constraint('pro_cap_new_max', process.index, 'L', process['cap-new-max'].values, [
+			(rows, pro_cap_new, 1)])
+		m.add_constraint('pro_cap_new_min', process.index, 'G', process['cap-new-min'].values, [
+			(rows, pro_cap_new, 1)])
+
+	#flow
+	m.add_constraint('pro_p_flow_max', pro_t_index, 'L', 0, [
+		(t_rows, pro_p_flow[:, 1:], 1), (t_rows, pro_cap[:, None], -1)])
+
+	#Supim
+	supim_mask = in_co.isin(supim.columns)
+	supim_in = supim.loc[ts, in_co[supim_mask]].values.T
+	m.add_constraint('pro_p_supim_input', in_t_index[supim_mask.repeat(nt)], 'L', 0, [
+		(in_rows[:supim_mask.sum()], pro_p_in[supim_mask], 1),
+		(in_rows[:supim_mask.sum()], pro_cap[in_pro[supim_mask], None],
+		 -supim_in * r_in[supim_mask, None])])
+
+	# in
+	terms = [(in_rows, pro_p_in, 1), (in_rows, pro_p_flow[in_pro, 1:], -in_slope[:, None])]
+	if partload:
+		terms += [(in_rows, pro_p_in_offset, -1), (in_rows, pro_p_startup, -1)]
+	m.add_constraint('pro_p_input', in_t_index, 'E', 0, terms)
+
+	#out
+	terms = [(out_rows, pro_p_out, 1), (out_rows, pro_p_flow[out_pro, 1:], -out_slope[:, None])]
+	if partload:
+		terms += [(out_rows, pro_p_out_offset, -1)]
+	m.add_constraint('pro_p_output', out_t_index, 'E', 0, terms)
+
+	if partload:
+		#offset in/out
+		for direction, rows_, offset, pro, r, slope, index in [
+				('in', in_rows, pro_p_in_offset, in_pro, r_in, in_slope, in_t_index),
+				('out', out_rows, pro_p_out_offset, out_pro, r_out, out_slope, out_t_index)]:
+			offset_spec = (r - slope)[:, None]
+			big_m = (cap_abs_max[pro] * r)[:, None]
+			cap = pro_cap[pro, None]
+			run = pro_mode_run[pro, 1:]
+			m.add_constraint('pro_p_{}_offset_lt'.format(direction), index, 'L', big_m, [
+				(rows_, offset, 1), (rows_, cap, -offset_spec), (rows_, run, big_m)])
+			m.add_constraint('pro_p_{}_offset_gt'.format(direction), index, 'G', -big_m, [
+				(rows_, offset, 1), (rows_, cap, -offset_spec), (rows_, run, -big_m)])
+			m.add_constraint('pro_p_offset_{}_ltzero_when_off'.format(direction), index, 'L', 0, [
+				(rows_, offset, 1), (rows_, run, -big_m)])
+			m.add_constraint('pro_p_offset_{}_gtzero_when_off'.format(direction), index, 'G', 0, [
+				(rows_, offset, 1), (rows_, run, big_m)])
+
+		# mode
+		big_m = cap_abs_max[:, None]
+		m.add_constraint('pro_p_flow_zero_when_off', pro_t_index, 'L', 0, [
+			(t_rows, pro_p_flow[:, 1:], 1), (t_rows, pro_mode_run[:, 1:], -big_m)])
+		m.add_constraint('pro_p_gt_partload', pro_t_index, 'G', -big_m, [
+			(t_rows, pro_p_flow[:, 1:], 1),
+			(t_rows, pro_cap[:, None], -process['partload-min'].values[:, None]),
+			(t_rows, pro_mode_run[:, 1:], -big_m)])
+
+		#switch on losses
+		m.add_constraint('pro_mode_start_up1', pro_t_index, 'G', 0, [
+			(t_rows, pro_mode_startup, 1), (t_rows, pro_mode_run[:, 1:], -1),
+			(t_rows, pro_mode_run[:, previous], 1)])
+		m.add_constraint('pro_mode_start_up2', pro_t_index, 'L', 0, [
+			(t_rows, pro_mode_startup, 1), (t_rows, pro_mode_run[:, 1:], -1)])
+		m.add_constraint('pro_mode_start_up3', pro_t_index, 'L', 1, [
+			(t_rows, pro_mode_startup, 1), (t_rows, pro_mode_run[:, previous], 1)])
+
+		startup_spec = (process['start-up-energy'].values[in_pro] / p2e * r_in)[:, None]
+		big_m = startup_spec * cap_abs_max[in_pro, None]
+		cap = pro_cap[in_pro, None]
+		startup = pro_mode_startup[in_pro]
+		m.add_constraint('pro_p_startup_lt', in_t_index, 'L', big_m, [
+			(in_rows, pro_p_startup, 1), (in_rows, cap, -startup_spec), (in_rows, startup, big_m)])
+		m.add_constraint('pro_p_startup_gt', in_t_index, 'G', -big_m, [
+			(in_rows, pro_p_startup, 1), (in_rows, cap, -startup_spec), (in_rows, startup, -big_m)])
+		m.add_constraint('pro_p_startup_zerowhenoff', in_t_index, 'L', 0, [
+			(in_rows, pro_p_startup, 1), (in_rows, startup, -big_m)])
+
+	"""PROCESS CLASS"""
+	rows = np.arange(len(process_class.index))
+	pro_class = process['class'].values
+	in_class = process_class.index.get_indexer(pd.MultiIndex.from_arrays([pro_class[in_pro], in_co]))
+	out_class = process_class.index.get_indexer(pd.MultiIndex.from_arrays([pro_class[out_pro], out_co]))
+	in_mask = in_class >= 0
+	out_mask = out_class >= 0
+
+	# CALCULATIONS
+	m.add_constraint('proclass_cap_sum', process_class.index, 'E', 0, [
+		(rows, proclass_cap, 1),
+		(out_class[out_mask], pro_cap[out_pro[out_mask]], -r_out[out_mask]),
+		(in_class[in_mask], pro_cap[in_pro[in_mask]], -r_in[in_mask])])
+	m.add_constraint('proclass_e_out_sum', process_class.index, 'E', 0, [
+		(rows, proclass_e_out, 1),
+		(out_class[out_mask, None], pro_p_out[out_mask], -p2e * w)])
+	m.add_constraint('proclass_e_in_sum', process_class.index, 'E', 0, [
+		(rows, proclass_e_in, 1),
+		(in_class[in_mask, None], pro_p_in[in_mask], -p2e * w)])
+
+	# CONSTRAINTS
+	m.add_constraint('proclass_cap_max', process_class.index, 'L', process_class['cap-max'].values, [
+		(rows, proclass_cap, 1)])
+	m.add_constraint('proclass_e_max', process_class.index, 'L',
+					 process_class['energy-max'].values * year_factor, [
+		(rows, np.where(process_class['Direction'] == 'In', proclass_e_in, proclass_e_out), 1)])
+
+	"""STORAGE"""
+	rows = np.arange(len(storage.index))
+	t_rows = np.arange(len(storage.index) * nt).reshape(-1, nt)
+	sto_t_index = _matrix_index(storage.index, sto_names + ['t0'], ts)
+
+	#initial
+	fixed = np.asarray(sto_fixed_timesteps)
+	soc = np.repeat(storage['initial-soc'].values[:, None], len(fixed), axis=1)
+	if 'final-soc' in storage.columns:
+		#final content differs from initial content (see run_rolling_horizon)
+		soc[:, fixed == timesteps[-1]] = storage['final-soc'].values[:, None]
+	fixed_rows = np.arange(len(storage.index) * len(fixed)).reshape(-1, len(fixed))
+	m.add_constraint('sto_e_cont_init', _matrix_index(storage.index, sto_names + ['t0'], fixed), 'E', 0, [
+		(fixed_rows, sto_e_cont[:, fixed - timesteps[0]], 1), (fixed_rows, sto_cap_e[:, None], -soc)])
+
+	# capacity
+	for cap, cap_new, unit in [(sto_cap_e, sto_cap_e_new, 'e'), (sto_cap_p, sto_cap_p_new, 'p')]:
+		m.add_constraint('sto_cap_{}_abs'.format(unit), storage.index, 'E',
+						 storage['cap-installed-{}'.format(unit)].values, [
+			(rows, cap, 1), (rows, cap_new, -1)])
+		if min_cap:
+			m.add_constraint('sto_cap_{}_new_max'.format(unit), storage.index, 'L', 0, [
+				(rows, cap_new, 1), (rows, sto_cap_build, -storage['cap-new-max-{}'.format(unit)].values)])
+			m.add_constraint('sto_cap_{}_new_min'.format(unit), storage.index, 'G', 0, [
+				(rows, cap_new, 1), (rows, sto_cap_build, -storage['cap-new-min-{}'.format(unit)].values)])
+		else:
+			m.add_constraint('sto_cap_{}_new_max'.format(unit), storage.index, 'L',
+							 storage['cap-new-max-{}'.format(unit)].values, [(rows, cap_new, 1)])
+			m.add_constraint('sto_cap_{}_new_min'.format(unit), storage.index, 'G',
+							 storage['cap-new-min-{}'.format(unit)].values, [(rows, cap_new, 1)])
+	m.add_constraint('sto_cap_p_c_relation', storage.index, 'L', 0, [
+		(rows, sto_cap_p, 1), (rows, sto_cap_e, -storage['max-p-e-ratio'].values)])
+
+	#in-out
+	m.add_constraint('sto_p_in_max', sto_t_index, 'L', 0, [
+		(t_rows, sto_p_in, 1), (t_rows, sto_cap_p[:, None], -1)])
+	m.add_constraint('sto_p_out_max', sto_t_index, 'L', 0, [
+		(t_rows, sto_p_out, 1), (t_rows, sto_cap_p[:, None], -1)])
+	if sto_in_out:
+		cap_max = (storage['cap-new-max-p'].values + storage['cap-installed-p'].values)[:, None]
+		charge = sto_charge[co_storage.get_indexer(sto_co)]
+		m.add_constraint('sto_p_in_not_out', sto_t_index, 'L', 0, [
+			(t_rows, sto_p_in, 1), (t_rows, charge, -cap_max)])
+		m.add_constraint('sto_p_out_not_in', sto_t_index, 'L', cap_max, [
+			(t_rows, sto_p_out, 1), (t_rows, charge, cap_max)])
+
+	#Energy Content
+	m.add_constraint('sto_e_cont_def', sto_t_index, 'E', 0, [
+		(t_rows, sto_e_cont[:, 1:], 1),
+		(t_rows, sto_e_cont[:, :-1], -(1 - storage['self-discharge'].values[:, None] * p2e)),
+		(t_rows, sto_p_in, -storage['eff-in'].values[:, None] * p2e),
+		(t_rows, sto_p_out, 1 / storage['eff-out'].values[:, None] * p2e)])
+	m.add_constraint('sto_e_cont_max', sto_t_index, 'L', 0, [
+		(t_rows, sto_e_cont[:, 1:], 1), (t_rows, sto_cap_e[:, None], -storage['DOD'].values[:, None])])
+
+	# CHARGE CYCLES
+	m.add_constraint('sto_max_cycle', storage.index, 'L', 0, [
+		(rows[:, None], sto_p_in, p2e * w),
+		(rows, sto_cap_e, -(storage['DOD'] * storage['cycles-max'] * year_factor / storage['lifetime']).values)])
+
+	"""GRID"""
+	rows = np.arange(len(ext_import.columns))
+	t_rows = np.arange(len(ext_import.columns) * nt).reshape(-1, nt)
+	ext_co_in = ext_co.loc[ext_import.columns]
+	m.add_constraint('ext_p_in_max', _matrix_index(ext_import.columns, ['commodity', 't0'], ts), 'L',
+					 ext_co_in['import-max'].values[:, None], [(t_rows, ext_p_in, 1)])
+	m.add_constraint('ext_p_out_max', _matrix_index(ext_export.columns, ['commodity', 't0'], ts), 'L',
+					 ext_co.loc[ext_export.columns, 'export-max'].values[:, None], [
+		(np.arange(len(ext_export.columns) * nt).reshape(-1, nt), ext_p_out, 1)])
+
+	m.add_constraint('demandrate_initial_max', ext_import.columns, 'G', ext_co_in['p-max-initial'].values, [
+		(rows, ext_demandrate_max, 1)])
+
+	demandrate_index = _matrix_index(demandrate_tuples, ['commodity', 't0'])
+	demandrate_co = ext_import.columns.get_indexer([co for co, t in demandrate_tuples])
+	demandrate_rows = np.arange(len(demandrate_tuples))
+	m.add_constraint('demandrate_in_def_max', demandrate_index, 'G', 0, [
+		(demandrate_rows, ext_demandrate_max[demandrate_co], 1),
+		(demandrate_rows, ext_demandrate_in, -1)])
+
+	#sum of import power over every demand rate interval
+	intervals = [demandrate_intervals[co][t].astype(int) for co, t in demandrate_tuples]
+	lengths = np.array([len(tg) for tg in intervals], dtype=int)
+	t_rel = (ext_co_in['time-interval-demand-rate'].values / tb)[demandrate_co]
+	factor = np.array([demandrate_factor.loc[t, co] for co, t in demandrate_tuples], dtype=float)
+	if intervals:
+		interval_cols = ext_p_in[demandrate_co.repeat(lengths), np.concatenate(intervals) - ts[0]]
+	else:
+		interval_cols = np.zeros(0, dtype=int)
+	m.add_constraint('demandrate_in_tb', demandrate_index, 'E', 0, [
+		(demandrate_rows, ext_demandrate_in, 1),
+		(demandrate_rows.repeat(lengths), interval_cols, -(factor / t_rel).repeat(lengths))])
+
+	weight_dr = np.array([weight[t] for co, t in demandrate_tuples], dtype=float)
+	m.add_constraint('ext_min_operation_hours', ext_import.columns, 'G', 0, [
+		(demandrate_co, ext_demandrate_in, p2e * weight_dr),
+		(rows, ext_demandrate_max, -ext_co_in['operating-hours-min'].values * year_factor)])
+
+	"""Cost Function"""
+	terms = []
+	cost_row = dict((cost_type, k) for k, cost_type in enumerate(cost_types))
+	terms.append((np.arange(len(cost_types)), costs, 1))
+
+	#Investment costs for new capacity = new_cap * inv_costs
+	terms += [(cost_row['Invest'], pro_cap_new, -(process['cost-inv'] * process['annuity_factor']).values),
+			  (cost_row['Invest'], sto_cap_p_new, -(storage['cost-inv-p'] * storage['annuity_factor']).values),
+			  (cost_row['Invest'], sto_cap_e_new, -(storage['cost-inv-e'] * storage['annuity_factor']).values)]
+
+	#operation independent costs = capacity * cost_fix
+	terms += [(cost_row['Fix costs'], pro_cap, -process['cost-fix'].values),
+			  (cost_row['Fix costs'], sto_cap_p, -storage['cost-fix-p'].values),
+			  (cost_row['Fix costs'], sto_cap_e, -storage['cost-fix-e'].values)]
+
+	# Variable costs dependent on energy through process/storage = sum(t)[cost_var * energy(t)]
+	terms += [(cost_row['Var costs'], pro_p_flow[:, 1:],
+			   -process['cost-var'].values[:, None] * p2e * w / year_factor),
+			  (cost_row['Var costs'], sto_p_in, -storage['cost-var'].values[:, None] * p2e * w / year_factor),
+			  (cost_row['Var costs'], sto_p_out, -storage['cost-var'].values[:, None] * p2e * w / year_factor)]
+
+	#costs for external import/export = sum(t) [+- p_ext * price(t)]
+	terms += [(cost_row['Import'], ext_p_in, -ext_import.loc[ts].values.T * p2e * w / year_factor),
+			  (cost_row['Export'], ext_p_out, ext_export.loc[ts].values.T * p2e * w / year_factor)]
+
+	# Costs for grid use = p_max * power_price
+	terms.append((cost_row['Demand charges'], ext_demandrate_max, -ext_co_in['demand-rate'].values))
+
+	# Costs for process fee and process subsidies
+	proclass_e = np.where(process_class['Direction'] == 'In', proclass_e_in, proclass_e_out)
+	fee = process_class['fee'].values
+	terms += [(cost_row['Process fee'], proclass_e[fee > 0], -fee[fee > 0] / year_factor),
+			  (cost_row['Pro subsidy'], proclass_e[fee < 0], -fee[fee < 0] / year_factor)]
+	m.add_constraint('cost_sum', _matrix_index(cost_types, ['cost_type']), 'E', 0, terms)
+
+	#OBJECTIVE
+	m.add_objective([(costs, 1)])
+
+	return m
+
+def solve_matrix_model(prob, optimizer, tee=True):
+	"""Solve a matrix model with a solver reading MPS files
+
+	Writes the model to a temporary MPS file (see MatrixModel.write_mps) and
+	solves it. Load the results with prob.load_solution(result).
+
+	Args:
+		prob: a MatrixModel instance (see create_matrix_model)
+		optimizer: a solver reading MPS files (e.g. glpk, cbc, gurobi or
+			cplex, see get_optimizer)
+		tee: set to FALSE, to hide the solver output
+
+	Returns:
+		result: solver results
+	"""
+	import tempfile
+	handle, mps_file = tempfile.mkstemp(suffix='.mps')
+	os.close(handle)
+	try:
+		prob.write_mps(mps_file)
+		result = optimizer.solve(mps_file, tee=tee)
+	finally:
+		os.remove(mps_file)
+	return result
+
+def _matrix_index(index, names, timesteps=None):
+# Index of a block of variables/constraints with index names like get_entity
+# index: index tuples (or single values)
+# timesteps: if given, every index tuple is combined with every timestep
+	if not isinstance(index, pd.Index):
+		index = pd.Index(index)
+	if len(index) == 0:
+		levels = [[]] * len(names)
+	else:
+		levels = [index.get_level_values(i) for i in range(index.nlevels)]
+		if timesteps is not None:
+			levels = [np.repeat(level, len(timesteps)) for level in levels]
+			levels.append(np.tile(timesteps, len(index)))
+	if len(names) == 1:
+		return pd.Index(levels[0], name=names[0])
+	return pd.MultiIndex.from_arrays(levels, names=names)
+
+class MatrixModel(object):
+	"""Model as sparse coefficient matrix (see create_matrix_model)
+
+	Variables and constraints are added in blocks, named like the Vars and
+	Constraints of create_model. Every variable is a column, every constraint
+	a row of the coefficient matrix. After loading a solution, the values of
+	all variables are provided like a model instance to get_entity, report
+	and the plot functions.
+	"""
+	def __init__(self):
+		self.name = 'ficus'
+		self.variables = {} # name: (column numbers, index)
+		self.constraints = {} # name: (row numbers, index)
+		self.entities = {}
+		self.n_cols = 0
+		self.n_rows = 0
+		self.objective_value = None
+		self._bounds = [] # (lower bound, upper bound, binary) of all blocks
+		self._entries = [] # (row, column, coefficient) of all blocks
+		self._rhs = [] # (sense, right hand side) of all blocks
+		self._objective = [] # (column, coefficient)
+
+	def add_variable(self, name, index, lb=0, ub=np.inf, binary=False):
+		"""Add a block of variables
+
+		Args:
+			name: name of the block
+			index: index of the block (see get_entity), one variable per element
+			lb, ub: lower and upper bound of all variables
+			binary: set to TRUE for binary variables
+
+		Returns:
+			column numbers of the variables
+		"""
+		cols = np.arange(self.n_cols, self.n_cols + len(index))
+		self.n_cols += len(index)
+		self.variables[name] = (cols, index)
+		if binary:
+			lb, ub = 0, 1
+		self._bounds.append((np.full(len(index), lb, dtype=float),
+							 np.full(len(index), ub, dtype=float),
+							 np.full(len(index), binary, dtype=bool)))
+		return cols
+
+	def add_constraint(self, name, index, sense, rhs, terms):
+		"""Add a block of constraints sum(coefficient * variable) sense rhs
+
+		Constraints with infinite right hand side (no limit) are dropped.
+
+		Args:
+			name: name of the block
+			index: index of the block, one constraint per element
+			sense: 'E' (==), 'L' (<=) or 'G' (>=)
+			rhs: right hand side, scalar or array with one value per 
+				constraint or per index tuple (repeated for all timesteps)
+			terms: list of (row, column, coefficient) arrays, which are
+				broadcasted to a common shape. Row is the position of the
+				constraint in index, column the column number of a variable
+		"""
+		rhs = np.asarray(rhs, dtype=float).ravel()
+		if 0 < rhs.size != len(index):
+			rhs = np.repeat(rhs, len(index) // rhs.size)
+		keep = np.isfinite(rhs)
+		new_row = np.cumsum(keep) - 1 + self.n_rows
+		for row, col, coef in terms:
+			row, col, coef = [a.ravel() for a in np.broadcast_arrays(row, col, coef)]
+			row = row.astype(int)
+			mask = keep[row]
+			self._entries.append((new_row[row[mask]], col[mask].astype(int), coef[mask].astype(float)))
+		n = int(keep.sum())
+		self.constraints[name] = (np.arange(self.n_rows, self.n_rows + n), index[keep])
+		self._rhs.append((np.full(n, sense, dtype='U1'), rhs[keep]))
+		self.n_rows += n
+
+	def add_objective(self, terms):
+		"""Add terms to the objective (minimised)
+
+		Args:
+			terms: list of (column, coefficient) arrays
+		"""
+		for col, coef in terms:
+			col, coef = [a.ravel() for a in np.broadcast_arrays(col, coef)]
+			self._objective.append((col.astype(int), coef.astype(float)))
+
+	def get_matrix(self):
+		"""Return the model as coefficient matrix and vectors
+
+		Returns:
+			(A, sense, rhs, c, lb, ub, binary): sparse coefficient matrix A 
+			(scipy.sparse.csc_matrix, duplicate entries summed up), sense 
+			and right hand side of every row, objective coefficients, bounds 
+			and binary flags of every column
+		"""
+		import scipy.sparse
+		rows, cols, coefs = [np.concatenate([e[k] for e in self._entries] or [[]]) for k in range(3)]
+		A = scipy.sparse.coo_matrix((coefs, (rows.astype(int), cols.astype(int))),
+									shape=(self.n_rows, self.n_cols)).tocsc()
+		A.eliminate_zeros()
+		sense, rhs = [np.concatenate([r[k] for r in self._rhs] or [[]]) for k in range(2)]
+		lb, ub, binary = [np.concatenate([b[k] for b in self._bounds] or [[]]) for k in range(3)]
+		c = np.zeros(self.n_cols)
+		for col, coef in self._objective:
+			np.add.at(c, col, coef)
+		return A, sense, rhs, c, lb, ub, binary.astype(bool)
+
+	def write_mps(self, filename):
+		"""Write the model to a file in free MPS format
+
+		Variables are named x<column number>, constraints c<row number>.
+
+		Args:
+			filename: path of the MPS file
+		"""
+		A, sense, rhs, c, lb, ub, binary = self.get_matrix()
+
+		# matrix and objective entries, sorted by column
+		cols = np.repeat(np.arange(self.n_cols), np.diff(A.indptr))
+		rows = np.char.add('c', A.indices.astype(str))
+		unused = (np.diff(A.indptr) == 0) & (c == 0) # columns must appear at least once
+		obj_cols = np.flatnonzero((c != 0) | unused)
+		order = np.argsort(np.concatenate([cols, obj_cols]), kind='mergesort')
+		entries = _mps_lines('    ',
+							 np.char.add('x', np.concatenate([cols, obj_cols]).astype(str))[order],
+							 np.concatenate([rows, np.full(len(obj_cols), 'obj')])[order],
+							 _mps_values(np.concatenate([A.data, c[obj_cols]]))[order])
+
+		# right hand side and bounds
+		rhs_rows = np.flatnonzero(rhs)
+		rhs_lines = _mps_lines('    ', 'RHS', np.char.add('c', rhs_rows.astype(str)), _mps_values(rhs[rhs_rows]))
+		names = np.char.add('x', np.arange(self.n_cols).astype(str))
+		free = ~binary & (lb == -np.inf)
+		lower = ~binary & np.isfinite(lb) & (lb != 0)
+		upper = ~binary & np.isfinite(ub)
+		bounds = [_mps_lines('', 'BV', 'BOUND', names[binary]),
+				  _mps_lines('', 'FR', 'BOUND', names[free]),
+				  _mps_lines('', 'LO', 'BOUND', names[lower], _mps_values(lb[lower])),
+				  _mps_lines('', 'UP', 'BOUND', names[upper], _mps_values(ub[upper]))]
+
+		with open(filename, 'w') as f:
+			f.write('NAME {}\nOBJSENSE\n MIN\nROWS\n N  obj\n'.format(self.name))
+			f.write(_mps_lines('', sense, np.char.add('c', np.arange(self.n_rows).astype(str))))
+			f.write('COLUMNS\n')
+			f.write(entries)
+			f.write('RHS\n')
+			f.write(rhs_lines)
+			f.write('BOUNDS\n')
+			f.write(''.join(bounds))
+			f.write('ENDATA\n')
+
+	def load_solution(self, result):
+		"""Load the values of all variables from solver results
+
+		Args:
+			result: solver results of the MPS file (see solve_matrix_model)
+		"""
+		if result.solver.termination_condition not in (TerminationCondition.optimal, 
+													   TerminationCondition.feasible):
+			raise ValueError('No solution found: {}'.format(result.solver.termination_condition))
+		values = result.solution(0).variable
+		names = [name for name in values if name.startswith('x')]
+		x = np.zeros(self.n_cols)
+		x[[int(name[1:]) for name in names]] = [values[name]['Value'] for name in names]
+		self.set_values(x)
+
+	def set_values(self, x):
+		"""Set the values of all variables
+
+		Args:
+			x: array with the value of every column
+		"""
+		for name, (cols, index) in self.variables.items():
+			self.entities[name] = pd.Series(x[cols], index=index, name=name)
+		self.entities['t'] = pd.Series(1, index=pd.Index(self.timesteps, name='t'), name='t_')
+		self.objective_value = sum((x[col] * coef).sum() for col, coef in self._objective)
+
+def _mps_lines(indent, *fields):
+# Lines of a MPS file with given fields (arrays or single strings)
+	fields = [np.asarray(field).astype(str) for field in fields]
+	lines = fields[0]
+	for field in fields[1:]:
+		lines = np.char.add(np.char.add(lines, ' '), field)
+	lines = np.char.add(indent + ' ', lines).ravel()
+	return ''.join(np.char.add(lines, '\n'))
+
+def _mps_values(values):
+# MPS representation of values
+	return np.char.mod('%.17g', values)
+
+############################################################################################	
+#DATA PREPARE
+############################################################################################	
+
+# Tables of input data: (key in xls_data, sheet name in input file, index columns)
+INPUT_SHEETS = [
+	('time-settings', 'Time-Settings', ['Info']),
+	('mip-equations', 'MIP-Equations', ['Equations']),
+	('ext-co', 'Ext-Commodities', ['Commodity']),
+	('ext_import', 'Ext-Import', ['Time']),
+	('ext_export', 'Ext-Export', ['Time']),
+	('demandrate_factor', 'Demand-Rate-Factor', ['Time']),
+	('process', 'Process', ['Process']),
+	('process_commodity', 'Process-Commodity', ['Process','Commodity','Direction']),
+	('process_class', 'Process-Class', ['Class','Commodity']),
+	('storage', 'Storage', ['Storage','Commodity']),
+	('demand', 'Demand', ['Time']),
+	('supim', 'SupIm', ['Time'])]
+
+# Time dependent input data, reduced to representative periods by aggregate_timeseries
+TIMESERIES = ['demand', 'supim', 'ext_import', 'ext_export', 'demandrate_factor']
+
+def read_inputdata(input_file, cache=False, cache_dir=None):
+	"""Read input data from excel file, csv directory or HDF5 file 
+	
+	Args:
+		input_file: path of excel input file, of directory with one csv (or 
+			parquet) file per sheet (see read_csvdata) or of HDF5 file (.h5, 
+			.hdf5) with one table per sheet (see read_hdfdata)
+		cache: cache parsed excel file (see read_xlsdata)
+		cache_dir: directory of cache file (see read_xlsdata)
+	
+	Returns:
+		xls_data: dictionary with path of input file and DataFrames of all sheets
+	"""
+	if os.path.isdir(input_file):
+		return read_csvdata(input_file)
+	elif os.path.splitext(input_file)[1].lower() in ('.h5', '.hdf5'):
+		return read_hdfdata(input_file)
+	else:
+		return read_xlsdata(input_file, cache=cache, cache_dir=cache_dir)
+	
+def read_xlsdata(input_file, cache=False, cache_dir=None):
+	"""Read sheets of excel file and put them in one dictionary xls_data
+	
+	Args:
+		input_file: path of input file
+		cache: if True, parsed sheets are stored in a binary HDF5 cache file 
+			and read from there in later runs, as long as the content of 
+			input_file is unchanged (requires PyTables)
+		cache_dir: directory of the cache file, defaults to directory of input_file
+	
+	Returns:
+		xls_data: dictionary with path of input file and DataFrames of all sheets
+	"""
+	if cache:
+		cache_file = get_cache_file(input_file, cache_dir)
+		input_hash = _file_hash(input_file)
+		xls_data = _read_cache(cache_file, input_hash)
+		if xls_data is not None:
+			xls_data.update({'input_file' : input_file})
+			return xls_data
 	
-def read_xlsdata(input_file):
-# read sheets of excel file and put them in one dictionary xls_data
 	xls = pd.ExcelFile(input_file) # read excel file
 	
 	xls_data = {} # create dictionary
 	
 	xls_data.update({'input_file' : input_file})
-	xls_data.update({'time-settings' : xls.parse('Time-Settings').set_index(['Info']) })
-	xls_data.update({'mip-equations' : xls.parse('MIP-Equations').set_index(['Equations']) })
-	xls_data.update({'ext-co' : xls.parse('Ext-Commodities').set_index(['Commodity']) })
-	xls_data.update({'ext_import' : xls.parse('Ext-Import').set_index(['Time']) })
-	xls_data.update({'ext_export' : xls.parse('Ext-Export').set_index(['Time']) })
-	xls_data.update({'demandrate_factor' : xls.parse('Demand-Rate-Factor').set_index(['Time']) })
-	xls_data.update({'process' : xls.parse('Process').set_index(['Process']) })
-	xls_data.update({'process_commodity' : xls.parse('Process-Commodity').set_index(['Process','Commodity','Direction']) })
-	xls_data.update({'process_class' : xls.parse('Process-Class').set_index(['Class','Commodity']) })
-	xls_data.update({'storage' : xls.parse('Storage').set_index(['Storage','Commodity']) })
-	xls_data.update({'demand' : xls.parse('Demand').set_index(['Time']) })
-	xls_data.update({'supim' : xls.parse('SupIm').set_index(['Time']) })
+	for key, sheet, index in INPUT_SHEETS:
+		xls_data.update({key : xls.parse(sheet).set_index(index) })
+	
+	if cache:
+		_write_cache(cache_file, input_hash, xls_data)
+	
+	return xls_data
+
+def get_cache_file(input_file, cache_dir=None):
+	"""Return path of the cache file for given input file
+	
+	Args:
+		input_file: path of input file
+		cache_dir: directory of the cache file, defaults to directory of input_file
+	
+	Returns:
+		cache_file: path of cache file ("INPUTFILE.cache.h5")
+	"""
+	if cache_dir is None:
+		cache_dir = os.path.dirname(os.path.abspath(input_file))
+	elif not os.path.exists(cache_dir):
+		os.makedirs(cache_dir)
+	return os.path.join(cache_dir, os.path.basename(input_file) + '.cache.h5')
+
+def read_csvdata(input_dir):
+	"""Read input data from a directory with one file per sheet
+	
+	Every sheet of the excel input file is given as "SHEETNAME.csv" (e.g. 
+	"Process-Commodity.csv") with the same columns as the sheet. Instead of a 
+	csv file, a "SHEETNAME.parquet" file can be given (requires pandas >= 0.21 
+	and pyarrow or fastparquet). Csv files are memory mapped while parsing.
+	
+	Args:
+		input_dir: directory with input files
+	
+	Returns:
+		xls_data: dictionary with path of input_dir and DataFrames of all sheets
+	"""
+	xls_data = {} # create dictionary
+	
+	xls_data.update({'input_file' : os.path.normpath(input_dir)})
+	for key, sheet, index in INPUT_SHEETS:
+		parquet_file = os.path.join(input_dir, sheet + '.parquet')
+		if os.path.exists(parquet_file):
+			df = pd.read_parquet(parquet_file)
+		else:
+			df = pd.read_csv(os.path.join(input_dir, sheet + '.csv'), memory_map=True)
+		xls_data.update({key : df.set_index(index) })
+	
+	return xls_data
+
+def read_hdfdata(input_file):
+	"""Read input data from HDF5 file with one table per sheet
+	
+	Every sheet of the excel input file is stored as DataFrame with the same 
+	columns as the sheet. The key of the table is the sheet name with "_" 
+	instead of "-" (e.g. "Process_Commodity"). Requires PyTables.
+	
+	Args:
+		input_file: path of HDF5 file
+	
+	Returns:
+		xls_data: dictionary with path of input file and DataFrames of all sheets
+	"""
+	xls_data = {} # create dictionary
+	
+	xls_data.update({'input_file' : input_file})
+	with pd.HDFStore(input_file, mode='r') as store:
+		for key, sheet, index in INPUT_SHEETS:
+			xls_data.update({key : store[sheet.replace('-', '_')].set_index(index) })
+	
+	return xls_data
+
+def write_inputdata(xls_data, path):
+	"""Write input data to csv directory or HDF5 file 
+	
+	Converts input data (e.g. read from an excel input file) to an input, 
+	which can be read by read_csvdata or read_hdfdata.
+	
+	Args:
+		xls_data: dictionary with DataFrames of all sheets
+		path: HDF5 file (.h5, .hdf5) or directory for csv files
+	"""
+	import warnings
+	
+	if os.path.splitext(path)[1].lower() in ('.h5', '.hdf5'):
+		with pd.HDFStore(path, mode='w') as store, warnings.catch_warnings():
+			# text columns (e.g. "class" of process) are pickled by PyTables
+			warnings.simplefilter('ignore', pd.io.pytables.PerformanceWarning)
+			for key, sheet, index in INPUT_SHEETS:
+				store.put(sheet.replace('-', '_'), xls_data[key].reset_index())
+	else:
+		if not os.path.exists(path):
+			os.makedirs(path)
+		for key, sheet, index in INPUT_SHEETS:
+			xls_data[key].reset_index().to_csv(os.path.join(path, sheet + '.csv'), index=False)
+
+def scale_inputdata(xls_data, timesteps=1, copies=1):
+	"""Return copy of input data scaled to a larger model
+
+	The timeseries are repeated "timesteps" times and the optimisation period
+	is extended accordingly. The number "Num" of every process and storage is
+	multiplied by "copies". Used to measure how model creation and solving
+	scale with the model size (see examples/benchmark.py).
+
+	Args:
+		xls_data: input data (see read_inputdata)
+		timesteps: factor for the number of timesteps
+		copies: factor for the number of processes and storages
+
+	Returns:
+		copy of xls_data with scaled timeseries, processes and storages
+	"""
+	data = dict((key, value.copy() if isinstance(value, pd.DataFrame) else value)
+				for key, value in xls_data.items())
+
+	if timesteps > 1:
+		for key in TIMESERIES:
+			df = data[key]
+			n = len(df.index)
+			df = pd.concat([df] * timesteps)
+			# continue time index, e.g. 1..672 -> 1..2688
+			df.index = pd.Index(np.arange(n * timesteps) + xls_data[key].index[0],
+								name=df.index.name)
+			data[key] = df
+		start = int(data['time-settings'].loc['Time', 'start'])
+		end = int(data['time-settings'].loc['Time', 'end'])
+		data['time-settings'].loc['Time', 'end'] = start - 1 + (end - start + 1) * timesteps
+
+	if copies > 1:
+		for key in ['process', 'storage']:
+			data[key]['Num'] = data[key]['Num'] * copies
+
+	return data
+
+def generate_inputdata(commodities=2, processes=4, num=1, storages=2, classes=1,
+					   timesteps=672, timebase=900, mip=False, seed=0):
+	"""Generate input data of a synthetic model of given size
+
+	Creates a factory with demand of electricity ("elec") and further heat like
+	commodities ("heat1", "heat2", ...), which are supplied by imported
+	electricity and gas and by processes (boilers, chp plants, heat pumps, pv
+	and wind turbines). The first processes are boilers, one for every heat
+	commodity, so every demand can be satisfied. Demand, solar and wind
+	profiles and electricity prices follow daily, weekly and seasonal patterns
+	with random noise. Used to test how the model scales with its size (see
+	examples/benchmark.py).
+
+	Args:
+		commodities: number of commodities with demand (including "elec")
+		processes: number of processes (at least commodities - 1)
+		num: number "Num" of every process and storage
+		storages: number of storages (alternating for all demand commodities)
+		classes: number of process classes, processes are assigned alternately
+		timesteps: number of timesteps
+		timebase: length of a timestep [s]
+		mip: set to TRUE, to activate all mip equations with partload and
+			minimal capacities of chp plants and boilers
+		seed: seed of the random generator, same seed gives the same data
+
+	Returns:
+		xls_data: dictionary with DataFrames of all sheets (see read_inputdata),
+			to be prepared with prepare_modeldata
+	"""
+	if commodities < 1:
+		raise ValueError('At least one commodity ("elec") is required')
+	if processes < max(commodities - 1, 1):
+		raise ValueError('At least one process for every heat commodity required: '
+						 '{} processes for {} commodities'.format(processes, commodities))
+
+	random = np.random.RandomState(seed)
+	heats = ['heat{}'.format(i + 1) for i in range(commodities - 1)]
+	demand_co = ['elec'] + heats
+
+	#time of every timestep
+	time_index = pd.Index(np.arange(1, timesteps + 1), name='Time')
+	hours = np.arange(timesteps) * float(timebase) / 3600
+	hour = hours % 24
+	day = (hours // 24).astype(int)
+	weekend = (day % 7) >= 5
+	season = np.cos(2 * np.pi * (day % 365) / 365) # 1 in winter, -1 in summer
+	working = ((hour >= 6) & (hour < 22) & ~weekend) * 1.0
+
+	#demand profiles: base load + working hours + season + noise
+	demand = pd.DataFrame(index=time_index)
+	for co in demand_co:
+		peak = random.uniform(5000, 20000)
+		profile = 0.4 + 0.5 * working + random.normal(0, 0.05, timesteps)
+		if co != 'elec':
+			profile = profile * (1 + 0.3 * season)
+		demand[co] = np.clip(profile, 0.05, None) * peak
+
+	#supim profiles: solar with daily course, season and cloudy days
+	#wind as autocorrelated random process
+	clouds = random.uniform(0.3, 1, day.max() + 1)[day]
+	solar = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, None) * (0.7 - 0.3 * season) * clouds
+	wind = np.zeros(timesteps)
+	for t in range(1, timesteps):
+		wind[t] = 0.98 * wind[t - 1] + random.normal(0, 0.2)
+	wind = 1 / (1 + np.exp(-wind + 1)) # logistic function: 0..1
+	supim = pd.DataFrame({'solar': solar, 'wind': wind}, index=time_index)
+
+	#prices: electricity with peak/off-peak tariff, constant gas price
+	peak_hours = ((hour >= 8) & (hour < 20) & ~weekend)
+	ext_import = pd.DataFrame({
+		'elec': np.where(peak_hours, 0.16, 0.10) + random.normal(0, 0.005, timesteps),
+		'gas': np.full(timesteps, 0.05)}, index=time_index)
+	ext_export = pd.DataFrame({'elec': np.full(timesteps, 0.03)}, index=time_index)
+	demandrate_factor = pd.DataFrame({'elec': np.ones(timesteps, dtype=int),
+		'gas': np.ones(timesteps, dtype=int)}, index=time_index)
+
+	#processes: (name, [(commodity, direction, ratio, ratio-partload)], cost-inv)
+	pro_types = ['boiler', 'chp', 'heatpump', 'pv', 'wind', 'boiler']
+	pro_rows = []
+	pro_co_rows = []
+	for i in range(processes):
+		pro_type = 'boiler' if i < len(heats) else pro_types[(i - len(heats)) % len(pro_types)]
+		heat = heats[i % len(heats)] if heats else None
+		if pro_type == 'boiler' and heat:
+			flows = [('gas', 'In', 1.11, 1.11), (heat, 'Out', 1, 1)]
+			cost_inv = 100
+		elif pro_type == 'heatpump' and heat:
+			flows = [('elec', 'In', 0.3, 0.3), (heat, 'Out', 1, 1)]
+			cost_inv = 600
+		elif pro_type == 'pv':
+			flows = [('solar', 'In', 1, 1), ('elec', 'Out', 1, 1)]
+			cost_inv = 1000
+		elif pro_type == 'wind':
+			flows = [('wind', 'In', 1, 1), ('elec', 'Out', 1, 1)]
+			cost_inv = 1200
+		else: # chp, gas turbine if there is no heat commodity
+			pro_type = 'chp' if heat else 'gas turbine'
+			flows = [('gas', 'In', 2.5, 2.9), ('elec', 'Out', 1, 1)]
+			flows += [(heat, 'Out', 1, 1.2)] if heat else []
+			cost_inv = 800
+		name = '{} {}'.format(pro_type, i + 1)
+		out = [co for co, direction, ratio, ratio_pl in flows if direction == 'Out'][-1]
+		cap_max = 2 * demand[out].max()
+		partload = mip and pro_type in ('boiler', 'chp', 'gas turbine')
+		pro_rows.append({
+			'Process': name, 'Num': num,
+			'class': 'class{}'.format(i % classes + 1) if classes else np.nan,
+			'cost-inv': cost_inv, 'cost-fix': 10, 'cost-var': 0.01,
+			'cap-installed': 0, 'cap-new-min': 0.1 * cap_max if partload else 0,
+			'cap-new-max': cap_max, 'partload-min': 0.3 if partload else 0,
+			'start-up-energy': 0.1 if partload else 0, 'initial-power': 0,
+			'depreciation': 15, 'wacc': 0.05})
+		for co, direction, ratio, ratio_pl in flows:
+			pro_co_rows.append({'Process': name, 'Commodity': co, 'Direction': direction,
+								'ratio': ratio, 'ratio-partload': ratio_pl})
+	process = pd.DataFrame(pro_rows).set_index('Process')
+	process_commodity = pd.DataFrame(pro_co_rows).set_index(['Process', 'Commodity', 'Direction'])
+
+	#process classes: fee for all outputs of processes of the class
+	proclass_rows = []
+	pro_out = process_commodity.xs('Out', level='Direction').reset_index()
+	pro_out['class'] = process.loc[pro_out['Process'], 'class'].values
+	for (cls, co), group in pro_out.groupby(['class', 'Commodity']):
+		proclass_rows.append({'Class': cls, 'Commodity': co, 'Direction': 'Out',
+							  'fee': 0.01, 'cap-max': np.inf, 'energy-max': np.inf})
+	process_class = pd.DataFrame(proclass_rows,
+		columns=['Class', 'Commodity', 'Direction', 'fee', 'cap-max', 'energy-max'])
+	process_class = process_class.set_index(['Class', 'Commodity'])
+
+	#storages: battery for elec, heat storage for heat commodities
+	sto_rows = []
+	for i in range(storages):
+		co = demand_co[i % len(demand_co)]
+		battery = co == 'elec'
+		cap_max = demand[co].max()
+		sto_rows.append({
+			'Storage': '{} {}'.format('battery' if battery else 'storage', i + 1),
+			'Commodity': co, 'Num': num,
+			'cost-inv-p': 0, 'cost-inv-e': 500 if battery else 20, 'cost-fix-p': 0,
+			'cost-fix-e': 0, 'cost-var': 0 if battery else 0.001,
+			'cap-installed-p': 0, 'cap-new-min-p': 0, 'cap-new-max-p': cap_max,
+			'cap-installed-e': 0, 'cap-new-min-e': 0, 'cap-new-max-e': 4 * cap_max,
+			'max-p-e-ratio': 2 if battery else 1, 'eff-in': 0.95 if battery else 1,
+			'eff-out': 0.95 if battery else 1, 'self-discharge': 0 if battery else 0.0001,
+			'cycles-max': 5000 if battery else 1000000, 'lifetime': 10 if battery else 20,
+			'DOD': 1, 'initial-soc': 0, 'depreciation': 10, 'wacc': 0.05})
+	storage_columns = ['Storage', 'Commodity', 'Num', 'cost-inv-p', 'cost-inv-e', 'cost-fix-p',
+		'cost-fix-e', 'cost-var', 'cap-installed-p', 'cap-new-min-p', 'cap-new-max-p',
+		'cap-installed-e', 'cap-new-min-e', 'cap-new-max-e', 'max-p-e-ratio', 'eff-in',
+		'eff-out', 'self-discharge', 'cycles-max', 'lifetime', 'DOD', 'initial-soc',
+		'depreciation', 'wacc']
+	storage = pd.DataFrame(sto_rows, columns=storage_columns).set_index(['Storage', 'Commodity'])
+
+	ext_co = pd.DataFrame({
+		'demand-rate': [50, 0], 'time-interval-demand-rate': [900, 900],
+		'p-max-initial': [0, 0], 'import-max': [np.inf, np.inf],
+		'export-max': [np.inf, 0], 'operating-hours-min': [0, 0]},
+		index=pd.Index(['elec', 'gas'], name='Commodity'),
+		columns=['demand-rate', 'time-interval-demand-rate', 'p-max-initial',
+				 'import-max', 'export-max', 'operating-hours-min'])
+
+	active = 'yes' if mip else 'no'
+	xls_data = {
+		'input_file': 'synthetic',
+		'time-settings': pd.DataFrame({'timebase': [timebase], 'start': [1], 'end': [timesteps]},
+			index=pd.Index(['Time'], name='Info'), columns=['timebase', 'start', 'end']),
+		'mip-equations': pd.DataFrame({'Active': [active, active, active]},
+			index=pd.Index(['Storage In-Out', 'Partload', 'Min-Cap'], name='Equations')),
+		'ext-co': ext_co,
+		'ext_import': ext_import,
+		'ext_export': ext_export,
+		'demandrate_factor': demandrate_factor,
+		'process': process[['Num', 'class', 'cost-inv', 'cost-fix', 'cost-var',
+			'cap-installed', 'cap-new-min', 'cap-new-max', 'partload-min',
+			'start-up-energy', 'initial-power', 'depreciation', 'wacc']],
+		'process_commodity': process_commodity[['ratio', 'ratio-partload']],
+		'process_class': process_class,
+		'storage': storage,
+		'demand': demand,
+		'supim': supim[[co for co in supim.columns
+						if co in process_commodity.index.get_level_values('Commodity')]]}
+	return xls_data
+
+def _file_hash(path):
+# Return sha1 hash of the content of the file in path
+	import hashlib
 	
+	sha1 = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			sha1.update(chunk)
+	return sha1.hexdigest()
+
+def _read_cache(cache_file, input_hash):
+# Return xls_data (without 'input_file') stored in cache_file
+# Returns None, if cache_file does not exist or was created from another input
+	if not os.path.exists(cache_file):
+		return None
+	with pd.HDFStore(cache_file, mode='r') as store:
+		if 'cache_info' not in store:
+			return None
+		if store.get_storer('cache_info').attrs.input_hash != input_hash:
+			return None # input file changed since cache was written
+		
+		# cache_info: {HDF5 key : name in xls_data}
+		cache_info = store['cache_info']
+		xls_data = {}
+		for key, name in cache_info.iteritems():
+			xls_data.update({name : store[key]})
 	return xls_data
 
+def _write_cache(cache_file, input_hash, xls_data):
+# Write all DataFrames of xls_data to cache_file, together with hash of input
+	names = sorted(name for name in xls_data if name != 'input_file')
+	# names like "time-settings" are no valid HDF5 node names, so use keys "table0"...
+	cache_info = pd.Series(names, index=['table{}'.format(i) for i in range(len(names))])
+	
+	import warnings
+	
+	with pd.HDFStore(cache_file, mode='w') as store, warnings.catch_warnings():
+		# text columns (e.g. "class" of process) are pickled by PyTables
+		warnings.simplefilter('ignore', pd.io.pytables.PerformanceWarning)
+		for key, name in cache_info.iteritems():
+			store.put(key, xls_data[name])
+		store.put('cache_info', cache_info)
+		store.get_storer('cache_info').attrs.input_hash = input_hash
+
 def prepare_modeldata(xls_data):
 #prepare data for model
 		
@@ -1293,69 +3577,173 @@ def prepare_modeldata(xls_data):
 	#storage: add/delete rows dependent on "num" index
 	data.update({'storage' : num_index(xls_data['storage'])})
 	
+	derive_parameters(data)
+	return data
+
+def derive_parameters(data):
+# calculate process and storage parameters derived from other parameters
+# (changes data in place), again after changing prepared data (see run_scenarios)
+	
+	# derive annuity factor for process and storage
+	for key in ['process', 'storage']:
+		data[key]['annuity_factor'] = annuity_factor(data[key]['depreciation'], data[key]['wacc'])
+	
 	#calculate abs max capacity
 	data['process']['cap-abs-max'] = (data['process']['cap-installed'] + data['process']['cap-new-max'])
 	
 	#calculate initial mode run and start
 	data['process']['initial-run'] = (data['process']['initial-power'] >= (data['process']['cap-installed'] * data['process']['partload-min'])) *1
 	data['process']['initial-start'] = (data['process']['initial-power'] < data['process']['cap-installed'] * data['process']['partload-min']) & (data['process']['initial-power']>0) *1
-	
-	return data	
 
 		
 def num_index(df_data):
 	#Create DataFrame"output" with additional rows dependent on new index 1 to "Num"
 		
 	# df_data = dataframe with data of sheet, index columns without num!!!	
-	df_0 = df_data	#only index columns without num
-	df_1 = df_data.set_index('Num',True,True) # add'num' to index columns	
-	output=pd.DataFrame()	#empty Dataframe to be filled
-	mxn=0
-	for i in range(0,len(df_0.index),1): #for every index tuple
-		maxnum = int(df_0.loc[df_0.index[i]]['Num'])
-		mxn=max(mxn,maxnum)
-		for n in range(1,maxnum+1,1): #from 1 to "Num" 			
-			if len(df_0.index.names)==1:  #only one index column
-				newindex=df_0.index[i]
-				newindex=(newindex,n)
-			else:					# more than one index columns
-				newindex=list(df_0.index[i])
-				newindex.append(n)
-			newindex=tuple([newindex])
-			values=df_1.ix[df_1.index[i]]
-			values=np.matrix(values)
-			df=pd.DataFrame(values,index=newindex,columns=df_1.columns) # new row
-			output=output.append(df)		# add row to output
-	if output.empty == False:	
-		output.index=pd.MultiIndex.from_tuples(tuple(output.index), names=df_1.index.names) #adding multiindex and index names
-		# derive annuity factor for process and storage
-	else:
-		output = df_1.ix[0:0]
-		# output = pd.DataFrame(columns = df_data.columns[1:])
-	output['annuity_factor'] = annuity_factor(output['depreciation'], output['wacc'])
+	nums = df_data['Num'].values.astype(int) # number of copies for every index tuple
+	rows = np.repeat(np.arange(len(df_data.index)), nums) # row position of every copy
+	# new index from 1 to "Num" for every index tuple
+	new_num = np.arange(rows.size) - np.repeat(np.cumsum(nums) - nums, nums) + 1
+	
+	output = df_data.drop('Num', axis=1).iloc[rows] # copy rows "Num" times
+	levels = [output.index.get_level_values(i) for i in range(output.index.nlevels)]
+	output.index = pd.MultiIndex.from_arrays(levels + [new_num], 
+		names=list(df_data.index.names) + ['Num']) #adding multiindex and index names
 	return output
 
 def del_processes(process_commodity, process):
 # Delete non used processes in process_commodity
-    if process.index.values.size>0:
-        pro_co=pd.DataFrame()
-        pro_type = process.index.get_level_values(0)
-        for i in range(0,len(process_commodity)):		
-            if process_commodity[i:i+1].index[0][0] in pro_type:
-                for n in range(0,max(process.loc[process_commodity.index[i][0]].index)):
-                    df_temp = pd.DataFrame(process_commodity[i:i+1].values,
-                        index = pd.MultiIndex.from_tuples(
-                        tuple([(process_commodity[i:i+1].index.get_values()[0][0],
-                                n+1,
-                                process_commodity[i:i+1].index.get_values()[0][1],
-                                process_commodity[i:i+1].index.get_values()[0][2])])))
-                    pro_co=pro_co.append(df_temp)
-                        
-        pro_co.index=pd.MultiIndex.from_tuples(tuple(pro_co.index),names=process_commodity.index.names[0:1]+['Num'] +process_commodity.index.names[1:3])	
-        pro_co.columns = process_commodity.columns
-    else:
-        pro_co=process_commodity.ix[0:0]
+    # highest "Num" of every process, NaN for processes not in process
+    max_num = pd.Series(process.index.get_level_values(1),
+                        index=process.index.get_level_values(0))
+    max_num = max_num.groupby(level=0).max()
+    nums = max_num.reindex(process_commodity.index.get_level_values(0))
+    nums = nums.fillna(0).values.astype(int)
+    
+    # copy every row "Num" times and add "Num" as second index column
+    rows = np.repeat(np.arange(len(process_commodity.index)), nums)
+    new_num = np.arange(rows.size) - np.repeat(np.cumsum(nums) - nums, nums) + 1
+    pro_co = process_commodity.iloc[rows]
+    levels = [pro_co.index.get_level_values(i) for i in range(pro_co.index.nlevels)]
+    pro_co.index = pd.MultiIndex.from_arrays(levels[0:1] + [new_num] + levels[1:3],
+        names=process_commodity.index.names[0:1]+['Num'] +process_commodity.index.names[1:3])
     return pro_co
+
+def aggregate_timeseries(data, periods, period_length=None):
+	"""Reduce timeseries to a number of representative periods
+
+	The optimisation period is split into periods of equal length, which are
+	clustered (k-means on the normalised timeseries) into "periods" clusters.
+	Each cluster is represented by its member period closest to the cluster
+	centre, weighted with the number of periods in the cluster.
+	
+	The representative periods are not linked in time: storage content is 
+	fixed to "initial-soc" at the start and end of every period (storage 
+	can't shift energy between periods), the run mode before the first 
+	timestep of a period is the one of its last timestep and demand rate
+	intervals end at every period boundary.
+	
+	Args:
+		data: prepared model data (see prepare_modeldata)
+		periods: number of representative periods
+		period_length: number of timesteps per period, defaults to one day
+		
+	Returns:
+		copy of data with the representative periods as timeseries and the
+		additional entry 'aggregation' (period_length, weights of the new 
+		timesteps and the map from original to new timesteps)
+	"""
+	time_settings = data['time-settings']
+	tb = int(time_settings.loc['Time']['timebase'])
+	start = int(time_settings.loc['Time']['start'])
+	end = int(time_settings.loc['Time']['end'])
+	if period_length is None:
+		period_length = 24 * 3600 // tb
+	period_length = int(period_length)
+	n_steps = end - start + 1
+	
+	if n_steps % period_length != 0:
+		raise ValueError('Number of timesteps ({}) is not a multiple of '
+						 'period_length ({})'.format(n_steps, period_length))
+	n_periods = n_steps // period_length
+	if not 0 < periods < n_periods:
+		raise ValueError('Number of representative periods must be between 1 '
+						 'and {}'.format(n_periods - 1))
+	
+	#features of every period: all normalised timeseries values of the period
+	features = [np.zeros((n_periods, 0))]
+	for key in TIMESERIES:
+		values = data[key].loc[start:end].values.astype(float)
+		scale = np.abs(values).max(axis=0) if values.size else np.ones(values.shape[1])
+		scale[scale == 0] = 1
+		features.append((values / scale).reshape(n_periods, period_length * values.shape[1]))
+	features = np.hstack(features)
+	
+	labels, medoids = _cluster_periods(features, periods)
+	
+	#new timesteps 1...periods*period_length, made of the representative periods
+	n_new = len(medoids)
+	new_steps = np.arange(1, n_new * period_length + 1)
+	old_steps = (start + (np.array(medoids)[:, None] * period_length 
+						 + np.arange(period_length))).ravel()
+	
+	aggregated = dict(data)
+	for key in TIMESERIES:
+		df = data[key].loc[old_steps].copy()
+		df.index = pd.Index(new_steps, name=data[key].index.name)
+		aggregated[key] = df
+		
+	time_settings = time_settings.copy()
+	time_settings.loc['Time', 'start'] = 1
+	time_settings.loc['Time', 'end'] = new_steps[-1]
+	aggregated['time-settings'] = time_settings
+	
+	#cluster of every period -> position of its representative period
+	position = dict((cl, i) for i, cl in enumerate(labels[medoids]))
+	new_period = np.array([position[cl] for cl in labels])
+	counts = np.bincount(new_period, minlength=n_new)
+	timestep_map = (np.repeat(new_period, period_length) * period_length 
+					+ np.tile(np.arange(period_length), n_periods) + 1)
+	
+	aggregated['aggregation'] = {
+		'period_length': period_length,
+		'weights': pd.Series(np.repeat(counts, period_length), index=new_steps),
+		'timestep_map': pd.Series(timestep_map, 
+								  index=pd.Index(np.arange(start, end + 1), name='t')),
+		}
+	return aggregated
+	
+def _cluster_periods(features, k, iterations=100):
+	# k-means clustering of the rows of "features" with k-means++ initialisation
+	# returns the cluster label of every row and the row closest to each
+	# (non-empty) cluster centre
+	rand = np.random.RandomState(0) # deterministic result for equal input
+	centres = features[[rand.randint(len(features))]]
+	while len(centres) < k:
+		dist = ((features[:, None, :] - centres[None, :, :])**2).sum(axis=2).min(axis=1)
+		if dist.sum() == 0:
+			break
+		new = rand.choice(len(features), p=dist / dist.sum())
+		centres = np.vstack([centres, features[new]])
+	
+	labels = None
+	for i in range(iterations):
+		dist = ((features[:, None, :] - centres[None, :, :])**2).sum(axis=2)
+		new_labels = dist.argmin(axis=1)
+		if labels is not None and (new_labels == labels).all():
+			break
+		labels = new_labels
+		centres = np.array([features[labels == cl].mean(axis=0) 
+							if (labels == cl).any() else centres[cl] 
+							for cl in range(len(centres))])
+	
+	medoids = []
+	for cl in range(len(centres)):
+		members = np.flatnonzero(labels == cl)
+		if members.size:
+			dist = ((features[members] - centres[cl])**2).sum(axis=1)
+			medoids.append(members[dist.argmin()])
+	return labels, medoids
 	
 ############################################################################################	
 #GET RESULTS	
@@ -1364,19 +3752,34 @@ def del_processes(process_commodity, process):
 def get_entity(instance, name):
     """ Retrieve values (or duals) for an entity in a model instance.
     Args:
-        instance: a Pyomo ConcreteModel instance
+        instance: a Pyomo ConcreteModel instance (or a RollingHorizonResult 
+                  or solved MatrixModel)
         name: name of a Set, Param, Var, Constraint or Objective
     Returns:
         a Pandas Series with domain as index and values (or 1's, for sets) of
         entity name. For constraints, it retrieves the dual values
     """
+    if isinstance(instance, (RollingHorizonResult, MatrixModel)):
+        # combined results of all windows of a rolling horizon run or
+        # results of a matrix model
+        return instance.entities[name].copy()
 
     # retrieve entity, its type and its onset names
     entity = instance.__getattribute__(name)
-    labels = _get_onset_names(entity)
+    labels = _get_entity_labels(entity)
 
     # extract values
-    if isinstance(entity, pyen.Set):
+    if isinstance(entity, pyen.Var) and entity.dim() > 0:
+        # read values directly from the variable data into an array (None of
+        # unsolved variables becomes NaN); the index is created only once per
+        # variable and cached in the instance (see _get_entity_index)
+        if len(entity) == 0:
+            return pd.Series(name=name)
+        values = np.array([v.value for v in entity.values()], dtype=float)
+        return pd.Series(values, index=_get_entity_index(instance, entity, labels),
+                         name=name)
+
+    elif isinstance(entity, pyen.Set):
         # Pyomo sets don't have values, only elements
         results = pd.DataFrame([(v, 1) for v in entity.value])
 
@@ -1407,27 +3810,10 @@ def get_entity(instance, name):
             labels = ['None']
 
     else:
-        # create DataFrame
-        if entity.dim() > 1:
-            # concatenate index tuples with value if entity has
-            # multidimensional indices v[0]
-            results = pd.DataFrame(
-                [v[0]+(v[1].value,) for v in entity.iteritems()])
-        elif entity.dim() == 1:
-            # otherwise, create tuple from scalar index v[0]
-            results = pd.DataFrame(
-                [(v[0], v[1].value) for v in entity.iteritems()])
-        else:
-            # assert(entity.dim() == 0)
-            results = pd.DataFrame(
-                [(v[0], v[1].value) for v in entity.iteritems()])
-            labels = ['None']
-
-    # check for duplicate onset names and append one to several "_" to make
-    # them unique, e.g. ['sit', 'sit', 'com'] becomes ['sit', 'sit_', 'com']
-    for k, label in enumerate(labels):
-        if label in labels[:k]:
-            labels[k] = labels[k] + "_"
+        # scalar variable or objective
+        results = pd.DataFrame(
+            [(v[0], v[1].value) for v in entity.iteritems()])
+        labels = ['None']
 
     if not results.empty:
         # name columns according to labels + entity name
@@ -1452,22 +3838,99 @@ def get_entities(instance, names):
     Returns:
         a Pandas DataFrame with entities as columns and domains as index
     """
+    entities = [get_entity(instance, name) for name in names]
+    entities = [entity for entity in entities if not entity.empty]
+    if not entities:
+        return pd.DataFrame(columns=names)
+
+    # fill values of all entities into one array at their position in the
+    # common index, instead of joining them one by one
+    index, positions = _get_common_index(
+        instance, names, [entity.index for entity in entities])
+    values = np.full((len(index), len(entities)), np.nan)
+    for k, (entity, position) in enumerate(zip(entities, positions)):
+        values[position, k] = entity.values
+    df = pd.DataFrame(values, index=index,
+                      columns=[entity.name for entity in entities])
+
+    # empty entities as columns of NaN
+    return df.reindex(columns=names)
+
+
+def _get_entity_labels(entity):
+    # Return onset names of entity (see _get_onset_names), duplicate onset
+    # names get one to several "_" appended to make them unique, e.g.
+    # ['sit', 'sit', 'com'] becomes ['sit', 'sit_', 'com']
+    labels = _get_onset_names(entity)
+    for k, label in enumerate(labels):
+        if label in labels[:k]:
+            labels[k] = labels[k] + "_"
+    return labels
 
-    df = pd.DataFrame()
-    for name in names:
-        other = get_entity(instance, name)
 
-        if df.empty:
-            df = other.to_frame()
+def _get_entity_reader(instance, name):
+    # Return index of variable name (like get_entity) and a function, which
+    # returns the values of the elements at given positions of the index,
+    # so values can be read in parts without a Series of all values.
+    if isinstance(instance, (RollingHorizonResult, MatrixModel)):
+        series = instance.entities[name]
+        return series.index, lambda positions: series.values[positions]
+    entity = instance.__getattribute__(name)
+    if len(entity) == 0:
+        return pd.Index([]), None
+    data = list(entity.values())
+    index = _get_entity_index(instance, entity, _get_entity_labels(entity))
+    return index, lambda positions: np.array(
+        [data[k].value for k in positions], dtype=float)
+
+
+def _get_entity_index(instance, entity, labels):
+    # Return index of variable entity with onset names labels (a MultiIndex
+    # for multidimensional variables) in the order of entity.values().
+    # The index is cached in the instance together with the component, as
+    # creating it takes much longer than reading the values. A component
+    # replaced by a new one (or changed in size) gets a new index. Returns a
+    # view, so changing its names doesn't change the cached index.
+    cache = getattr(instance, '_entity_index_cache', None)
+    if cache is None:
+        cache = {}
+        instance._entity_index_cache = cache
+    cached_entity, index = cache.get(entity.name, (None, None))
+    if cached_entity is not entity or len(index) != len(entity):
+        if entity.dim() > 1:
+            index = pd.MultiIndex.from_tuples(list(entity.keys()), names=labels)
         else:
-            index_names_before = df.index.names
-
-            df = df.join(other, how='outer')
-
-            if index_names_before != df.index.names:
-                df.index.names = index_names_before
-
-    return df
+            index = pd.Index(list(entity.keys()), name=labels[0])
+        cache[entity.name] = (entity, index)
+    return index.view()
+
+
+def _get_common_index(instance, names, indexes):
+    # Return sorted union of indexes and the positions of the elements of
+    # every index in it. The result is cached in the instance for the
+    # entities names, as long as they have the same index objects or views of
+    # them (e.g. the cached indices of variables, see _get_entity_index).
+    cache = getattr(instance, '_common_index_cache', None)
+    if cache is None:
+        cache = {}
+        instance._common_index_cache = cache
+    key = tuple(names)
+    if key in cache:
+        cached_indexes, index, positions = cache[key]
+        if len(cached_indexes) == len(indexes) and all(
+                a.is_(b) for a, b in zip(cached_indexes, indexes)):
+            return index.view(), positions
+
+    if all(other.equals(indexes[0]) for other in indexes[1:]):
+        # e.g. variables over the same set: no alignment needed
+        index = indexes[0]
+        positions = [slice(None)] * len(indexes)
+    else:
+        index = indexes[0].append(list(indexes[1:])).drop_duplicates().sort_values()
+        index.names = indexes[0].names
+        positions = [index.get_indexer(other) for other in indexes]
+    cache[key] = (indexes, index, positions)
+    return index.view(), positions
 
 
 def list_entities(instance, entity_type):
@@ -1608,6 +4071,42 @@ def get_constants(prob):
     
 	return costs, cpro, csto
 
+def get_build_profile(prob):
+	"""Return build time and size of every component of a model
+
+	Usage:
+		profile = get_build_profile(prob)
+		profile.sort_values('time', ascending=False).head()
+
+	Args:
+		prob: a ficus model instance created with profile=True (see 
+			create_model)
+		
+	Returns:
+		DataFrame with one row per component (in order of construction) 
+		and columns type, time (build time in s), size (number of elements) 
+		and nonzeros (number of variables in all constraints of a Constraint
+		or in the Objective)
+	"""
+	try:
+		from pyomo.core.expr.current import identify_variables # Pyomo >= 5.6
+	except ImportError:
+		from pyomo.core.base.expr import identify_variables
+	
+	profile = []
+	for name, build_time in prob.build_times:
+		component = prob.component(name)
+		nonzeros = 0
+		if isinstance(component, pyen.Constraint):
+			nonzeros = sum(len(list(identify_variables(con.body, include_fixed=False)))
+						   for con in component.values())
+		elif isinstance(component, pyen.Objective):
+			nonzeros = sum(len(list(identify_variables(obj.expr, include_fixed=False)))
+						   for obj in component.values())
+		profile.append((name, component.type().__name__, build_time, len(component), nonzeros))
+	profile = pd.DataFrame(profile, columns=['component', 'type', 'time', 'size', 'nonzeros'])
+	return profile.set_index('component')
+
 def get_timeseries(prob, timesteps=None):
 	"""Return DataFrames of all timeseries referring to given commodity
 
@@ -1626,11 +4125,10 @@ def get_timeseries(prob, timesteps=None):
 	"""
 	if timesteps is None:
         # default to all simulated timesteps
-		timesteps = sorted(get_entity(prob, 't').index)
+		timesteps = get_timesteps(prob)
         
     # DEMAND
-	demand = prob.demand.loc[timesteps]
-	demand.name = 'Demand'
+	demand = _get_demand(prob, timesteps)
     
     # EXT
 	ext = get_entities(prob, ['ext_p_in','ext_p_out'])
@@ -1641,9 +4139,181 @@ def get_timeseries(prob, timesteps=None):
 
     # STORAGE
 	sto = get_entities(prob, ['sto_e_cont','sto_p_in', 'sto_p_out'])
+	
+	if prob.timestep_map is not None:
+		# aggregated timeseries: map results back to original timesteps
+		ext = expand_timeseries(ext, prob.timestep_map)
+		pro = expand_timeseries(pro, prob.timestep_map)
+		sto = expand_timeseries(sto, prob.timestep_map)
     
 	return demand, ext, pro, sto
 
+def _get_demand(prob, timesteps):
+# demand timeseries of all commodities for timesteps
+	if prob.timestep_map is None:
+		demand = prob.demand.loc[timesteps]
+	else:
+		# aggregated timeseries: demand of representative timestep
+		demand = prob.demand.loc[prob.timestep_map.loc[timesteps].values]
+		demand.index = pd.Index(timesteps, name=prob.demand.index.name)
+	demand.name = 'Demand'
+	return demand
+
+def get_timesteps(prob):
+	"""Return list of timesteps of the optimisation period
+
+	For a model with aggregated timeseries (see aggregate_timeseries), the 
+	original timesteps are returned instead of the modelled ones.
+	
+	Args:
+		prob: a ficus model instance
+		
+	Returns:
+		sorted list of timesteps
+	"""
+	if prob.timestep_map is None:
+		return sorted(get_entity(prob, 't').index)
+	else:
+		return sorted(prob.timestep_map.index)
+
+def expand_timeseries(df, timestep_map):
+	"""Map timeseries of a model with aggregated timeseries to original timesteps
+
+	Every original timestep gets the values of the timestep representing it.
+	
+	Args:
+		df: DataFrame with timesteps in index level 't0' (see get_entities)
+		timestep_map: Series of modelled timestep for every original timestep
+		
+	Returns:
+		DataFrame with original timesteps in index level 't0'
+	"""
+	if df.empty:
+		return df
+	# timestep before first timestep (storage content) maps to 0
+	t_map = timestep_map.copy()
+	t_map.loc[t_map.index[0] - 1] = 0
+	t_map = pd.DataFrame({'t0': t_map.values, 't_original': t_map.index.values})
+	
+	names = list(df.index.names)
+	expanded = df.reset_index().merge(t_map, on='t0')
+	expanded['t0'] = expanded.pop('t_original')
+	expanded = expanded.set_index(names).sort_index()
+	expanded.name = getattr(df, 'name', None)
+	return expanded
+
+def window_results(prob, start, end):
+	# values of all variables of one rolling horizon window, time dependent
+	# variables (index "t0") only for timesteps start-1 to end
+	results = {}
+	for name in list_entities(prob, 'var').index:
+		entity = get_entity(prob, name)
+		if 't0' in entity.index.names:
+			t = entity.index.get_level_values('t0')
+			entity = entity[(t >= start - 1) & (t <= end)]
+		results[name] = entity
+	return results
+
+class RollingHorizonResult(object):
+	"""Results of all windows of a rolling horizon run (see run_rolling_horizon)
+
+	Provides the results like a model instance to get_entity, report and the 
+	plot functions. Time dependent variables are joined from all windows 
+	(without lookahead). Energy sums and time dependent costs are calculated
+	from the joined timeseries, all other variables (capacities, max demand 
+	rate power, demand charges ...) are taken from the last window.
+	"""
+	def __init__(self, windows, data):
+		time_settings = data['time-settings']
+		start = int(time_settings.loc['Time']['start'])
+		end = int(time_settings.loc['Time']['end'])
+		self.name = 'ficus'
+		self.inputfile = data['input_file']
+		self.tb = int(time_settings.loc['Time']['timebase'])
+		self.demand = data['demand'].loc[start:end]
+		self.supim = data['supim'].loc[start:end]
+		self.timestep_map = None
+		
+		self.entities = {'t': pd.Series(1, index=pd.Index(np.arange(start, end + 1), name='t'), name='t_')}
+		for name in windows[0]:
+			last = windows[-1][name]
+			if set(['t', 't0']) & set(last.index.names):
+				joined = pd.concat([w[name] for w in windows])
+				self.entities[name] = joined[~joined.index.duplicated()].sort_index()
+			else:
+				self.entities[name] = last
+		self._sums(data, start, end)
+		
+	def _sums(self, data, start, end):
+		# energy sums and time dependent costs for all timesteps start...end
+		# (see co_energy_consumption, proclass_e_in_sum and cost_sum in create_model)
+		e = self.entities
+		p2e = float(self.tb) / 3600
+		year_factor = float(end - start + 1) * self.tb / (365 * 24 * 60 * 60)
+		process = data['process']
+		storage = data['storage']
+		
+		def by(series, levels):
+			# sum of series for every combination of index levels
+			if series.empty:
+				return pd.Series()
+			return series.groupby(level=levels).sum()
+		
+		pro_in = by(e['pro_p_in'], ['pro_name', 'pro_num', 'commodity'])
+		pro_out = by(e['pro_p_out'], ['pro_name', 'pro_num', 'commodity'])
+		sto_in = by(e['sto_p_in'], ['storage_name', 'commodity', 'storage_num'])
+		sto_out = by(e['sto_p_out'], ['storage_name', 'commodity', 'storage_num'])
+		
+		#commodity energy balance
+		if 'co_e_consumed' in e:
+			consumed = self.demand.sum()
+			for co_sum in [by(pro_in, 'commodity'), by(sto_in, 'commodity'), 
+						   -by(sto_out, 'commodity')]:
+				consumed = consumed.add(co_sum, fill_value=0)
+			e['co_e_consumed'] = consumed.reindex(e['co_e_consumed'].index).fillna(0) * p2e
+			e['co_e_produced'] = by(pro_out, 'commodity').reindex(
+				e['co_e_produced'].index).fillna(0) * p2e
+		
+		#energy of process classes
+		for name, pro_co in [('proclass_e_in', pro_in), ('proclass_e_out', pro_out)]:
+			if e[name].empty:
+				continue
+			if pro_co.empty:
+				e[name] = e[name] * 0
+				continue
+			pro_class = process['class'].reindex(pro_co.index.droplevel(2)).values
+			energy = pro_co.groupby([pro_class, pro_co.index.get_level_values(2)]).sum() * p2e
+			e[name] = energy.reindex(e[name].index).fillna(0)
+		
+		#time dependent costs
+		costs = e['costs'].copy()
+		var_costs = 0
+		if not e['pro_p_flow'].empty:
+			flow = e['pro_p_flow']
+			flow = by(flow[flow.index.get_level_values('t0') >= start], ['pro_name', 'pro_num'])
+			var_costs += (flow * process['cost-var'].reindex(flow.index).values).sum() * p2e
+		if not sto_in.empty:
+			var_costs += ((sto_in + sto_out) * storage['cost-var'].reindex(sto_in.index).values).sum() * p2e
+		costs['Var costs'] = var_costs / year_factor
+		
+		for cost_type, name, prices, sign in [('Import', 'ext_p_in', data['ext_import'], 1),
+											  ('Export', 'ext_p_out', data['ext_export'], -1)]:
+			if e[name].empty:
+				costs[cost_type] = 0
+			else:
+				power = e[name].unstack('commodity')
+				costs[cost_type] = sign * (power * prices.loc[start:end, power.columns].values
+										   ).sum().sum() * p2e / year_factor
+		
+		fees = data['process_class'].copy()
+		fees['energy'] = np.where(fees['Direction'] == 'In', 
+								  e['proclass_e_in'].reindex(fees.index).fillna(0).values,
+								  e['proclass_e_out'].reindex(fees.index).fillna(0).values)
+		fees = fees['energy'] * fees['fee'] / year_factor
+		costs['Process fee'] = fees[fees > 0].sum()
+		costs['Pro subsidy'] = fees[fees < 0].sum()
+		e['costs'] = costs
+
 ############################################################################################	
 #SAVE RESULTS
 ############################################################################################
@@ -1675,65 +4345,323 @@ def prepare_result_directory(result_folder,result_name):
 
 	return result_dir
 	
-def report(prob, dir):
+def report(prob, dir, format='xlsx'):
 	from datetime import datetime
 	"""Write result summary to a spreadsheet file in dir
 
 	Args:
 		prob: a picus model instance
 		dir: directory, where Report File will be saved
+		format: "xlsx" for an excel file or "h5" for a HDF5 file with one 
+			table per sheet (requires PyTables). HDF5 files are written much 
+			faster, are not limited to 1,048,576 rows per sheet and the plot 
+			functions read only the plotted timesteps from them
 	Returns:
 		resultfile: Path of Resultfile
 	"""
+	if format not in ('xlsx', 'h5'):
+		raise ValueError("Unknown report format '{}'".format(format))
 	print('Save Results to Reportfile...\n')
 	t0 = time.time()
 	
 	# Create Name of Resultfile
 	inputfilename = os.path.splitext(os.path.split(prob.inputfile)[1])[0]
 	now = datetime.now().strftime('%Y%m%dT%H%M')
-	resultfile = os.path.join(dir, 'result-{}-{}.xlsx'.format(inputfilename, now))
-	writer = pd.ExcelWriter(resultfile)
+	resultfile = os.path.join(dir, 'result-{}-{}.{}'.format(inputfilename, now, format))
+
+	sheets = _result_sheets(prob, block_rows=REPORT_BLOCK_ROWS)
+	if format == 'h5':
+		_write_hdf_result(resultfile, sheets)
+	else:
+		_write_excel_result(resultfile, sheets)
+
+	print('Results Saved. time: '+"{:.1f}".format(time.time()-t0)+' s\n')
+	
+	return resultfile
 
+# rows of the blocks of timeseries sheets written by report
+REPORT_BLOCK_ROWS = 100000
+
+def _result_sheets(prob, block_rows=None):
+# Sheets (sheet name, DataFrame) of the result file of prob (see report).
+# Generator, which reads the timeseries of one sheet after another. With 
+# block_rows, timeseries sheets are given as iterators of DataFrames of 
+# blocks of timesteps (see _timeseries_blocks) instead of one DataFrame.
 
 	#Create Information sheet
 	info = pd.DataFrame(index = ['Date', 'Input File Name','timebase' ], columns = ['Data'])
 	info.loc['Date']['Data'] = time.asctime()
 	info.loc['Input File Name']['Data'] = prob.inputfile
 	info.loc['timebase']['Data'] = prob.tb
+	yield 'Info', info
 
 	# get the data
 	costs, cpro, csto = get_constants(prob)
-	demand, ext, pro, sto = get_timeseries(prob)
-
-	# write to excel
-	info.to_excel(writer, 'Info', merge_cells = False)
-	costs.to_frame().to_excel(writer, 'Costs', merge_cells = False)
-	cpro.to_excel(writer, 'Process caps', merge_cells = False)
-	csto.to_excel(writer, 'Storage caps', merge_cells = False)
-	ext.to_excel(writer, 'External timeseries', merge_cells = False)
-	pro.to_excel(writer, 'Process timeseries', merge_cells = False)
-	sto.to_excel(writer, 'Storage timeseries', merge_cells = False)
-	demand.to_excel(writer, 'Demand timeseries', merge_cells = False)
-		
-	writer.save() #save
-
-	print('Results Saved. time: '+"{:.1f}".format(time.time()-t0)+' s\n')
+	yield 'Costs', costs.to_frame()
+	yield 'Process caps', cpro
+	yield 'Storage caps', csto
 	
-	return resultfile
+	# timeseries (see get_timeseries)
+	for sheet, names in [('External timeseries', ['ext_p_in','ext_p_out']),
+						 ('Process timeseries', ['pro_p_in', 'pro_p_out']),
+						 ('Storage timeseries', ['sto_e_cont','sto_p_in', 'sto_p_out'])]:
+		if block_rows is not None:
+			yield sheet, _timeseries_blocks(prob, names, block_rows)
+			continue
+		df = get_entities(prob, names)
+		if prob.timestep_map is not None:
+			# aggregated timeseries: map results back to original timesteps
+			df = expand_timeseries(df, prob.timestep_map)
+		yield sheet, df
+	yield 'Demand timeseries', _get_demand(prob, get_timesteps(prob))
+	
+	if getattr(prob, 'build_profile', None) is not None:
+		# model created with profile=True (see create_model)
+		yield 'Build profile', prob.build_profile
+
+def _timeseries_blocks(prob, names, block_rows):
+# DataFrames of timeseries entities names (like get_entities) for blocks of
+# consecutive timesteps t0 of about block_rows rows, so a timeseries sheet is
+# written without creating it in full. The common index of the entities is
+# created once, the values are read for one block after another. Timeseries
+# of aggregated models are mapped to the original timesteps (like 
+# expand_timeseries). Yields at least one (empty) DataFrame.
+	readers = []
+	for name in names:
+		index, read = _get_entity_reader(prob, name)
+		if len(index):
+			readers.append((name, index, read))
+	if not readers:
+		yield pd.DataFrame(columns=names)
+		return
+	index, positions = _get_common_index(prob, names, [r[1] for r in readers])
+	
+	# position of the element of every entity in every row (-1: no element)
+	elements = []
+	for (name, entity_index, read), position in zip(readers, positions):
+		element = np.full(len(index), -1, dtype=np.int64)
+		element[position] = np.arange(len(entity_index))
+		elements.append(element)
+	
+	# rows of every modelled timestep
+	t_level = index.names.index('t0')
+	t = np.asarray(index.get_level_values(t_level))
+	order = np.argsort(t, kind='mergesort')
+	modelled, starts = np.unique(t[order], return_index=True)
+	rows = dict(zip(modelled, np.split(order, starts[1:])))
+	no_rows = np.array([], dtype=order.dtype)
+	
+	# modelled timestep of every written timestep
+	if prob.timestep_map is None:
+		t_map = pd.Series(modelled, index=modelled)
+	else:
+		# timestep before first timestep (storage content) maps to 0
+		t_map = prob.timestep_map.copy()
+		t_map.loc[t_map.index[0] - 1] = 0
+		t_map = t_map.sort_index()
+	
+	steps = max(1, int(block_rows * len(modelled) // len(index)))
+	for start in range(0, max(len(t_map), 1), steps):
+		block_t = t_map.iloc[start:start + steps]
+		block_rows_t = [rows.get(m, no_rows) for m in block_t.values]
+		block = np.concatenate(block_rows_t) if block_rows_t else no_rows
+		arrays = [index.get_level_values(k)[block] for k in range(index.nlevels)]
+		arrays[t_level] = np.repeat(block_t.index.values, [len(r) for r in block_rows_t])
+		values = np.full((len(block), len(readers)), np.nan)
+		for k, ((name, entity_index, read), element) in enumerate(zip(readers, elements)):
+			element = element[block]
+			found = element >= 0
+			values[found, k] = read(element[found])
+		df = pd.DataFrame(values, columns=[r[0] for r in readers],
+						  index=pd.MultiIndex.from_arrays(arrays, names=index.names))
+		yield df.sort_index().reindex(columns=names)
+
+# maximum number of rows of an excel sheet
+EXCEL_MAX_ROWS = 1048576
+
+def _write_excel_result(resultfile, sheets, chunksize=10000):
+# Write sheets [(sheet name, DataFrame or iterator of DataFrames of blocks of
+# rows)] of a report to an excel file, in the layout of DataFrame.to_excel 
+# (merge_cells=False). The rows are converted to lists in chunks of chunksize 
+# rows and streamed to a write-only workbook, so only the current block, not
+# the cells of the workbook, is kept in memory. Sheets with more rows than 
+# excel allows are continued in sheets "name (2)", "name (3)" ...
+	import openpyxl
+	
+	wb = openpyxl.Workbook(write_only=True)
+	for sheet, blocks in sheets:
+		if isinstance(blocks, pd.DataFrame):
+			blocks = [blocks]
+		ws = None
+		for df in blocks:
+			if ws is None:
+				header = list(df.index.names) + list(df.columns)
+				ws = wb.create_sheet(sheet)
+				ws.append(header)
+				rows, part = 1, 1
+			for start in range(0, len(df), chunksize):
+				chunk = df.iloc[start:start + chunksize].reset_index().astype(object)
+				for row in chunk.where(chunk.notnull(), None).values.tolist():
+					if rows == EXCEL_MAX_ROWS:
+						part += 1
+						ws = wb.create_sheet('{} ({})'.format(sheet, part))
+						ws.append(header)
+						rows = 1
+					ws.append(row)
+					rows += 1
+	wb.save(resultfile)
+
+def _write_hdf_result(resultfile, sheets):
+# Write sheets [(sheet name, DataFrame or iterator of DataFrames of blocks of
+# rows)] of a report to a HDF5 file, the key of a table is the sheet name with
+# "_" instead of " " (e.g. "Process_caps"). Timeseries are stored in table 
+# format, so rows can be selected by index (e.g. "t0", "commodity") while 
+# reading; tables without rows are skipped. Blocks are appended to the table,
+# the width of string columns is set by the first block (the blocks of 
+# _timeseries_blocks contain all names, as every entity is defined for every
+# timestep).
+	import warnings
+	
+	with pd.HDFStore(resultfile, mode='w', complevel=5, complib='blosc') as store, \
+			warnings.catch_warnings():
+		# mixed values in "Info" are pickled by PyTables
+		warnings.simplefilter('ignore', pd.io.pytables.PerformanceWarning)
+		for sheet, blocks in sheets:
+			if isinstance(blocks, pd.DataFrame):
+				blocks = [blocks]
+			for df in blocks:
+				if df.empty:
+					continue
+				if sheet.endswith('timeseries'):
+					store.append(sheet.replace(' ', '_'), df, format='table')
+				else:
+					store.put(sheet.replace(' ', '_'), df)
+
+def _select_hdf_result(store, sheet, where=None):
+# Read sheet of a HDF5 resultfile (see report), only rows matching where 
+# (e.g. "t0 >= 1 & t0 <= 96", timeseries only).
+# Returns an empty DataFrame for tables without rows (not stored).
+	key = sheet.replace(' ', '_')
+	if key not in store:
+		return pd.DataFrame()
+	if where is None:
+		return store[key]
+	return store.select(key, where=where)
+
+def _is_hdf_file(path):
+# True, if path is a HDF5 file (by extension)
+	return os.path.splitext(path)[1].lower() in ('.h5', '.hdf5')
+
+# number of index columns of the sheets of a result file (see report)
+RESULT_INDEX = {
+	'Info': 1,
+	'Costs': 1,
+	'Process caps': 2,
+	'Storage caps': 3,
+	'External timeseries': 2,
+	'Process timeseries': 4,
+	'Storage timeseries': 4,
+	'Demand timeseries': 1,
+	'Build profile': 1}
+
+class ResultFile(object):
+	"""Reader of a result file (excel or HDF5, see report)
+	
+	Every sheet is read at most once, when it is first needed, and kept in 
+	memory. Can be given as resultfile to get_plot_data, the plot functions,
+	result_figures and set_initial_values instead of the path, so that all 
+	of them share the read sheets.
+	
+	Args:
+		path: path of the result file
+		sheets: optional list of (sheet name, DataFrame) of results not saved
+			to a file (e.g. of a model instance, see report)
+	"""
+	def __init__(self, path=None, sheets=None):
+		self.path = path
+		self.hdf = path is not None and _is_hdf_file(path)
+		self._xls = None
+		self._sheets = dict(sheets or [])
+	
+	def __getstate__(self):
+		# the open excel file can't be pickled (e.g. for the processes of 
+		# result_figures), it is opened again when needed
+		state = self.__dict__.copy()
+		state['_xls'] = None
+		return state
+	
+	def sheet(self, name):
+		"""DataFrame of sheet name (e.g. 'Process timeseries')"""
+		if name not in self._sheets:
+			if self.path is None:
+				# sheet not in results
+				self._sheets[name] = pd.DataFrame()
+			elif self.hdf:
+				with pd.HDFStore(self.path, mode='r') as store:
+					self._sheets[name] = _select_hdf_result(store, name)
+			else:
+				if self._xls is None:
+					self._xls = pd.ExcelFile(self.path)
+				# sheets with more rows than excel allows are continued in 
+				# sheets "name (2)", "name (3)" ... (see report)
+				parts = [name]
+				while '{} ({})'.format(name, len(parts) + 1) in self._xls.sheet_names:
+					parts.append('{} ({})'.format(name, len(parts) + 1))
+				index_col = list(range(RESULT_INDEX.get(name, 1)))
+				try:
+					df = pd.concat([self._xls.parse(part, index_col=index_col) 
+									for part in parts])
+				except (ValueError, IndexError):
+					# sheet without rows
+					df = self._xls.parse(name)
+				self._sheets[name] = df
+		return self._sheets[name]
+	
+	def timeseries(self, name, timesteps):
+		"""Rows of timeseries sheet name for timesteps (all commodities)
+		
+		Reads only the needed rows from a HDF5 file, if the sheet is not 
+		already in memory.
+		"""
+		if self.hdf and name not in self._sheets:
+			where = 't0 >= {} & t0 <= {}'.format(int(min(timesteps)), int(max(timesteps)))
+			with pd.HDFStore(self.path, mode='r') as store:
+				df = _select_hdf_result(store, name, where)
+			return _select_timesteps(df, timesteps)
+		df = self.sheet(name)
+		if df.empty:
+			return df
+		return _select_timesteps(df, timesteps)
+
+def _result_reader(resultfile):
+# ResultFile for resultfile (path or ResultFile)
+	if isinstance(resultfile, ResultFile):
+		return resultfile
+	return ResultFile(resultfile)
 	
-def result_figures(dir, prob = None, resultfile = None, timesteps = None, fontsize=16, show=False):
+def result_figures(dir, prob = None, resultfile = None, timesteps = None, fontsize=16, show=False,
+				   max_points=1000, processes=1, format='png'):
 	"""Create all plots for given instance/resultfile and save to dir
 
+	With processes > 1 (and show=False), the figures are rendered in parallel 
+	processes with the non-interactive matplotlib backend Agg, which needs no
+	display. The results of prob are sent to the processes as ResultFile. On 
+	Windows, the calling script must be protected by if __name__ == '__main__':
+
 	Args:
 		dir: directory, where the plots are saved
 		prob: a ficus model instance
 		resultfile: a stored ficus resultfile
 		fontsize: fontsize for labels/legend in figure
+		max_points: maximum number of plotted values per timeseries (see 
+			plot_timeseries), None to plot every timestep
+		processes: number of parallel processes rendering the figures
+		format: file format of the figures, e.g. 'png', 'pdf' or 'svg'
 		
+	Returns:
+		paths of the saved figures
 	"""
-	import matplotlib.pyplot as plt
-	import matplotlib as mpl	
-	plt.ion()
+	import multiprocessing
 	
 	#Get demand commodities from instance or resultfile
 	if prob:
@@ -1742,41 +4670,76 @@ def result_figures(dir, prob = None, resultfile = None, timesteps = None, fontsi
 		else:
 			commodities = prob.demand.columns
 	elif resultfile:
-		commodities = pd.ExcelFile(resultfile).parse('Demand timeseries',index_col=[0]).columns
+		# read every sheet only once for all plots
+		resultfile = _result_reader(resultfile)
+		commodities = resultfile.sheet('Demand timeseries').columns
 	else:
 		raise NotImplementedError('please specify either "prob" or "resultfile"!')
+	
+	parallel = processes > 1 and not show
+	if parallel and prob:
+		# results of prob in memory, which can be sent to the processes
+		resultfile = ResultFile(sheets=_result_sheets(prob))
+		prob = None
+	options = {'prob': prob, 'resultfile': resultfile, 'timesteps': timesteps, 
+			   'fontsize': fontsize, 'show': show, 'max_points': max_points}
+	
+	#timeseries and energy balance for every commodity in demand, 
+	#installed and new capacities of processes and storages and costs
+	figures = [(plot, co) for co in commodities for plot in ['timeseries', 'energy']]
+	figures += [('capacities', None), ('costs', None)]
+	
+	if parallel:
+		if len(commodities):
+			# prepare plot data of all commodities once for all processes
+			get_plot_data(commodities[0], None, resultfile, timesteps)
+		pool = multiprocessing.Pool(processes, initializer=_init_figure_worker, 
+									initargs=(dir, format, options))
+		try:
+			paths = pool.map(_save_worker_figure, figures, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		paths = [_save_figure(plot, co, dir, format, options) for plot, co in figures]
+	return paths
 
+def _save_figure(plot, co, dir, format, options):
+	# create figure plot ('timeseries', 'energy', 'capacities' or 'costs') of
+	# commodity co and save it to dir with the plot options of result_figures
+	# returns path of the figure
+	import matplotlib.pyplot as plt
 	
-	for co in commodities:
-		#plot and save timeseries for every commodity in demand
-		fig = plot_timeseries(	co,\
-								prob = prob, resultfile = resultfile,\
-								timesteps=timesteps,fontsize=fontsize,show=show)
-		fig.savefig(dir + '\\'+co+'-timeseries.png')
-		if not show:
-			plt.close(fig)
-		
-		#plot and save energy balance for every commodity in demand
-		fig = plot_energy(	co,\
-								prob = prob, resultfile = resultfile,\
-								timesteps=timesteps,fontsize=fontsize,show=show)
-		fig.savefig(dir + '\\'+co+'-energy.png')
-		if not show:
-			plt.close(fig)
-	
-	#plot and save installed and new capacities of processes and storages
-	fig = plot_cap(prob = prob, resultfile = resultfile, fontsize=fontsize,show=show)
-	fig.savefig(dir + '\\capacities.png')
-	if not show:
-		plt.close(fig)
+	kwds = dict((key, options[key]) for key in ['prob', 'resultfile', 'fontsize', 'show'])
+	if plot == 'timeseries':
+		fig = plot_timeseries(co, timesteps=options['timesteps'], 
+							  max_points=options['max_points'], **kwds)
+	elif plot == 'energy':
+		fig = plot_energy(co, timesteps=options['timesteps'], **kwds)
+	elif plot == 'capacities':
+		fig = plot_cap(**kwds)
+	else:
+		fig = plot_costs(**kwds)
 	
-	#plot and save costs
-	fig = plot_costs(prob = prob, resultfile = resultfile, fontsize=fontsize,show=show)
-	fig.savefig(dir + '\\costs.png')
-	if not show:
+	name = plot if co is None else '{}-{}'.format(co, plot)
+	path = os.path.join(dir, '{}.{}'.format(name, format))
+	fig.savefig(path)
+	if not options['show']:
 		plt.close(fig)
-	
-	return 
+	return path
+
+def _init_figure_worker(dir, format, options):
+	# render figures without display and keep plot options in worker process
+	global _figure_worker_args
+	import matplotlib.pyplot as plt
+	plt.switch_backend('Agg')
+	_figure_worker_args = (dir, format, options)
+
+def _save_worker_figure(figure):
+	# create and save figure (plot, commodity) in worker process
+	plot, co = figure
+	dir, format, options = _figure_worker_args
+	return _save_figure(plot, co, dir, format, options)
 
 ############################################################################################	
 #PLOT	
@@ -1802,7 +4765,11 @@ COLOURS = {
 def get_plot_data(co, prob, resultfile, timesteps):
 	"""Get Result Data for plotting
 
-	Reads data either from given instance or given resultfile and prepares data for plotting
+	Reads data either from given instance or given resultfile and prepares data for plotting.
+	The data of all commodities is prepared at once and cached in the instance or 
+	resultfile (if a ResultFile is given), so following calls for other commodities 
+	only select the columns of co. The cache of an instance is cleared, when 
+	resolve or solve_async load a new solution or update_model changes it.
 
 	Args:
 		co: commodity to plot
@@ -1828,57 +4795,78 @@ def get_plot_data(co, prob, resultfile, timesteps):
 	elif (prob is not None) and (resultfile is not None):
 		#either prob or resultfile must be given
 		raise NotImplementedError('please specify EITHER "prob" or "resultfile"!')	
-	elif resultfile is None:
+	
+	# plot data of the last timesteps, cached in the instance or resultfile
+	if resultfile is None:
+		owner = prob
+	else:
+		owner = resultfile = _result_reader(resultfile)
+	key = _timesteps_key(timesteps)
+	cache = getattr(owner, '_plot_data_cache', None)
+	if cache is None or cache[0] != key:
+		cache = (key, _prepare_plot_data(prob, resultfile, timesteps))
+		owner._plot_data_cache = cache
+	data = cache[1]
+	
+	if co not in data['commodities']:
+		data['commodities'][co] = _commodity_plot_data(co, data)
+	demand, created, consumed, storage = data['commodities'][co]
+	
+	# copies, as the plot functions change them
+	return demand.copy(), data['ext'].copy(), data['pro'].copy(), data['sto'].copy(), data['timesteps'], \
+		data['tb'], created.copy(), consumed.copy(), storage.copy(), dict(data['colours'])
+
+def _timesteps_key(timesteps):
+# hashable key of timesteps for the plot data cache
+	if timesteps is None:
+		return None
+	return tuple(np.asarray(timesteps).tolist())
+
+def _prepare_plot_data(prob, resultfile, timesteps):
+# Results of all commodities for get_plot_data: timeseries reduced to timesteps,
+# identical processes/storages summed and colours of all processes/storages. 
+# Timeseries of processes, storages and external are also given with one row per 
+# commodity (and name) and one column per timestep in "wide", from which the
+# columns of a commodity are selected (see _commodity_plot_data).
+	names = None # names of processes and storages, if not given by pro and sto
+	if resultfile is None:
 		# prob is given, get timeseries from prob
 		if timesteps is None:
 		# default to all simulated timesteps
-			timesteps = sorted(get_entity(prob, 't').index)
+			timesteps = get_timesteps(prob)
 		demand, ext, pro, sto = get_timeseries(prob,timesteps)
+		ext = _select_timesteps(ext, timesteps)
+		pro = _select_timesteps(pro, timesteps)
+		sto = _select_timesteps(sto, timesteps)
 		tb = prob.tb		
 	else:
 		# resultfile is given, get timeseries from resultfile
-		xls = pd.ExcelFile(resultfile) # read resultfile
 		if timesteps is None:
 		# default to all simulated timesteps
-			timesteps = sorted( xls.parse('Demand timeseries', index_col = [0]).index)
+			timesteps = sorted(resultfile.sheet('Demand timeseries').index)
 		
 		#read demand sheet and reduce to timesteps
-		demand = xls.parse('Demand timeseries', index_col = [0]).loc[timesteps]
-		
-		#read External timeseries sheet and reduce to timesteps
-		ext = xls.parse('External timeseries', index_col = [0,1])
-		indexer = [ slice(None) ] * len(ext.index.levels)
-		indexer[ext.index.names.index('t0')] = timesteps
-		ext = ext.loc[tuple(indexer),:]
-		
-		#read Process timeseries sheet and reduce to timesteps
-		try :
-			pro = xls.parse('Process timeseries', index_col = [0,1,2,3])
-		except ValueError:
-			pro = xls.parse('Process timeseries', index_col = [0])
-		indexer = [ slice(None) ] * len(pro.index.levels)
-		indexer[pro.index.names.index('t0')] = timesteps
-		pro = pro.loc[tuple(indexer),:]
-		
-		#read Storage timeseries sheet and reduce to timesteps
-		sto = xls.parse('Storage timeseries', index_col = [0,1,2,3])
-		indexer = [ slice(None) ] * len(sto.index.levels)
-		indexer[sto.index.names.index('t0')] = timesteps
-		sto = sto.loc[tuple(indexer),:]
+		demand = resultfile.sheet('Demand timeseries').loc[timesteps]
+		
+		#read timeseries sheets and reduce to timesteps
+		ext = resultfile.timeseries('External timeseries', timesteps)
+		pro = resultfile.timeseries('Process timeseries', timesteps)
+		sto = resultfile.timeseries('Storage timeseries', timesteps)
+		
+		# names of all processes and storages for colours
+		names = pd.Index([])
+		for sheet in ['Process caps', 'Storage caps']:
+			index = resultfile.sheet(sheet).index
+			if len(index):
+				names = names | pd.Index(index.get_level_values(0).unique())
 		
 		#read timebase
-		tb = xls.parse('Info', index_col = [0]).loc['timebase'].values[0]
+		tb = resultfile.sheet('Info').loc['timebase'].values[0]
 	
 	##Prepare Data##
 	##############		
 	
 	timesteps = np.array(timesteps) # make array for xticks
-		
-	#Demand Timeseries for co
-	try:
-		demand = demand[co]
-	except KeyError:
-		demand = pd.Series(0,index=timesteps)
 	
 	#sum identical processes/ 
 	try:
@@ -1892,60 +4880,16 @@ def get_plot_data(co, prob, resultfile, timesteps):
 	except ValueError:
 		pro_names = pd.Index([''])
 	prosto_names = pro_names|sto_names
-
-	
-	#Timeseries of all created/consumed/storage
-	try:		
-		created = pd.DataFrame(ext.xs(co, level='commodity')['ext_p_in'])
-		created.rename(columns={'ext_p_in':'Import'}, inplace=True)
-	except (KeyError, AttributeError):
-		created = pd.DataFrame(index=timesteps)
-	try:
-		created = created.join(pro.xs(co, level='commodity')['pro_p_out'].unstack(['pro_name']))
-	except (KeyError, AttributeError):
-		created = created
-	try:
-		created = created.join(sto.xs(co, level='commodity')['sto_p_out'].unstack(['storage_name']))
-	except (KeyError, AttributeError):
-		created = created
-
-	#Timeseries of all consumed/exported/stored 
-	try:		
-		consumed = pd.DataFrame(ext.xs(co, level='commodity')['ext_p_out'])
-		consumed.rename(columns={'ext_p_out':'Export'}, inplace=True)
-	except (KeyError, AttributeError):
-		consumed = pd.DataFrame(index=timesteps)
-	try:
-		consumed = consumed.join(pro.xs(co, level='commodity')['pro_p_in'].unstack(['pro_name']))
-	except (KeyError, AttributeError):
-		consumed = consumed
-	try:
-		consumed = consumed.join(sto.xs(co, level='commodity')['sto_p_in'].unstack(['storage_name']))
-	except (KeyError, AttributeError):
-		consumed = consumed
+	if names is not None:
+		prosto_names = names
 	
-	#Storage Energy Content
-	try:
-		storage = pd.DataFrame(index=timesteps)
-		storage = storage.join(sto.xs(co, level='commodity')['sto_e_cont'].unstack(['storage_name']))
-	except (KeyError, AttributeError):
-		storage = pd.DataFrame(index=timesteps)
-	
-	# remove all columns from created which are all-zeros in both created and 
-	# consumed (except the last one, to prevent a completely empty frame)
-	for col in created.columns:
-		if ((not created[col].any()) or (created[col].isnull().sum() == created[col].size) \
-		or (created[col].max()<1e-1)):# and len(created.columns) > 1:
-			created.pop(col)
-			try:
-				storage.pop(col)
-			except KeyError:
-				storage = storage
-	# set all columns fron consumed to zero, which are nan
-	for col in consumed.columns:
-		if ((not consumed[col].any()) or (consumed[col].isnull().sum() == consumed[col].size) \
-		or (consumed[col].max()<1e-1)):#and len(consumed.columns) > 1:
-			consumed.pop(col)
+	# one column per timestep for all commodities at once
+	wide = {}
+	for name, df in [('ext', ext), ('pro', pro), ('sto', sto)]:
+		try:
+			wide[name] = df.unstack('t0')
+		except (KeyError, ValueError, AttributeError):
+			wide[name] = None # no timeseries
 	
 	##ASSIGN COLOR##
 	##############
@@ -1957,17 +4901,80 @@ def get_plot_data(co, prob, resultfile, timesteps):
 	
 	for i,name in enumerate(prosto_names):
 		colours.update({name : to_color(i+3,COLOURS)})
-		
-		
-	return demand, ext, pro, sto, timesteps, tb, created, consumed, storage, colours
+	
+	return {'demand': demand, 'ext': ext, 'pro': pro, 'sto': sto, 'wide': wide,
+			'timesteps': timesteps, 'tb': tb, 'colours': colours, 'commodities': {}}
+
+def _commodity_plot_data(co, data):
+# demand, created, consumed and storage timeseries of commodity co from the 
+# results of all commodities data (see _prepare_plot_data)
+	timesteps = data['timesteps']
+	wide = data['wide']
+	
+	def select(name, column):
+		# timeseries of column for co, one column per process/storage
+		# (None, if co has no process/storage)
+		try:
+			return wide[name][column].xs(co, level='commodity').T
+		except (KeyError, TypeError, AttributeError):
+			return None
+	
+	#Demand Timeseries for co
+	try:
+		demand = data['demand'][co]
+	except KeyError:
+		demand = pd.Series(0,index=timesteps)
+	
+	#Timeseries of all created/consumed
+	frames = []
+	for ext_column, label, pro_column, sto_column in [
+			('ext_p_in', 'Import', 'pro_p_out', 'sto_p_out'),
+			('ext_p_out', 'Export', 'pro_p_in', 'sto_p_in')]:
+		try:
+			frame = pd.DataFrame(wide['ext'][ext_column].loc[co].rename(label))
+		except (KeyError, TypeError):
+			frame = pd.DataFrame(index=timesteps)
+		for df in [select('pro', pro_column), select('sto', sto_column)]:
+			if df is not None:
+				frame = frame.join(df)
+		frames.append(frame)
+	created, consumed = frames
+	
+	#Storage Energy Content
+	storage = pd.DataFrame(index=timesteps)
+	sto_e_cont = select('sto', 'sto_e_cont')
+	if sto_e_cont is not None:
+		storage = storage.join(sto_e_cont)
+	
+	# remove all columns from created and consumed without values above 0.1 
+	# and the energy content of removed storages
+	removed = created.columns[~(created.max() >= 1e-1).values]
+	created = created.drop(removed, axis=1)
+	storage = storage.drop([col for col in removed if col in storage.columns], axis=1)
+	consumed = consumed.loc[:, (consumed.max() >= 1e-1).values]
+	
+	return demand, created, consumed, storage
+
+def _select_timesteps(df, timesteps):
+# Reduce DataFrame with index level "t0" to rows of given timesteps
+	if df.empty:
+		return df
+	return df[df.index.get_level_values('t0').isin(timesteps)]
 	
 	
 	
-def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=16,show=True):
+def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=16,show=True,
+					max_points=1000):
 	"""Stacked timeseries of commodity balance 
 
 	Creates a stackplot of the power balance of a given commodity, together
 	with stored energy in a second subplot. 
+	
+	If more than max_points timesteps are plotted, the timesteps are grouped
+	to at most max_points buckets of consecutive timesteps, which show the 
+	mean power of every bucket. The minimum and maximum demand and the peaks 
+	of the total created and consumed power within the buckets are shown as 
+	envelopes.
 
 	Args:
 		co: commodity to plot
@@ -1975,13 +4982,15 @@ def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=
 		resultfile: a stored ficus resultfile
 		timesteps: optional list of modelled timesteps to plot
 		fontsize: fontsize for labels/legend in figure
+		max_points: maximum number of plotted values per timeseries, 
+			None to plot every timestep
 		
 	Returns:
 		fig: figure handle
 	"""
 	import matplotlib.pyplot as plt
 	import matplotlib as mpl
-	plt.ion()
+	plt.ioff() # draw figure only once when shown, not after every change
 	
 	##Get Data and Prepare Data##
 	##############
@@ -2019,15 +5028,24 @@ def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=
 	# http://stackoverflow.com/a/22984060/2375855
 	proxy_artists = []
 	
+	# plot buckets of timesteps instead of every timestep
+	reduced = _plot_buckets(len(demand), max_points) is not None
+	
 	# PLOT DEMAND
-	dp = ax0.plot(step_edit_x(demand.index), step_edit_y(demand.values), linewidth=1.6, color='k')
+	x, y = _step_data(demand, max_points)
+	dp = ax0.plot(x, y, linewidth=1.6, color='k')
+	if reduced:
+		# envelope of demand within buckets
+		ax0.fill_between(x, _step_data(demand, max_points, 'min')[1], 
+						 _step_data(demand, max_points, 'max')[1], 
+						 color='k', alpha=0.25, linewidth=0)
 	# Demand in Legend
 	proxy_artists.append(mpl.lines.Line2D([0,0], [0,0], linewidth=2, color='k')) 
 	legend_entries = ['Demand']
 	
 	# PLOT CREATED
 	if not created.empty:
-		sp_crtd = ax0.stackplot(step_edit_x(created.index), step_edit_y(created.as_matrix().T), linewidth=0.15)		
+		sp_crtd = ax0.stackplot(*_step_data(created, max_points), linewidth=0.15)		
 		for k, pro_sto in enumerate(created.columns):
 			this_color = to_color(pro_sto,colours) #get color for pro or sto 			
 			sp_crtd[k].set_facecolor(this_color) #set color of stackplot
@@ -2037,7 +5055,7 @@ def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=
 
 	# PLOT CONSUMED
 	if not consumed.empty:
-		sp_csmd = ax0.stackplot(step_edit_x(consumed.index), step_edit_y(-consumed.as_matrix().T), linewidth=0.15)
+		sp_csmd = ax0.stackplot(*_step_data(-consumed, max_points), linewidth=0.15)
 		for k, pro_sto in enumerate(consumed.columns):
 			this_color = to_color(pro_sto,colours) #get color for pro or sto 			
 			sp_csmd[k].set_facecolor(this_color) #set color of stackplot
@@ -2046,11 +5064,17 @@ def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=
 				legend_entries.append(pro_sto)
 				proxy_artists.append(mpl.patches.Rectangle((0,0), 0,0, facecolor=this_color)) #add proxy artist for legend
 
+	# PLOT PEAKS of total created/consumed power within buckets
+	if reduced:
+		for df, sign, how in [(created, 1, 'max'), (consumed, -1, 'min')]:
+			if not df.empty:
+				ax0.plot(*_step_data(sign * df.sum(axis=1), max_points, how), 
+						 linewidth=0.6, color=colours['edgecolor'])
 
 	# PLOT STORAGE
 	if not storage.empty:
 		ax1 = plt.subplot(gs[2], sharex=ax0)
-		sp_sto = ax1.stackplot(step_edit_x(storage.index), step_edit_y(storage.as_matrix().T), linewidth=0.15)
+		sp_sto = ax1.stackplot(*_step_data(storage, max_points), linewidth=0.15)
 		#color
 		for k, sto in enumerate(storage.columns):
 			this_color = to_color(sto,colours) #get color for sto 			
@@ -2101,6 +5125,7 @@ def plot_timeseries(co, prob = None, resultfile = None, timesteps=None,fontsize=
 	
 	fig.tight_layout()
 	if show:
+		plt.ion()
 		try:
 			plt.show(block=False)
 		except TypeError:
@@ -2126,7 +5151,7 @@ def plot_energy(co, prob = None, resultfile = None, timesteps=None,fontsize=16,s
 
 	import matplotlib.pyplot as plt
 	import matplotlib as mpl
-	plt.ion()
+	plt.ioff() # draw figure only once when shown, not after every change
 	
 	##Get Data and Prepare Data##
 	##############
@@ -2209,6 +5234,7 @@ def plot_energy(co, prob = None, resultfile = None, timesteps=None,fontsize=16,s
 		
 	fig.tight_layout()
 	if show:
+		plt.ion()
 		try:
 			plt.show(block=False)
 		except TypeError:
@@ -2230,7 +5256,7 @@ def plot_cap(prob = None, resultfile = None,fontsize=16,show=True):
 	"""
 	import matplotlib.pyplot as plt
 	import matplotlib as mpl
-	plt.ion()
+	plt.ioff() # draw figure only once when shown, not after every change
 	
 
 	##Get Data and Prepare Data##
@@ -2247,10 +5273,10 @@ def plot_cap(prob = None, resultfile = None,fontsize=16,show=True):
 		# prob is given, get timeseries from prob
 		costs, cpro, csto = get_constants(prob)
 	else:
-		# resultfile is given, get timeseries from resultfile
-		xls = pd.ExcelFile(resultfile) # read resultfile
-		cpro = xls.parse('Process caps', index_col=[0,1])
-		csto = xls.parse('Storage caps', index_col=[0,1,2])
+		# resultfile is given, get capacities from resultfile
+		resultfile = _result_reader(resultfile)
+		cpro = resultfile.sheet('Process caps')
+		csto = resultfile.sheet('Storage caps')
 
 	
 	#delete index with zero capacity	
@@ -2371,6 +5397,7 @@ def plot_cap(prob = None, resultfile = None,fontsize=16,show=True):
 
 	fig.tight_layout()
 	if show:
+		plt.ion()
 		try:
 			plt.show(block=False)
 		except TypeError:
@@ -2394,7 +5421,7 @@ def plot_costs(prob = None, resultfile = None, fontsize=16,show=True):
 	"""
 	import matplotlib.pyplot as plt
 	import matplotlib as mpl
-	plt.ion()
+	plt.ioff() # draw figure only once when shown, not after every change
 	
 	colours = {
     'Import' : COLOURS[1],
@@ -2420,9 +5447,8 @@ def plot_costs(prob = None, resultfile = None, fontsize=16,show=True):
 		# prob is given, get timeseries from prob
 		costs, cpro, csto = get_constants(prob)
 	else:
-		# resultfile is given, get timeseries from resultfile
-		xls = pd.ExcelFile(resultfile) # read resultfile
-		costs = xls.parse('Costs', index_col=[0])
+		# resultfile is given, get costs from resultfile
+		costs = _result_reader(resultfile).sheet('Costs')['costs']
 	
 	#delete index with zero capacity	
 	costs = costs[costs!=0]
@@ -2498,6 +5524,7 @@ def plot_costs(prob = None, resultfile = None, fontsize=16,show=True):
 	
 	fig.tight_layout()
 	if show:
+		plt.ion()
 		try:
 			plt.show(block=False)
 		except TypeError:
@@ -2524,10 +5551,10 @@ def to_color(obj,colors):
 	try:
 		color = colors[obj]
 	except KeyError:
-		color=random.choice(mpl_colors.cnames.keys()) # random deterministic color
+		color=random.choice(sorted(mpl_colors.cnames.keys())) # random deterministic color
 	return color
 	
-def step_edit_x(x):
+def step_edit_x(x, end=None):
 	"""
 	Edit array to be used as x-values for stacked step plot.
 	1 2 3 4 5
@@ -2536,21 +5563,16 @@ def step_edit_x(x):
 
 	Args:
 		x: array like
+		end: optional end of the last step, defaults to last value + 1
 	Returns:
 		X: edited array
 	"""
-	X=[]
-	for i,ix in enumerate(x):
-		if i==0:
-			X.append(ix)
-		elif i==len(x)-1:
-			X.append(ix)
-			X.append(ix)
-			X.append(ix+1)
-		else:
-			X.append(ix)
-			X.append(ix)
-	return X
+	x = np.asarray(x)
+	if not len(x):
+		return x
+	if end is None:
+		end = x[-1] + 1
+	return np.append(np.repeat(x, 2)[1:], end)
 
 def step_edit_y(y):
 	"""
@@ -2566,19 +5588,36 @@ def step_edit_y(y):
 	Returns:
 		Y: edited numpy array
 	"""
-	for k,yk in enumerate(y):
-		Yk=[]
-		if y.ndim==1:
-			yk=y
-		for i,iy in enumerate(yk):
-			Yk.append(iy)
-			Yk.append(iy)
-		if k == 0:
-			Y = np.array(Yk)
+	return np.repeat(y, 2, axis=-1)
+
+def _plot_buckets(n, max_points):
+# Start positions of buckets of consecutive timesteps, so that n timesteps are 
+# plotted with at most max_points values (None: plot every timestep)
+	if max_points is None or n <= max_points:
+		return None
+	size = int(np.ceil(n / float(max_points)))
+	return np.arange(0, n, size)
+
+def _step_data(df, max_points, how='mean'):
+# x and y values of a step plot of df (Series or DataFrame, one row per timestep),
+# aggregated to buckets (see _plot_buckets) by how ('mean', 'min' or 'max').
+# NaN values are ignored, buckets of only NaN values stay NaN like unaggregated
+# timesteps.
+	x = np.asarray(df.index)
+	y = np.asarray(df, dtype=float)
+	starts = _plot_buckets(len(x), max_points)
+	if starts is not None and len(x):
+		end = x[-1] + 1
+		if how == 'mean':
+			valid = np.add.reduceat(~np.isnan(y), starts, axis=0)
+			with np.errstate(invalid='ignore', divide='ignore'):
+				y = np.add.reduceat(np.nan_to_num(y), starts, axis=0) / valid
 		else:
-			Y = np.vstack([Y,np.array(Yk)])
-		if y.ndim==1:
-			break
-	return Y
+			ufunc = {'min': np.fmin, 'max': np.fmax}[how]
+			y = ufunc.reduceat(y, starts, axis=0)
+		x = x[starts]
+	else:
+		end = None
+	return step_edit_x(x, end), step_edit_y(y.T)
 
 	
@@ -0,0 +1,102 @@
+"""Cross-check of the matrix model (create_matrix_model) against the Pyomo
+model (create_model), which remains the reference
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import copy
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+import pyomo.core as pyen
+from pyomo.opt import SolverFactory
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ficus
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example.xlsx')
+
+# entities with unique optimal values (the operation timeseries of LP
+# solutions may differ between equally optimal solutions)
+UNIQUE_ENTITIES = ['costs', 'pro_cap', 'pro_cap_new', 'sto_cap_e', 'sto_cap_e_new',
+				   'ext_demandrate_max', 'co_e_consumed', 'co_e_produced']
+
+def _available_solver():
+# first locally installed solver reading LP and MPS files
+	for opt in ['cbc', 'glpk']:
+		if SolverFactory(opt).available(exception_flag=False):
+			return opt
+	return None
+
+def _finite(bound):
+	return bound is not None and math.isfinite(pyen.value(bound))
+
+def _identify_variables(expr):
+	try:
+		from pyomo.core.expr.current import identify_variables
+	except ImportError:
+		from pyomo.core.base.expr import identify_variables
+	return identify_variables(expr, include_fixed=False)
+
+
+class MatrixModelTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		data = ficus.prepare_modeldata(ficus.read_inputdata(INPUT_FILE))
+		cls.prob = ficus.create_model(copy.deepcopy(data))
+		cls.matrix = ficus.create_matrix_model(copy.deepcopy(data))
+
+	def test_size(self):
+		# the matrix model drops constraints without limit and unused variables
+		rows = [c for c in self.prob.component_data_objects(pyen.Constraint, active=True)
+				if _finite(c.lower) or _finite(c.upper)]
+		variables = set()
+		for c in rows:
+			variables.update(id(v) for v in _identify_variables(c.body))
+		for objective in self.prob.component_data_objects(pyen.Objective, active=True):
+			variables.update(id(v) for v in _identify_variables(objective.expr))
+		self.assertEqual(len(rows), self.matrix.n_rows)
+		self.assertEqual(len(variables), self.matrix.n_cols)
+
+	def test_results(self):
+		opt = _available_solver()
+		if opt is None:
+			self.skipTest('no solver (cbc or glpk) installed')
+		prob = copy.deepcopy(self.prob)
+		matrix = copy.deepcopy(self.matrix)
+		optimizer = ficus.get_optimizer(opt)
+		prob.solutions.load_from(optimizer.solve(prob))
+		matrix.load_solution(ficus.solve_matrix_model(matrix, optimizer, tee=False))
+
+		objective = pyen.value(prob.obj)
+		self.assertAlmostEqual(matrix.objective_value / objective, 1, places=6)
+		for name in UNIQUE_ENTITIES:
+			expected = ficus.get_entity(prob, name)
+			actual = ficus.get_entity(matrix, name).reindex(expected.index)
+			np.testing.assert_allclose(actual.values, expected.values, rtol=1e-6,
+									   atol=1e-3, err_msg=name)
+
+		# the matrix solution is a feasible solution of the pyomo model (up to
+		# the precision of the solution values written by the solver)
+		for var in prob.component_data_objects(pyen.Var):
+			var.value = 0
+		for name in matrix.variables:
+			var = getattr(prob, name)
+			for index, value in ficus.get_entity(matrix, name).items():
+				var[index].value = value
+		for c in prob.component_data_objects(pyen.Constraint, active=True):
+			body = pyen.value(c.body)
+			scale = max([1] + [abs(v.value) for v in _identify_variables(c.body)])
+			tolerance = 1e-6 * scale
+			if _finite(c.lower):
+				self.assertGreaterEqual(body, pyen.value(c.lower) - tolerance, c.name)
+			if _finite(c.upper):
+				self.assertLessEqual(body, pyen.value(c.upper) + tolerance, c.name)
+		self.assertAlmostEqual(pyen.value(prob.obj) / objective, 1, places=6)
+
+
+if __name__ == '__main__':
+	unittest.main()